@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# Metapad benchmark suite (headless, PyQt6 / PyQt5)
+# GPL v2
+#
+# Times the editor hot paths on synthetic files under the offscreen Qt
+# platform and writes the results as JSON. Every (binding, file, case) runs
+# in a fresh process so peak RSS is per case and runs do not warm each
+# other's caches.
+#
+#   python3 benchmark.py --output results.json
+#   python3 benchmark.py --sizes 1,16,128,1024 --bindings 6 --output big.json
+#   python3 benchmark.py --compare before.json --output after.json
+
+import argparse, json, os, platform, random, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+KINDS = ('long-lines', 'short-lines', 'quoted-python')
+CASES = ('open', 'highlight', 'find_next', 'replace_all', 'scroll', 'save', 'save_start',
+         'print', 'viewer_open', 'viewer_find', 'viewer_scroll')
+VIEWER_CASES = ('viewer_open', 'viewer_find', 'viewer_scroll')
+NEEDLE = 'needle'  # planted in every file so Find/Replace have work to do
+CHUNK_TARGET = 1024 * 1024
+
+
+# ---- Synthetic files ----
+def _words(rng, n):
+    vocab = ('alpha', 'beta', 'gamma', 'delta', 'value', 'result', 'index', 'buffer',
+             'token', 'window', 'editor', 'line', 'text', 'count', NEEDLE)
+    return ' '.join(rng.choice(vocab) for _ in range(n))
+
+
+def _chunk(kind, rng):
+    """About 1 MB of text ending on a line break; files repeat it to size."""
+    lines, size = [], 0
+    i = 0
+    while size < CHUNK_TARGET:
+        if kind == 'long-lines':
+            line = _words(rng, 30000)                  # ~200 KB per line
+        elif kind == 'short-lines':
+            line = _words(rng, rng.randint(2, 6))
+        else:
+            i += 1
+            line = rng.choice((
+                f'x{i} = "string {i} with \'nested\' quotes"  # comment {_words(rng, 3)}',
+                f"msg = 'single {i}' + \"double {i}\" + '{_words(rng, 2)}'",
+                f'    # {_words(rng, 8)}',
+                f'def f{i}(a, b="{_words(rng, 2)}"):  # {NEEDLE}',
+                f'    return "{_words(rng, 4)}" % (\'#not a comment\', a)',
+            ))
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def generate(data_dir, kind, size_mb):
+    """Create (or reuse) a deterministic `kind` file of `size_mb` megabytes."""
+    ext = '.py' if kind == 'quoted-python' else '.txt'
+    path = os.path.join(data_dir, f'{kind}-{size_mb}MB{ext}')
+    target = size_mb * 1024 * 1024
+    if os.path.exists(path) and os.path.getsize(path) >= target:
+        return path
+    chunk = _chunk(kind, random.Random(kind)).encode('utf-8')
+    tmp = path + '.part'
+    with open(tmp, 'wb') as f:
+        written = 0
+        while written < target:
+            f.write(chunk)
+            written += len(chunk)
+    os.replace(tmp, path)
+    return path
+
+
+# ---- Worker (one case in this process) ----
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS
+
+
+def run_case(path, case, scratch):
+    """Open `path` in a headless MainWindow and time `case`; returns seconds or None."""
+    sys.argv = [sys.argv[0]]  # MainWindow opens sys.argv[1:]
+    sys.path.insert(0, HERE)
+    import metapad
+    from metapad import QApplication, QMessageBox, QTextCursor, USING_QT6
+
+    app = QApplication(sys.argv)
+    # Modal reports (e.g. "Replaced N occurrences") would block a headless run.
+    QMessageBox.information = staticmethod(lambda *a, **k: None)
+    QMessageBox.warning = staticmethod(lambda *a, **k: None)
+    window = metapad.MainWindow()
+    window.resize(900, 640)
+    window.show()
+
+    def wait_until(condition, timeout=3600):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError(case)
+            app.processEvents()
+            time.sleep(0.0005)
+
+    def opened():
+        page = window.page
+        if page.isHuge():
+            return page.huge_view.indexComplete()
+        return window.loader is None and not page.loading
+
+    start = time.perf_counter()
+    window.openFileFromCommandLine(path)
+    wait_until(opened)
+    seconds = time.perf_counter() - start
+    page = window.page
+    editor = page.editor
+
+    if case in ('open', 'viewer_open'):
+        pass
+    elif page.isHuge() and case not in ('scroll', 'viewer_find', 'viewer_scroll'):
+        seconds = None  # read-only viewer: nothing to highlight, edit, save or print
+    elif case == 'highlight':
+        highlighter = editor.highlighter
+        start = time.perf_counter()
+        highlighter.rehighlight()
+        seconds = time.perf_counter() - start
+    elif case == 'find_next':
+        dialog = metapad.FindReplaceDialog(window, editor)
+        dialog.find_input.setText(NEEDLE)
+        cursor = editor.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.Start if USING_QT6 else QTextCursor.Start)
+        editor.setTextCursor(cursor)
+        start = time.perf_counter()
+        for _ in range(200):
+            dialog.find_next()
+        seconds = time.perf_counter() - start
+    elif case == 'replace_all':
+        dialog = metapad.FindReplaceDialog(window, editor)
+        dialog.find_input.setText(NEEDLE)
+        dialog.replace_input.setText('pin')
+        start = time.perf_counter()
+        dialog.replace_all()
+        wait_until(lambda: dialog.replace_worker is None)
+        seconds = time.perf_counter() - start
+    elif case == 'viewer_find':
+        view = page.huge_view
+        start = time.perf_counter()
+        for _ in range(200):
+            view.find(NEEDLE)
+            wait_until(lambda: view.searcher is None)
+        seconds = time.perf_counter() - start
+    elif case in ('scroll', 'viewer_scroll'):
+        view = page.huge_view if page.isHuge() else editor
+        bar = view.verticalScrollBar()
+        steps = 200
+        start = time.perf_counter()
+        for i in range(steps + 1):
+            bar.setValue(bar.maximum() * i // steps)
+            view.viewport().repaint()
+            if view is editor:
+                editor.lineNumberArea.repaint()
+        seconds = time.perf_counter() - start
+    elif case in ('save', 'save_start'):
+        out = os.path.join(scratch, 'saved' + os.path.splitext(path)[1])
+        start = time.perf_counter()
+        window.startSave(out)
+        blocked = time.perf_counter() - start  # the snapshot, taken on the GUI thread
+        wait_until(lambda: window.saver is None)
+        seconds = blocked if case == 'save_start' else time.perf_counter() - start
+    elif case == 'print':
+        QPrinter = metapad.print_support().QPrinter
+        printer = QPrinter(QPrinter.PrinterMode.HighResolution if USING_QT6
+                           else QPrinter.HighResolution)
+        printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat if USING_QT6
+                                else QPrinter.PdfFormat)
+        printer.setOutputFileName(os.path.join(scratch, 'printed.pdf'))
+        snapshot, font = window.printSnapshot()
+        start = time.perf_counter()
+        metapad.render_pages(metapad.Paginator(snapshot, font, printer), printer)
+        seconds = time.perf_counter() - start
+
+    # Skip the quit confirmation; stop the background threads directly.
+    window.stopLoader()
+    for p in window.pages():
+        p.closeHuge()
+        p.editor.journal.stop()
+    window.journal_writer.stop()
+    return seconds, ('PyQt6' if USING_QT6 else 'PyQt5')
+
+
+def worker_main(args):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    with tempfile.TemporaryDirectory(prefix='metapad-bench-') as scratch:
+        # Keep the user's journal and recent files out of the measurement.
+        os.environ['METAPAD_JOURNAL_DIR'] = os.path.join(scratch, 'journal')
+        os.environ['METAPAD_RECENT_FILE'] = os.path.join(scratch, 'recent.json')
+        seconds, binding = run_case(args.file, args.case, scratch)
+    print(json.dumps({'binding': binding, 'seconds': seconds, 'peak_rss_kb': peak_rss_kb()}))
+    sys.stdout.flush()
+    os._exit(0)  # no teardown cost or exit-time crashes in the measurement process
+
+
+# ---- Orchestrator ----
+def available_bindings():
+    found = []
+    for binding in ('6', '5'):
+        probe = subprocess.run([sys.executable, '-c', f'import PyQt{binding}.QtWidgets'],
+                               capture_output=True)
+        if probe.returncode == 0:
+            found.append(binding)
+    return found
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_worker(binding, path, case, timeout):
+    env = dict(os.environ, METAPAD_QT=binding, QT_QPA_PLATFORM='offscreen')
+    # The editor cases keep even the long-lines corpus in the editor; the
+    # viewer cases open every file in the long-line viewer.
+    env['METAPAD_LONG_LINE_CHARS'] = '1' if case in VIEWER_CASES else str(1 << 40)
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', '--file', path, '--case', case]
+    try:
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'error': f'timed out after {timeout} s'}
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {'error': (proc.stderr.strip().splitlines() or ['worker failed'])[-1]}
+    return json.loads(lines[-1])
+
+
+def compare(baseline_path, results):
+    with open(baseline_path) as f:
+        baseline = {(r['binding'], r['file'], r['case']): r for r in json.load(f)['results']}
+    print(f"{'binding':<7} {'file':<28} {'case':<12} {'before':>9} {'after':>9} {'ratio':>6}",
+          file=sys.stderr)
+    for r in results:
+        old = baseline.get((r['binding'], r['file'], r['case']))
+        if not old or old.get('seconds') is None or r.get('seconds') is None:
+            continue
+        ratio = r['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        print(f"{r['binding']:<7} {r['file']:<28} {r['case']:<12} "
+              f"{old['seconds']:9.3f} {r['seconds']:9.3f} {ratio:6.2f}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Metapad's hot paths headlessly.")
+    parser.add_argument('--sizes', default='1,16,128',
+                        help='file sizes in MB, comma separated (up to 1024 for 1 GB)')
+    parser.add_argument('--kinds', default=','.join(KINDS))
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--bindings', default=None,
+                        help='Qt bindings to test: 6, 5 or 6,5 (default: all installed)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case; best is kept')
+    parser.add_argument('--print-max-mb', type=int, default=16,
+                        help='skip the print case for larger files')
+    parser.add_argument('--timeout', type=int, default=3600, help='seconds per run')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'metapad-bench'))
+    parser.add_argument('--output', help='write JSON here (default: stdout)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker_main(args)
+
+    bindings = args.bindings.split(',') if args.bindings else available_bindings()
+    if not bindings:
+        parser.error('neither PyQt6 nor PyQt5 is installed')
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = []
+    for size_mb in (int(s) for s in args.sizes.split(',')):
+        for kind in args.kinds.split(','):
+            path = generate(args.data_dir, kind, size_mb)
+            name = os.path.basename(path)
+            for binding in bindings:
+                for case in args.cases.split(','):
+                    if case == 'print' and size_mb > args.print_max_mb:
+                        continue
+                    runs = [run_worker(binding, path, case, args.timeout)
+                            for _ in range(args.repeat)]
+                    ok = [r for r in runs if r.get('seconds') is not None]
+                    best = min(ok, key=lambda r: r['seconds']) if ok else runs[0]
+                    result = {'binding': f'PyQt{binding}', 'file': name,
+                              'bytes': os.path.getsize(path), 'case': case,
+                              'seconds': best.get('seconds'),
+                              'peak_rss_kb': best.get('peak_rss_kb'),
+                              'runs': [r.get('seconds') for r in runs]}
+                    if 'error' in best:
+                        result['error'] = best['error']
+                    results.append(result)
+                    shown = ('n/a' if result['seconds'] is None
+                             else f"{result['seconds']:.3f} s")
+                    print(f"PyQt{binding} {name:<28} {case:<12} {shown:>10}  "
+                          f"{result.get('error', '')}", file=sys.stderr)
+
+    report = {'commit': git_commit(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,31 +3,115 @@
 # White-paper UI
 # GPL v2
 
-import sys, os
+import time
+STARTUP_T0 = time.perf_counter()
 
-# --- Try PyQt6 first, fallback to PyQt5 ---
+import sys, os, re, codecs, tempfile, threading, mmap, bisect, zlib, json, queue, socket
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+
+from metapad_core import (env_int, TRACER, traced, SNIFF_BYTES, FALLBACK_ENCODING, BOM_BYTES,
+                          detect_encoding, sniff_file, iter_decoded, encode_text,
+                          compile_search, find_replacements, write_atomically,
+                          walk_files, search_file, compile_literal, query_trigrams, TrigramIndex,
+                          FileList, QUICK_OPEN_LIMIT, load_recent, remember_recent,
+                          UndoStack, step_size, read_lines, intern_lines, diff_lines,
+                          format_hunks)
+
+
+# ---- Single Instance (client side; runs before Qt is imported) ----
+LOCATION = re.compile(r'^(.*?):(\d+)(?::(\d+))?$')
+
+
+def parse_location(arg):
+    """Split 'file:line[:col]' into (path, line, col); a plain path gives (path, None, None)."""
+    m = LOCATION.match(arg)
+    if m and not os.path.exists(arg):
+        return m.group(1), int(m.group(2)), int(m.group(3)) if m.group(3) else None
+    return arg, None, None
+
+
+def instance_address():
+    """QLocalServer name of this user's running Metapad."""
+    if os.name == 'nt':
+        return "metapad-" + (os.environ.get("USERNAME") or "user")
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"metapad-{os.getuid()}.sock")
+
+
+def connect_to_instance(timeout=2.0):
+    """A binary stream to the running Metapad; raises OSError if there is none."""
+    if os.name == 'nt':
+        return open('\\\\.\\pipe\\' + instance_address(), 'r+b', buffering=0)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(instance_address())
+        return sock.makefile('rwb', buffering=0)
+
+
+def forward_to_instance(args):
+    """
+    Hand the files in `args` to a running Metapad and return True if it
+    accepted them. Plain sockets (named pipes on Windows) keep this path
+    free of Qt, so a forwarding launch exits almost at once.
+    """
+    files = []
+    for arg in args:
+        path, line, col = parse_location(arg)
+        files.append([os.path.abspath(path), line, col])
+    data = json.dumps({'files': files}).encode('ascii') + b'\n'
+    try:
+        with connect_to_instance() as stream:
+            stream.write(data)
+            reply = stream.read(3)
+    except OSError:
+        return False
+    return reply == b'ok\n'
+
+
+if __name__ == '__main__' and '--batch' in sys.argv[1:]:
+    # Headless: no window, no Qt import.
+    from metapad_core import batch_main
+    sys.exit(batch_main([a for a in sys.argv[1:] if a != '--batch']))
+
+if (__name__ == '__main__' and not any(a.startswith('--') for a in sys.argv[1:])
+        and forward_to_instance(sys.argv[1:])):
+    sys.exit(0)
+
+# --- Try PyQt6 first, fallback to PyQt5 (METAPAD_QT=5 forces PyQt5) ---
 try:
-    from PyQt6.QtCore import (Qt, QRegularExpression, QRect, QUrl, QSize, pyqtSignal)
+    if os.environ.get("METAPAD_QT") == "5":
+        raise ImportError("PyQt5 requested")
+    from PyQt6.QtCore import (Qt, QRegularExpression, QRect, QSize, QTimer, QThread,
+                              QEvent, QObject, QPointF, QFileSystemWatcher, pyqtSignal)
     from PyQt6.QtGui import (QFont, QPainter, QTextCharFormat, QSyntaxHighlighter,
-                             QTextCursor, QColor, QAction, QPalette, QTextDocument)
+                             QTextCursor, QColor, QAction, QTextDocument, QPixmap,
+                             QTextLayout, QTextOption, QFontMetricsF, QKeySequence)
     from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QPlainTextEdit,
                                  QToolBar, QLabel, QFileDialog, QMessageBox,
                                  QFontDialog, QInputDialog, QDialog, QVBoxLayout,
-                                 QHBoxLayout, QPushButton, QLineEdit, QCheckBox)
-    from PyQt6.QtPrintSupport import QPrintPreviewDialog, QPrinter, QPrintDialog
+                                 QHBoxLayout, QPushButton, QLineEdit, QCheckBox,
+                                 QProgressBar, QStackedWidget, QAbstractScrollArea,
+                                 QProgressDialog, QTextEdit, QTabWidget, QListWidget,
+                                 QListWidgetItem)
+    from PyQt6.QtNetwork import QLocalServer
     USING_QT6 = True
-    print("Using PyQt6")
 except ImportError:
-    from PyQt5.QtCore import (Qt, QRegExp, QRect, QUrl, QSize, pyqtSignal)
+    from PyQt5.QtCore import (Qt, QRegExp, QRect, QSize, QTimer, QThread,
+                              QEvent, QObject, QPointF, QFileSystemWatcher, pyqtSignal)
     from PyQt5.QtGui import (QFont, QPainter, QTextCharFormat, QSyntaxHighlighter,
-                             QTextCursor, QColor, QPalette, QTextDocument)
+                             QTextCursor, QColor, QTextDocument, QPixmap,
+                             QTextLayout, QTextOption, QFontMetricsF, QKeySequence)
     from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QPlainTextEdit,
                                  QToolBar, QLabel, QFileDialog, QMessageBox,
                                  QFontDialog, QInputDialog, QDialog, QVBoxLayout,
-                                 QHBoxLayout, QPushButton, QLineEdit, QCheckBox, QAction)
-    from PyQt5.QtPrintSupport import QPrintPreviewDialog, QPrinter, QPrintDialog
+                                 QHBoxLayout, QPushButton, QLineEdit, QCheckBox, QAction,
+                                 QProgressBar, QStackedWidget, QAbstractScrollArea,
+                                 QProgressDialog, QTextEdit, QTabWidget, QListWidget,
+                                 QListWidgetItem)
+    from PyQt5.QtNetwork import QLocalServer
     USING_QT6 = False
-    print("Using PyQt5")
 
 # --- Cross-version QMessageBox buttons ---
 if USING_QT6:
@@ -41,6 +125,36 @@ else:
     MB_YES = QMessageBox.Yes
     MB_NO = QMessageBox.No
 
+
+# --- Environment-tunable settings ---
+# Files at least this large open in the read-only huge file viewer.
+HUGE_FILE_BYTES = env_int("METAPAD_HUGE_FILE_MB", 256) * 1024 * 1024
+
+# Files with a line at least this long (checked in the first LONG_LINE_SNIFF
+# bytes) open in long-line mode; longer blocks in the editor are not highlighted.
+LONG_LINE_CHARS = env_int("METAPAD_LONG_LINE_CHARS", 20000)
+LONG_LINE_SNIFF = 4 * 1024 * 1024
+
+# Undo history kept in memory per document. Older steps spill to a temporary
+# file, or are dropped when METAPAD_UNDO_SPILL=0.
+UNDO_MAX_STEPS = env_int("METAPAD_UNDO_STEPS", 1000)
+UNDO_MAX_BYTES = env_int("METAPAD_UNDO_MB", 32) * 1024 * 1024
+UNDO_SPILL = os.environ.get("METAPAD_UNDO_SPILL", "1") != "0"
+
+# Inactive tabs are unloaded or compressed to keep documents under this budget.
+MEMORY_BUDGET_BYTES = env_int("METAPAD_MEMORY_BUDGET_MB", 512) * 1024 * 1024
+
+
+# --- Print support, imported on first use ---
+def print_support():
+    """Import QtPrintSupport on first use; starting the editor does not need it."""
+    if USING_QT6:
+        from PyQt6 import QtPrintSupport
+    else:
+        from PyQt5 import QtPrintSupport
+    return QtPrintSupport
+
+
 # --- Safe file dialog options helper ---
 def file_dialog_options():
     """
@@ -69,13 +183,161 @@ def file_dialog_options():
     return getattr(QFileDialog, "DontUseNativeDialog", 0) or 0
 
 
+# ---- Lexers ----
+class Lexer:
+    """
+    One language as a single precompiled alternation of named groups, so a
+    block is scanned once rather than once per rule. `tokens` lists
+    (group, kind, pattern) in priority order. Groups named in `multiline`
+    open a token that may run past the end of the block; the open token is
+    kept in the block state and its end pattern is matched on the next block.
+    """
+
+    def __init__(self, name, tokens, multiline=None):
+        self.name = name
+        self.pattern = re.compile('|'.join(f'(?P<{group}>{pattern})'
+                                           for group, _kind, pattern in tokens))
+        self.kinds = {group: kind for group, kind, _pattern in tokens}
+        multiline = multiline or {}
+        # Block state n > 0 means "inside the token opened by openers[n - 1]".
+        self.openers = list(multiline)
+        self.states = {group: n + 1 for n, group in enumerate(self.openers)}
+        self.ends = [re.compile(multiline[group]) for group in self.openers]
+
+
+LEXER_FACTORIES = {}   # language name -> function building its Lexer
+_LEXERS = {}           # languages compiled so far
+
+
+def register_lexer(name):
+    def register(factory):
+        LEXER_FACTORIES[name] = factory
+        return factory
+    return register
+
+
+def get_lexer(name):
+    """The Lexer for language `name`, compiled on first use; None for plain text."""
+    lexer = _LEXERS.get(name)
+    if lexer is None and name in LEXER_FACTORIES:
+        lexer = _LEXERS[name] = LEXER_FACTORIES[name]()
+    return lexer
+
+
+# Strings that may continue on the next line: match lazily up to an unescaped closer.
+def _until(closer):
+    return r'(?:\\.|[^\\])*?' + closer
+
+
+@register_lexer('python')
+def python_lexer():
+    prefix = r'(?:[rRbBuUfF]{1,2})?'
+    return Lexer('python', [
+        ('tdq', 'string', prefix + '"""'),
+        ('tsq', 'string', prefix + "'''"),
+        ('dq', 'string', prefix + r'"(?:\\.|[^"\\])*"?'),
+        ('sq', 'string', prefix + r"'(?:\\.|[^'\\])*'?"),
+        ('comment', 'comment', r'#.*'),
+    ], multiline={'tdq': _until('"""'), 'tsq': _until("'''")})
+
+
+def _c_family(name, extra_tokens=(), extra_multiline=None):
+    multiline = {'block_comment': r'.*?\*/'}
+    multiline.update(extra_multiline or {})
+    return Lexer(name, [
+        ('block_comment', 'comment', r'/\*'),
+        ('line_comment', 'comment', r'//.*'),
+        *extra_tokens,
+        ('dq', 'string', r'"(?:\\.|[^"\\])*"?'),
+        ('sq', 'string', r"'(?:\\.|[^'\\])*'?"),
+    ], multiline=multiline)
+
+
+@register_lexer('cpp')
+def cpp_lexer():
+    return _c_family('cpp')
+
+
+@register_lexer('javascript')
+def javascript_lexer():
+    return _c_family('javascript', [('template', 'string', '`')], {'template': _until('`')})
+
+
+@register_lexer('shell')
+def shell_lexer():
+    return Lexer('shell', [
+        ('comment', 'comment', r'(?:^|(?<=\s))#.*'),
+        ('dq', 'string', '"'),
+        ('sq', 'string', "'"),
+    ], multiline={'dq': _until('"'), 'sq': r"[^']*'"})
+
+
+LANGUAGE_EXTENSIONS = {
+    '.py': 'python', '.pyw': 'python', '.pyi': 'python',
+    '.c': 'cpp', '.h': 'cpp', '.cpp': 'cpp', '.cc': 'cpp', '.cxx': 'cpp', '.hpp': 'cpp',
+    '.hh': 'cpp', '.hxx': 'cpp',
+    '.js': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.sh': 'shell', '.bash': 'shell', '.zsh': 'shell', '.ksh': 'shell',
+}
+SHEBANG_LANGUAGES = [
+    (re.compile(r'python'), 'python'),
+    (re.compile(r'\b(?:node|nodejs|deno)\b'), 'javascript'),
+    (re.compile(r'\b(?:sh|bash|zsh|ksh|dash|ash)\b'), 'shell'),
+]
+
+
+def detect_language(filepath, head=None):
+    """Language for `filepath` from its extension or else its shebang line; None if unknown."""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext in LANGUAGE_EXTENSIONS:
+        return LANGUAGE_EXTENSIONS[ext]
+    if head is None:
+        try:
+            with open(filepath, 'rb') as f:
+                head = f.read(256)
+        except OSError:
+            return None
+    if head.startswith(b'#!'):
+        line = head.split(b'\n', 1)[0].decode('latin-1')
+        for pattern, language in SHEBANG_LANGUAGES:
+            if pattern.search(line):
+                return language
+    return None
+
+
 # ---- Syntax Highlighter (comments + strings only; keywords removed) ----
-class PythonHighlighter(QSyntaxHighlighter):
-    """Minimal Python syntax highlighter (comments & strings)."""
+class SyntaxHighlighter(QSyntaxHighlighter):
+    """
+    Minimal syntax highlighter (comments & strings) driven by the Lexer of
+    the document's language; plain text is left alone.
+
+    Documents larger than DEFER_THRESHOLD characters are highlighted lazily:
+    the visible blocks first, then the rest in small idle-time batches that
+    pause while the user types or scrolls.
+    """
+    DEFER_THRESHOLD = 1024 * 1024   # characters
+    IDLE_BATCH = 250                # blocks per idle tick
+    IDLE_RESUME_MS = 400            # quiet time before idle highlighting resumes
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.init_highlighting_rules()
 
+        self.editor = None
+        self.deferred = False
+        self._bulk = False          # True while a whole document is being loaded
+        self._busy = False          # True while we rehighlight blocks ourselves
+        self._frontier = 0          # every block before this position is highlighted
+        self._extra_done = set()    # block numbers past the frontier already highlighted
+
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setInterval(0)
+        self._idle_timer.timeout.connect(self._highlightIdleBatch)
+        self._resume_timer = QTimer(self)
+        self._resume_timer.setSingleShot(True)
+        self._resume_timer.setInterval(self.IDLE_RESUME_MS)
+        self._resume_timer.timeout.connect(self._idle_timer.start)
+
     def init_highlighting_rules(self):
         comment_format = QTextCharFormat()
         comment_format.setForeground(QColor("#6a737d"))  # grey
@@ -83,29 +345,199 @@ class PythonHighlighter(QSyntaxHighlighter):
         string_format = QTextCharFormat()
         string_format.setForeground(QColor("#d14"))      # red-ish
 
-        self.highlighting_rules = []
-        self.highlighting_rules.append((r'#[^\n]*', comment_format))
-        self.highlighting_rules.append((r"'[^']*'", string_format))
-        self.highlighting_rules.append((r'"[^"]*"', string_format))
+        self.formats = {'comment': comment_format, 'string': string_format}
+        self.lexer = None
+
+    def setLexer(self, lexer):
+        """Switch language and recolor, lazily for large documents."""
+        if lexer is self.lexer:
+            return
+        self.lexer = lexer
+        size = self.document().characterCount()
+        if size > self.DEFER_THRESHOLD:
+            self.beginLoad(size)
+            self.endLoad()
+        else:
+            self.rehighlight()
+
+    def setEditor(self, editor):
+        """Attach the view used to find visible blocks and user activity."""
+        self.editor = editor
+        editor.verticalScrollBar().valueChanged.connect(self._onScroll)
+        self.document().contentsChange.connect(self._onContentsChange)
+
+    # ---- Deferred mode ----
+    def beginLoad(self, size):
+        """Call before replacing the whole document with `size` characters."""
+        self._idle_timer.stop()
+        self._resume_timer.stop()
+        self.deferred = size > self.DEFER_THRESHOLD
+        self._bulk = self.deferred
+        self._frontier = 0
+        self._extra_done.clear()
+
+    def endLoad(self):
+        """Call once the new document text is in place."""
+        self._bulk = False
+        if self.deferred:
+            self.highlightViewport()
+            self._resume_timer.start()
+
+    @traced("highlight.viewport")
+    def highlightViewport(self):
+        if not self.deferred or self.editor is None:
+            return
+        self._busy = True
+        try:
+            for block in list(self.editor.visibleBlocks()):
+                number = block.blockNumber()
+                if block.position() >= self._frontier and number not in self._extra_done:
+                    self.rehighlightBlock(block)
+                    self._extra_done.add(number)
+        finally:
+            self._busy = False
+
+    def _pause(self):
+        self._idle_timer.stop()
+        self._resume_timer.start()
+
+    def _onScroll(self, _value):
+        if self.deferred and not self._bulk:
+            self.highlightViewport()
+            self._pause()
+
+    def _onContentsChange(self, pos, removed, added):
+        if not self.deferred or self._bulk or self._busy:
+            return
+        if pos < self._frontier:
+            self._frontier = max(pos, self._frontier + added - removed)
+        # Block numbers past the edit may have shifted.
+        self._extra_done.clear()
+        self._pause()
+
+    @traced("highlight.idle_batch")
+    def _highlightIdleBatch(self):
+        block = self.document().findBlock(self._frontier)
+        self._busy = True
+        try:
+            for _ in range(self.IDLE_BATCH):
+                if not block.isValid():
+                    break
+                number = block.blockNumber()
+                if number in self._extra_done:
+                    self._extra_done.discard(number)
+                else:
+                    self.rehighlightBlock(block)
+                block = block.next()
+        finally:
+            self._busy = False
+
+        if block.isValid():
+            self._frontier = block.position()
+        else:
+            # Whole document done: back to regular, synchronous highlighting.
+            self._idle_timer.stop()
+            self.deferred = False
+            self._extra_done.clear()
 
+    @traced("highlight.block")
     def highlightBlock(self, text):
-        for pattern, fmt in self.highlighting_rules:
-            if USING_QT6:
-                regex = QRegularExpression(pattern)
-                match = regex.globalMatch(text)
-                while match.hasNext():
-                    m = match.next()
-                    self.setFormat(m.capturedStart(), m.capturedLength(), fmt)
-            else:
-                regex = QRegExp(pattern)
-                index = regex.indexIn(text)
-                while index >= 0:
-                    length = regex.matchedLength()
-                    self.setFormat(index, length, fmt)
-                    index = regex.indexIn(text, index + length)
+        if self._bulk:
+            return
+        lexer = self.lexer
+        if lexer is None:
+            return
+        if len(text) > LONG_LINE_CHARS:
+            self.setCurrentBlockState(0)  # too costly to lay out formats for
+            return
+        formats, kinds = self.formats, lexer.kinds
+        # setFormat counts UTF-16 units; only astral characters make that differ.
+        to_qt = (lambda i: i) if text.isascii() else utf16_position_map(text)
+
+        pos, end = 0, len(text)
+        state = self.previousBlockState()
+        if state > 0:
+            # Continue a token left open by the previous block.
+            m = lexer.ends[state - 1].match(text)
+            fmt = formats[kinds[lexer.openers[state - 1]]]
+            if m is None:
+                self.setFormat(0, to_qt(end), fmt)
+                self.setCurrentBlockState(state)
+                return
+            pos = m.end()
+            self.setFormat(0, to_qt(pos), fmt)
+        self.setCurrentBlockState(0)
+
+        search = lexer.pattern.search
+        while pos < end:
+            m = search(text, pos)
+            if m is None:
+                break
+            group, start, pos = m.lastgroup, m.start(), m.end()
+            fmt = formats[kinds[group]]
+            opened = lexer.states.get(group)
+            if opened:
+                close = lexer.ends[opened - 1].match(text, pos)
+                if close is None:
+                    self.setFormat(to_qt(start), to_qt(end) - to_qt(start), fmt)
+                    self.setCurrentBlockState(opened)
+                    return
+                pos = close.end()
+            if pos == start:
+                pos += 1  # never loop on an empty match
+                continue
+            self.setFormat(to_qt(start), to_qt(pos) - to_qt(start), fmt)
 
 
 # ---- Line Number Area ----
+class DigitGlyphCache:
+    """
+    Pre-rendered pixmaps of the digits 0-9 for one font and pixel ratio.
+    Line numbers are drawn by blitting these instead of laying out text.
+    """
+    COLOR = "#888"
+
+    def __init__(self):
+        self._key = None
+        self._glyphs = {}
+        self.digit_width = 0
+        self.height = 0
+
+    def update(self, widget):
+        """Re-render for `widget`'s font if it changed; return True if so."""
+        font = widget.font()
+        ratio = widget.devicePixelRatioF()
+        key = (font.key(), ratio)
+        if key == self._key:
+            return False
+        self._key = key
+        fm = widget.fontMetrics()
+        advance = fm.horizontalAdvance if USING_QT6 else fm.width
+        self.digit_width = max(advance(d) for d in '0123456789')
+        self.height = fm.height()
+        transparent = Qt.GlobalColor.transparent if USING_QT6 else Qt.transparent
+        for d in '0123456789':
+            pixmap = QPixmap(int(self.digit_width * ratio + 0.999), int(self.height * ratio + 0.999))
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(transparent)
+            painter = QPainter(pixmap)
+            painter.setFont(font)
+            painter.setPen(QColor(self.COLOR))
+            painter.drawText((self.digit_width - advance(d)) // 2, fm.ascent(), d)
+            painter.end()
+            self._glyphs[d] = pixmap
+        return True
+
+    def draw(self, painter, right, top, number):
+        """Draw `number` right-aligned against `right`, line top at `top`."""
+        text = str(number)
+        x = right - self.digit_width * len(text)
+        glyphs = self._glyphs
+        for ch in text:
+            painter.drawPixmap(x, top, glyphs[ch])
+            x += self.digit_width
+
+
 class QLineNumberArea(QWidget):
     def __init__(self, editor):
         super().__init__(editor)
@@ -118,141 +550,2723 @@ class QLineNumberArea(QWidget):
         self.metapad.lineNumberAreaPaintEvent(event)
 
 
-# ---- Find & Replace Dialog ----
-class FindReplaceDialog(QDialog):
-    def __init__(self, parent=None, editor=None):
+# ---- Overview Ruler ----
+class OverviewRuler(QWidget):
+    """
+    Narrow map of the whole document beside the editor: the shape of the
+    text, search hits and the visible region. The indent and length of
+    every block are kept in arrays patched on contentsChange. The map is
+    redrawn from them (never from the document) at most every REDRAW_MS,
+    only the rows of edited blocks unless the line count changed, and
+    scrolling just moves the viewport frame over the cached pixmap.
+    """
+    WIDTH = 48
+    COLUMNS = 120        # line length drawn at full width
+    REDRAW_MS = 100
+    TEXT_COLOR = "#c8c8c8"
+    HIT_COLOR = "#e69a1e"
+    VIEW_COLOR = "#4a78c2"
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.metapad = editor
+        self.indents = array('I', [0])
+        self.lengths = array('I', [0])
+        self.matches = None      # the Find dialog's MatchIndex, if any
+        self.pixmap = None
+        self.dirty = (0, 1)      # block range whose rows need redrawing
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(self.REDRAW_MS)
+        self.redraw_timer.timeout.connect(self.redraw)
+        editor.document().contentsChange.connect(self._onContentsChange)
+        editor.verticalScrollBar().valueChanged.connect(lambda _: self.update())
+
+    def sizeHint(self):
+        return QSize(self.WIDTH, 0)
+
+    def setMatches(self, matches):
+        self.matches = matches
+        self.markDirty(0, len(self.lengths))
+
+    def markDirty(self, lo, hi):
+        """Redraw the rows of blocks [lo, hi) soon."""
+        self.dirty = (min(lo, self.dirty[0]), max(hi, self.dirty[1]))
+        if not self.redraw_timer.isActive():
+            self.redraw_timer.start()
+
+    def _summarize(self, start, end):
+        """Indents and lengths of the blocks between document positions `start` and `end`."""
+        cursor = QTextCursor(self.metapad.document())
+        cursor.setPosition(start)
+        if USING_QT6:
+            cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        else:
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+        lines = cursor.selectedText().split('\u2029')
+        lengths = array('I', map(len, lines))
+        indents = array('I', map(int.__sub__, lengths, map(len, map(str.lstrip, lines))))
+        return indents, lengths
+
+    def _onContentsChange(self, pos, removed, added):
+        doc = self.metapad.document()
+        last = doc.characterCount() - 1
+        first_block = doc.findBlock(min(pos, last))
+        last_block = doc.findBlock(min(pos + added, last))
+        first, end = first_block.blockNumber(), last_block.blockNumber() + 1
+        old_end = end - (doc.blockCount() - len(self.lengths))
+        if old_end < first:
+            # Out of step with the document; summarize all of it again.
+            first, old_end = 0, len(self.lengths)
+            first_block, last_block = doc.firstBlock(), doc.lastBlock()
+        indents, lengths = self._summarize(first_block.position(),
+                                           last_block.position() + last_block.length() - 1)
+        moved = len(lengths) != old_end - first
+        self.indents[first:old_end] = indents
+        self.lengths[first:old_end] = lengths
+        # Rows map to block numbers, so a changed block count moves every row.
+        self.markDirty(0 if moved else first, len(self.lengths) if moved else first + len(lengths))
+
+    @traced("ruler.redraw")
+    def redraw(self):
+        """Render the text shape and search hits of the dirty rows into the cached pixmap."""
+        self.redraw_timer.stop()
+        width, height = self.width(), self.height()
+        if not self.isVisible() or width <= 0 or height <= 0:
+            return  # drawn when next painted
+        lengths, indents = self.lengths, self.indents
+        count = len(lengths)
+        bounds = [y * count // height for y in range(height + 1)]  # first block of each row
+        if self.pixmap is None or self.pixmap.size() != self.size():
+            self.pixmap = QPixmap(width, height)
+            self.dirty = (0, count)
+        lo, hi = self.dirty
+        self.dirty = (count, 0)
+        # A hit mark is two rows tall, so repaint one row more above.
+        top = max(0, bisect.bisect_left(bounds, lo) - 2)
+        bottom = min(height, bisect.bisect_left(bounds, hi) + 1)
+        if top >= bottom:
+            return
+        painter = QPainter(self.pixmap)
+        painter.fillRect(0, top, width, bottom - top, QColor("#fafafa"))
+        scale = width / self.COLUMNS
+        color = QColor(self.TEXT_COLOR)
+        for y in range(top, bottom):
+            a, b = bounds[y], max(bounds[y + 1], bounds[y] + 1)
+            length = max(lengths[a:b])
+            if length:
+                indent = min(indents[a:b])
+                left = int(indent * scale)
+                painter.fillRect(left, y, max(1, min(width, int(length * scale)) - left), 1, color)
+
+        matches = self.matches
+        if matches is not None and len(matches):
+            doc = self.metapad.document()
+            before = {}  # block number -> matches starting before it
+            for y in range(top, bottom):
+                for n in (bounds[y], max(bounds[y + 1], bounds[y] + 1)):
+                    if n not in before:
+                        position = (doc.findBlockByNumber(n).position() if n < count
+                                    else doc.characterCount())
+                        before[n] = matches.countBefore(position)
+            color = QColor(self.HIT_COLOR)
+            for y in range(top, bottom):
+                if before[max(bounds[y + 1], bounds[y] + 1)] > before[bounds[y]]:
+                    painter.fillRect(width - 8, y, 8, 2, color)
+        painter.end()
+        self.update()
+
+    def paintEvent(self, event):
+        if (self.pixmap is None or self.pixmap.size() != self.size()
+                or self.dirty[0] < self.dirty[1]):
+            self.redraw()
+            if self.pixmap is None:
+                return
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.pixmap)
+        # The visible region, mapped like the map itself: block n at n * height / count.
+        editor = self.metapad
+        first = editor.firstVisibleBlock().blockNumber()
+        shown = sum(1 for _ in editor.visibleBlocks())
+        count, height = len(self.lengths), self.height()
+        top = int(first * height / count)
+        bottom = max(top + 3, int((first + shown) * height / count))
+        frame = QColor(self.VIEW_COLOR)
+        fill = QColor(frame)
+        fill.setAlpha(40)
+        painter.fillRect(0, top, self.width(), bottom - top, fill)
+        painter.setPen(frame)
+        painter.drawRect(0, top, self.width() - 1, bottom - top - 1)
+
+    def mousePressEvent(self, event):
+        self._scrollTo(event)
+
+    def mouseMoveEvent(self, event):
+        self._scrollTo(event)
+
+    def _scrollTo(self, event):
+        """Center the editor on the part of the document under the pointer."""
+        y = event.position().y() if USING_QT6 else event.y()
+        scrollbar = self.metapad.verticalScrollBar()
+        total = scrollbar.maximum() + scrollbar.pageStep()
+        scrollbar.setValue(int(y / max(1, self.height()) * total - scrollbar.pageStep() / 2))
+
+
+# ---- Background File Loader ----
+class FileLoader(QThread):
+    """
+    Read and decode a file in a worker thread, handing it to the GUI in
+    fixed-size chunks. At most MAX_PENDING chunks are in flight, so memory
+    stays bounded even when the GUI inserts slower than the disk reads.
+    The encoding and line-ending style are sniffed from the first bytes.
+    """
+    CHUNK_BYTES = 512 * 1024
+    MAX_PENDING = 4
+
+    detected = pyqtSignal(str, bool, str)    # encoding, has BOM, EOL
+    restarted = pyqtSignal()                 # discard chunks sent so far
+    chunkReady = pyqtSignal(object)          # str
+    progress = pyqtSignal(object, object)    # bytes read, total bytes
+    failed = pyqtSignal(str)
+
+    def __init__(self, filepath, parent=None):
         super().__init__(parent)
-        self.editor = editor
-        self.setWindowTitle("Find & Replace")
-        self.setModal(False)
-        self.setupUI()
+        self.filepath = filepath
+        self.offset = None      # bytes consumed, once the whole file has been read
+        self.identity = None    # (device, inode) of the file that was read
+        self._slots = threading.Semaphore(self.MAX_PENDING)
 
-    def setupUI(self):
-        layout = QVBoxLayout()
+    def chunkConsumed(self):
+        """Called by the GUI once a chunk has been inserted."""
+        self._slots.release()
 
-        # Find input
-        find_layout = QHBoxLayout()
-        find_label = QLabel("Find:")
-        self.find_input = QLineEdit()
-        find_layout.addWidget(find_label)
-        find_layout.addWidget(self.find_input)
-        layout.addLayout(find_layout)
+    @traced("io.load")
+    def run(self):
+        try:
+            with open(self.filepath, 'rb') as f:
+                st = os.fstat(f.fileno())
+                total = st.st_size
+                self.identity = (st.st_dev, st.st_ino)
+                encoding, bom, eol = sniff_file(f)
+                start = f.tell()
+                self.detected.emit(encoding, bom, eol)
+                try:
+                    self._stream(f, encoding, total)
+                except UnicodeDecodeError:
+                    # The sample looked like UTF-8 but later bytes are not;
+                    # start over with an encoding that accepts anything.
+                    f.seek(start)
+                    self.restarted.emit()
+                    self.detected.emit(FALLBACK_ENCODING, False, eol)
+                    self._stream(f, FALLBACK_ENCODING, total)
+                if not self.isInterruptionRequested():
+                    self.offset = f.tell()
+        except Exception as e:
+            self.failed.emit(str(e))
 
-        # Replace input
-        replace_layout = QHBoxLayout()
-        replace_label = QLabel("Replace:")
-        self.replace_input = QLineEdit()
-        replace_layout.addWidget(replace_label)
-        replace_layout.addWidget(self.replace_input)
-        layout.addLayout(replace_layout)
+    def _stream(self, f, encoding, total):
+        for chunk in iter_decoded(f, encoding, self.CHUNK_BYTES):
+            while not self._slots.acquire(timeout=0.1):
+                if self.isInterruptionRequested():
+                    return
+            self.chunkReady.emit(chunk)
+            self.progress.emit(f.tell(), total)
+            if self.isInterruptionRequested():
+                return
 
-        # Match case checkbox
-        self.match_case_checkbox = QCheckBox("Match case")
-        layout.addWidget(self.match_case_checkbox)
 
-        # Buttons
-        button_layout = QHBoxLayout()
-        self.find_button = QPushButton("Find Next")
-        self.replace_button = QPushButton("Replace")
-        self.replace_all_button = QPushButton("Replace All")
-        button_layout.addWidget(self.find_button)
-        button_layout.addWidget(self.replace_button)
-        button_layout.addWidget(self.replace_all_button)
-        layout.addLayout(button_layout)
+# ---- Follow Mode (tail a growing file) ----
+# Lines kept while following; older lines are dropped from the top.
+FOLLOW_MAX_LINES = env_int("METAPAD_FOLLOW_MAX_LINES", 200000)
 
-        self.setLayout(layout)
-        self.setFixedSize(400, 160)
 
-        # Signals
-        self.find_button.clicked.connect(self.find_next)
-        self.replace_button.clicked.connect(self.replace_one)
-        self.replace_all_button.clicked.connect(self.replace_all)
+class FileFollower(QObject):
+    """
+    Tail a growing file into an editor. Every POLL_MS only the bytes
+    appended since `offset` are read, decoded incrementally and appended in
+    one batch. A file that shrank or was replaced (log rotation) is read
+    again from the start.
+    """
+    POLL_MS = 500
+    BATCH_BYTES = 1024 * 1024   # per poll, so a burst never stalls the GUI
+    reopened = pyqtSignal()
 
-    def find_flags(self):
-        """Return flags for QPlainTextEdit.find, cross-version safe."""
+    def __init__(self, editor, filepath, offset, identity, parent=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.filepath = filepath
+        self.offset = offset
+        self.identity = identity
+        self.autoscroll = True
+        self._resetDecoder()
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.POLL_MS)
+        self.timer.timeout.connect(self.poll)
+
+    def _resetDecoder(self):
+        self.decoder = codecs.getincrementaldecoder(self.editor.encoding)(errors='replace')
+        self.carry = ''
+
+    def start(self):
+        self.timer.start()
+        self.poll()
+
+    def stop(self):
+        self.timer.stop()
+
+    @traced("follow.poll")
+    def poll(self):
+        try:
+            st = os.stat(self.filepath)
+        except OSError:
+            return  # rotated away; wait for the new file to appear
+        if (st.st_dev, st.st_ino) != self.identity or st.st_size < self.offset:
+            self.identity = (st.st_dev, st.st_ino)
+            self.offset = 0
+            self._resetDecoder()
+            self.editor.clear()
+            self.reopened.emit()
+        if st.st_size == self.offset:
+            return
+        try:
+            with open(self.filepath, 'rb') as f:
+                f.seek(self.offset)
+                raw = f.read(self.BATCH_BYTES)
+        except OSError:
+            return
+        self.offset += len(raw)
+        text = self.carry + self.decoder.decode(raw)
+        self.carry = ''
+        if text.endswith('\r'):
+            # The matching '\n' may come with the next batch.
+            text, self.carry = text[:-1], '\r'
+        if text:
+            self.append(text.replace('\r\n', '\n').replace('\r', '\n'))
+        if self.offset < st.st_size:
+            QTimer.singleShot(0, self.poll)  # more is waiting; keep the GUI responsive
+
+    def append(self, text):
+        doc = self.editor.document()
+        cursor = QTextCursor(doc)
         if USING_QT6:
-            flags = QTextDocument.FindFlag(0)
-            if self.match_case_checkbox.isChecked():
-                flags |= QTextDocument.FindFlag.FindCaseSensitively
-            return flags
+            cursor.movePosition(QTextCursor.MoveOperation.End)
         else:
-            flags = QTextDocument.FindFlags()
-            if self.match_case_checkbox.isChecked():
-                flags |= QTextDocument.FindCaseSensitively
-            return flags
+            cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        doc.setModified(False)  # the text still mirrors the file
+        if self.autoscroll:
+            bar = self.editor.verticalScrollBar()
+            bar.setValue(bar.maximum())
 
-    def find_next(self):
-        text = self.find_input.text()
-        if text:
-            if not self.editor.find(text, self.find_flags()):
-                cursor = self.editor.textCursor()
-                if USING_QT6:
-                    cursor.movePosition(QTextCursor.MoveOperation.Start)
-                else:
-                    cursor.movePosition(QTextCursor.Start)
-                self.editor.setTextCursor(cursor)
-                self.editor.find(text, self.find_flags())
+    def trimmed(self):
+        """True once lines have been dropped to stay under FOLLOW_MAX_LINES."""
+        doc = self.editor.document()
+        return bool(doc.maximumBlockCount()) and doc.blockCount() >= doc.maximumBlockCount()
+
+
+# ---- Huge File Viewer (read-only, memory-mapped) ----
+def has_long_lines(filepath, limit=LONG_LINE_CHARS):
+    """True if the head of the file has a line of at least `limit` bytes."""
+    with open(filepath, 'rb') as f:
+        head = f.read(LONG_LINE_SNIFF)
+    return max(map(len, head.split(b'\n'))) >= limit
+
+
+class LineIndexer(QThread):
+    """
+    Build a sparse line index over a memory-mapped file: for every BLOCK
+    bytes we record how many newlines precede it. Memory is proportional to
+    file size / BLOCK and a line offset is found by scanning one block.
+    """
+    BLOCK = 64 * 1024
+    SCAN = 64 * BLOCK  # bytes examined per step (4 MiB)
+
+    progress = pyqtSignal(object, object)  # newlines indexed, bytes indexed
+
+    def __init__(self, mm, parent=None):
+        super().__init__(parent)
+        self.mm = mm
+        self.block_lines = array('q')
+        self.indexed_bytes = 0
+        self.indexed_lines = 0
+
+    @traced("io.index_lines")
+    def run(self):
+        mm = self.mm
+        size = len(mm)
+        pos = lines = 0
+        while pos < size and not self.isInterruptionRequested():
+            chunk = mm[pos:pos + self.SCAN]
+            for start in range(0, len(chunk), self.BLOCK):
+                self.block_lines.append(lines)
+                lines += chunk.count(b'\n', start, start + self.BLOCK)
+            pos += len(chunk)
+            # Publish only after the blocks above are in place.
+            self.indexed_lines = lines
+            self.indexed_bytes = pos
+            self.progress.emit(lines, pos)
+
+
+class MapSearcher(QThread):
+    """
+    Find the first occurrence of a literal byte pattern at or after `start`
+    in a memory-mapped file, wrapping at the end. The map is scanned SCAN
+    bytes at a time so an interruption is noticed quickly.
+    """
+    SCAN = 16 * 1024 * 1024
+
+    def __init__(self, mm, search, length, start, parent=None):
+        super().__init__(parent)
+        self.mm = mm
+        self.search = search
+        self.length = length  # of the pattern, so a match across a step is not missed
+        self.start_pos = start
+        self.match = None     # (start, end) once found
+
+    def _scan(self, lo, hi):
+        pos = lo
+        while pos < hi and not self.isInterruptionRequested():
+            end = min(hi, pos + self.SCAN)
+            m = self.search.search(self.mm, pos, min(len(self.mm), end + self.length - 1))
+            if m is not None:
+                return m
+            pos = end
+        return None
+
+    @traced("search.viewer_scan")
+    def run(self):
+        m = self._scan(self.start_pos, len(self.mm)) or self._scan(0, self.start_pos)
+        if m is not None and not self.isInterruptionRequested():
+            self.match = (m.start(), m.end())
+
+
+class HugeFileView(QAbstractScrollArea):
+    """
+    Read-only viewer for files too large for QPlainTextEdit, or with lines
+    too long for it to lay out (long-line mode). Only the visible lines,
+    and of those only the visible columns, are read from the memory map
+    and drawn, so a line of many MB costs no more than a short one. The
+    line number gutter is the same QLineNumberArea the editor uses.
+    Columns count bytes.
+    """
+    cursorPositionChangedSignal = pyqtSignal(int, int)  # line, col
+    indexProgress = pyqtSignal(object, object)          # lines, fraction indexed
+    searchFinished = pyqtSignal(str, bool)              # pattern, found
+    CTRL = Qt.KeyboardModifier.ControlModifier if USING_QT6 else Qt.ControlModifier
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filepath = None
+        self._file = None
+        self.mm = None
+        self.indexer = None
+        self.searcher = None
+        self.encoding = 'utf-8'
+        self.current_line = 0
+        self._bom = 0
+        self._gutter_digits = 0
+        self._glyphs = DigitGlyphCache()
+        self._max_columns = 0
+        self.match = None  # (start, end) byte offsets of the last search hit
+
+        self.lineNumberArea = QLineNumberArea(self)
+        self.verticalScrollBar().setSingleStep(1)
+        self.updateLineNumberAreaWidth()
+
+    # ---- File handling ----
+    def openFile(self, filepath):
+        self.closeFile()
+        self._file = open(filepath, 'rb')
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.filepath = filepath
+        # Lines are split on b'\n', so only byte-oriented encodings can be shown.
+        encoding, _ = detect_encoding(self.mm[:SNIFF_BYTES])
+        self.encoding = encoding if encoding in ('utf-8', FALLBACK_ENCODING) else 'utf-8'
+        self._bom = len(BOM_BYTES['utf-8']) if self.mm[:3] == BOM_BYTES['utf-8'] else 0
+        self.current_line = 0
+        self._max_columns = 0
+        self.match = None
+        self.indexer = LineIndexer(self.mm, self)
+        self.indexer.progress.connect(self._onIndexProgress)
+        self.indexer.start()
+        self.verticalScrollBar().setValue(0)
+        self.horizontalScrollBar().setValue(0)
+        self._updateScrollRange()
+
+    def closeFile(self):
+        self.stopSearch()
+        if self.indexer is not None:
+            self.indexer.requestInterruption()
+            self.indexer.wait()
+            self.indexer.deleteLater()
+            self.indexer = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.filepath = None
+
+    def _onIndexProgress(self, lines, done):
+        self._updateScrollRange()
+        self.indexProgress.emit(lines + 1, done / max(1, len(self.mm)))
+
+    def indexComplete(self):
+        return self.indexer is not None and self.indexer.isFinished()
+
+    def lineCount(self):
+        if self.indexer is None:
+            return 1
+        return self.indexer.indexed_lines + 1
+
+    def lineOffset(self, line):
+        """Byte offset of the 0-based `line`, or -1 if not indexed yet."""
+        if line <= 0:
+            return self._bom
+        indexer = self.indexer
+        if indexer is None or line >= self.lineCount():
+            return -1
+        # Last indexed block that starts before the line's preceding newline.
+        count = (indexer.indexed_bytes + indexer.BLOCK - 1) // indexer.BLOCK
+        b = bisect.bisect_left(indexer.block_lines, line, 0, count) - 1
+        pos = b * indexer.BLOCK
+        for _ in range(line - indexer.block_lines[b]):
+            pos = self.mm.find(b'\n', pos) + 1
+        return pos
+
+    def lineAt(self, pos):
+        """0-based line containing byte offset `pos`."""
+        indexer = self.indexer
+        if pos < indexer.indexed_bytes:
+            b = pos // indexer.BLOCK
+            return indexer.block_lines[b] + self.mm[b * indexer.BLOCK:pos].count(b'\n')
+        return indexer.indexed_lines + self.mm[indexer.indexed_bytes:pos].count(b'\n')
+
+    def lineSegment(self, pos, column, count):
+        """
+        Return (display text of `count` columns from `column`, line length,
+        offset of the next line) for the line at `pos`.
+        """
+        end = self.mm.find(b'\n', pos)
+        if end < 0:
+            end = len(self.mm)
+        start = min(pos + column, end)
+        raw = self.mm[start:min(end, start + count)]
+        if self.encoding == 'utf-8':
+            # Drop the tail of a character cut by the left edge.
+            skip = 0
+            while skip < min(3, len(raw)) and raw[skip] & 0xC0 == 0x80:
+                skip += 1
+            raw = raw[skip:]
+        text = raw.decode(self.encoding, errors='replace')
+        if start + count >= end:
+            text = text.rstrip('\r')
+        return text.expandtabs(8), end - pos, end + 1
+
+    def columnWidth(self):
+        fm = self.fontMetrics()
+        return max(1, fm.horizontalAdvance('0') if USING_QT6 else fm.width('0'))
+
+    def visibleColumnCount(self):
+        return max(1, (self.viewport().width() - 4) // self.columnWidth())
+
+    def find(self, pattern, case_sensitive=False):
+        """
+        Look for the next occurrence of `pattern` after the current one
+        (wrapping at the end) in a worker thread. searchFinished reports the
+        outcome; a hit is shown first.
+        """
+        self.stopSearch()
+        try:
+            needle = pattern.encode(self.encoding)
+        except UnicodeEncodeError:
+            self.searchFinished.emit(pattern, False)
+            return
+        search = re.compile(re.escape(needle), 0 if case_sensitive else re.IGNORECASE)
+        if self.match is not None:
+            start = self.match[0] + 1
+        else:
+            start = max(0, self.lineOffset(self.current_line)) + self.horizontalScrollBar().value()
+        self.searcher = MapSearcher(self.mm, search, len(needle), min(start, len(self.mm)), self)
+        self.searcher.pattern = pattern
+        self.searcher.finished.connect(self._onSearchFinished)
+        self.searcher.start()
+
+    def stopSearch(self):
+        if self.searcher is not None:
+            self.searcher.requestInterruption()
+            self.searcher.wait()
+            self.searcher.deleteLater()
+            self.searcher = None
+
+    def _onSearchFinished(self):
+        searcher = self.sender()
+        if searcher is not self.searcher:
+            return
+        self.searcher = None
+        searcher.deleteLater()
+        if searcher.match is not None:
+            self.showMatch(*searcher.match)
+        self.searchFinished.emit(searcher.pattern, searcher.match is not None)
+
+    def showMatch(self, start, end):
+        self.match = (start, end)
+        line = self.lineAt(start)
+        column = start - self.lineOffset(line)
+        hbar = self.horizontalScrollBar()
+        if not hbar.value() <= column < hbar.value() + self.visibleColumnCount() - (end - start):
+            self._max_columns = max(self._max_columns, column + end - start)
+            self._updateColumnRange()
+            hbar.setValue(max(0, column - self.visibleColumnCount() // 3))
+        self.gotoLine(line + 1)
+        self.cursorPositionChangedSignal.emit(line + 1, column + 1)
+
+    # ---- Navigation ----
+    def visibleLineCount(self):
+        return max(1, self.viewport().height() // self.fontMetrics().height())
+
+    def gotoLine(self, line):
+        """Scroll to 1-based `line` and mark it as the current line."""
+        self.current_line = max(0, min(line, self.lineCount()) - 1)
+        self.verticalScrollBar().setValue(
+            max(0, self.current_line - self.visibleLineCount() // 3))
+        self.viewport().update()
+        self.lineNumberArea.update()
+        self.cursorPositionChangedSignal.emit(self.current_line + 1, 1)
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        Key = Qt.Key if USING_QT6 else Qt
+        moves = {
+            Key.Key_Up: -1, Key.Key_Down: 1,
+            Key.Key_PageUp: -self.visibleLineCount(), Key.Key_PageDown: self.visibleLineCount(),
+        }
+        hbar = self.horizontalScrollBar()
+        if key in moves:
+            self.gotoLine(self.current_line + 1 + moves[key])
+        elif key == Key.Key_Home:
+            self.gotoLine(1)
+        elif key == Key.Key_End:
+            self.gotoLine(self.lineCount())
+        elif key in (Key.Key_Left, Key.Key_Right):
+            step = hbar.pageStep() if event.modifiers() & self.CTRL else hbar.singleStep()
+            hbar.setValue(hbar.value() + (step if key == Key.Key_Right else -step))
+            self.cursorPositionChangedSignal.emit(self.current_line + 1, hbar.value() + 1)
+        else:
+            super().keyPressEvent(event)
+
+    # ---- Geometry / gutter ----
+    def _updateScrollRange(self):
+        vbar = self.verticalScrollBar()
+        vbar.setPageStep(self.visibleLineCount())
+        vbar.setRange(0, max(0, self.lineCount() - self.visibleLineCount()))
+        self._updateColumnRange()
+        self.updateLineNumberAreaWidth()
+
+    def _updateColumnRange(self):
+        """The horizontal scroll bar counts columns (bytes), not pixels."""
+        hbar = self.horizontalScrollBar()
+        visible = self.visibleColumnCount()
+        hbar.setPageStep(visible)
+        hbar.setSingleStep(max(1, visible // 10))
+        hbar.setRange(0, max(0, self._max_columns + 1 - visible))
+
+    def lineNumberAreaWidth(self):
+        self._glyphs.update(self)
+        return 6 + self._glyphs.digit_width * len(str(max(1, self.lineCount())))
+
+    def updateLineNumberAreaWidth(self, font_changed=False):
+        digits = len(str(max(1, self.lineCount())))
+        if digits != self._gutter_digits or font_changed:
+            self._gutter_digits = digits
+            self.setViewportMargins(self.lineNumberAreaWidth(), 0, 0, 0)
+            self._placeLineNumberArea()
+
+    def _placeLineNumberArea(self):
+        cr = self.contentsRect()
+        self.lineNumberArea.setGeometry(QRect(cr.left(), cr.top(),
+                                              self.lineNumberAreaWidth(), cr.height()))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._placeLineNumberArea()
+        self._updateScrollRange()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+        if dy:
+            self.lineNumberArea.update()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        font_change = QEvent.Type.FontChange if USING_QT6 else QEvent.FontChange
+        if event.type() == font_change:
+            self.updateLineNumberAreaWidth(font_changed=True)
+            self._updateScrollRange()
+
+    @traced("huge.gutter_paint")
+    def lineNumberAreaPaintEvent(self, event):
+        painter = QPainter(self.lineNumberArea)
+        rect = event.rect()
+        painter.fillRect(rect, QColor("#f5f5f5"))
+        self._glyphs.update(self)
+        height = self.fontMetrics().height()
+        first = self.verticalScrollBar().value()
+        right = self.lineNumberArea.width() - 4
+        # Only the rows intersecting the exposed rect.
+        for row in range(max(0, rect.top() // height), rect.bottom() // height + 1):
+            number = first + row + 1
+            if number > self.lineCount():
+                break
+            self._glyphs.draw(painter, right, row * height, number)
+
+    @traced("huge.paint")
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.fillRect(event.rect(), QColor("#ffffff"))
+        if self.mm is None:
+            return
+        fm = self.fontMetrics()
+        height = fm.height()
+        first = self.verticalScrollBar().value()
+        column = self.horizontalScrollBar().value()
+        count = self.visibleColumnCount() + 2
+        cw = self.columnWidth()
+        pos = self.lineOffset(first)
+        row = 0
+        longest = self._max_columns
+        painter.setPen(QColor("#111111"))
+        while pos >= 0 and pos <= len(self.mm) and row * height < self.viewport().height():
+            line = first + row
+            if line >= self.lineCount():
+                break
+            start = pos
+            text, length, pos = self.lineSegment(start, column, count)
+            if line == self.current_line:
+                painter.fillRect(0, row * height, self.viewport().width(), height,
+                                 QColor("#e9f2ff"))
+            if self.match is not None and start <= self.match[0] <= start + length:
+                left = self.match[0] - start - column
+                painter.fillRect(4 + left * cw, row * height,
+                                 (self.match[1] - self.match[0]) * cw, height, QColor("#fff59d"))
+            painter.drawText(4, row * height + fm.ascent(), text)
+            longest = max(longest, length)
+            row += 1
+        if longest > self._max_columns:
+            self._max_columns = longest
+            self._updateColumnRange()
+
+
+# ---- Bulk Replace Engine ----
+def utf16_position_map(text):
+    """
+    Return a function mapping Python string indices to QTextDocument
+    positions, which count UTF-16 code units.
+    """
+    astral = [m.start() for m in re.finditer('[\U00010000-\U0010FFFF]', text)]
+    if not astral:
+        return lambda index: index
+    return lambda index: index + bisect.bisect_left(astral, index)
+
+
+def apply_replacements(document, text, edits, per_span_limit=1000, history=None):
+    """
+    Apply `edits` (computed against `text`) to `document` as one undo step
+    of `history`. Few edits are applied span by span; many are folded into
+    a single replacement of the region between the first and last match.
+    """
+    if not edits:
+        return
+    to_doc = utf16_position_map(text)
+    if history is not None:
+        first, last = edits[0][0], edits[-1][1]
+        history.capture(to_doc(first), to_doc(last), text[first:last])
+    keep = QTextCursor.MoveMode.KeepAnchor if USING_QT6 else QTextCursor.KeepAnchor
+    cursor = QTextCursor(document)
+    cursor.beginEditBlock()
+    try:
+        if len(edits) <= per_span_limit:
+            for start, end, new in reversed(edits):
+                cursor.setPosition(to_doc(start))
+                cursor.setPosition(to_doc(end), keep)
+                cursor.insertText(new)
+        else:
+            pieces = []
+            prev = edits[0][0]
+            for start, end, new in edits:
+                pieces.append(text[prev:start])
+                pieces.append(new)
+                prev = end
+            cursor.setPosition(to_doc(edits[0][0]))
+            cursor.setPosition(to_doc(prev), keep)
+            cursor.insertText(''.join(pieces))
+    finally:
+        cursor.endEditBlock()
+
+
+class ReplaceAllWorker(QThread):
+    """Run find_replacements off the GUI thread for very large documents."""
+    progress = pyqtSignal(float)
+
+    def __init__(self, text, search, replacement, regex, parent=None):
+        super().__init__(parent)
+        self.text = text
+        self.search = search
+        self.replacement = replacement
+        self.regex = regex
+        self.edits = None
+        self.error = None
+
+    @traced("search.replace_scan")
+    def run(self):
+        try:
+            self.edits = find_replacements(self.text, self.search, self.replacement, self.regex,
+                                           progress=self.progress.emit,
+                                           cancelled=self.isInterruptionRequested)
+        except Exception as e:
+            self.error = str(e)
+
+
+# ---- Match Index (incremental search) ----
+class MatchIndex:
+    """
+    Sorted, non-empty, non-overlapping match spans (document positions).
+    Spans live in small buckets that each carry a position offset, so an edit
+    shifts every later match in O(buckets) and lookups stay O(log n).
+    """
+    BUCKET = 512
+
+    def __init__(self, starts=(), ends=()):
+        self._starts = []    # per bucket: array('q') of start - offset
+        self._ends = []
+        self._offsets = []
+        self._firsts = []    # current position of each bucket's first start
+        self._cum = None     # spans before each bucket, rebuilt lazily
+        self.total = 0
+        self._splice(0, 0, array('q', starts), array('q', ends))
+
+    def __len__(self):
+        return self.total
+
+    def _splice(self, bi, bj, starts, ends):
+        """Replace buckets [bi, bj) by re-bucketed absolute `starts`/`ends`."""
+        new_starts, new_ends = [], []
+        for k in range(0, len(starts), self.BUCKET):
+            new_starts.append(starts[k:k + self.BUCKET])
+            new_ends.append(ends[k:k + self.BUCKET])
+        self.total += len(starts) - sum(len(b) for b in self._starts[bi:bj])
+        self._starts[bi:bj] = new_starts
+        self._ends[bi:bj] = new_ends
+        self._offsets[bi:bj] = [0] * len(new_starts)
+        self._firsts[bi:bj] = [b[0] for b in new_starts]
+        self._cum = None
+        return bi + len(new_starts)
+
+    def replaceRange(self, lo, hi, delta, new_starts=(), new_ends=()):
+        """
+        Drop spans overlapping [lo, hi), shift spans starting at or after `hi`
+        by `delta` and insert the sorted new spans (final positions).
+        """
+        bi = max(0, bisect.bisect_right(self._firsts, lo) - 1)
+        bj = bisect.bisect_right(self._firsts, hi)
+        starts, ends = array('q'), array('q')
+        tail_starts, tail_ends = array('q'), array('q')
+        for b in range(bi, min(bj, len(self._starts))):
+            off = self._offsets[b]
+            for s, e in zip(self._starts[b], self._ends[b]):
+                s += off
+                e += off
+                if e <= lo:
+                    starts.append(s)
+                    ends.append(e)
+                elif s >= hi:
+                    tail_starts.append(s + delta)
+                    tail_ends.append(e + delta)
+        starts.extend(new_starts)
+        ends.extend(new_ends)
+        starts.extend(tail_starts)
+        ends.extend(tail_ends)
+        for b in range(self._splice(bi, bj, starts, ends), len(self._starts)):
+            self._offsets[b] += delta
+            self._firsts[b] += delta
+
+    def _cumulative(self):
+        if self._cum is None:
+            cum, n = [], 0
+            for b in self._starts:
+                cum.append(n)
+                n += len(b)
+            self._cum = cum
+        return self._cum
+
+    def countBefore(self, pos):
+        """Number of spans starting before `pos`."""
+        b = bisect.bisect_right(self._firsts, pos - 1) - 1
+        if b < 0:
+            return 0
+        return self._cumulative()[b] + bisect.bisect_left(self._starts[b], pos - self._offsets[b])
+
+    def span(self, k):
+        """Return the (start, end) of the k-th span."""
+        b = bisect.bisect_right(self._cumulative(), k) - 1
+        i = k - self._cum[b]
+        off = self._offsets[b]
+        return self._starts[b][i] + off, self._ends[b][i] + off
+
+
+def scan_matches(text, search, base=0):
+    """Return array('q') starts/ends of non-empty matches as document positions."""
+    to_doc = utf16_position_map(text)
+    starts, ends = array('q'), array('q')
+    for m in search.finditer(text):
+        if m.end() > m.start():
+            starts.append(base + to_doc(m.start()))
+            ends.append(base + to_doc(m.end()))
+    return starts, ends
+
+
+class MatchScanner(QThread):
+    """Build the full match list of a document snapshot off the GUI thread."""
+    def __init__(self, text, search, parent=None):
+        super().__init__(parent)
+        self.text = text
+        self.search = search
+        self.starts = None
+        self.ends = None
+
+    @traced("search.count_scan")
+    def run(self):
+        to_doc = utf16_position_map(self.text)
+        starts, ends = array('q'), array('q')
+        for n, m in enumerate(self.search.finditer(self.text)):
+            if m.end() > m.start():
+                starts.append(to_doc(m.start()))
+                ends.append(to_doc(m.end()))
+            if n % 4096 == 4095 and self.isInterruptionRequested():
+                return
+        self.text = None
+        self.starts, self.ends = starts, ends
+
+
+class FileSaver(QThread):
+    """
+    Encode and write a snapshot of the document text (QTextDocument.toRawText,
+    blocks separated by U+2029) a chunk at a time in a worker thread.
+    """
+    CHUNK_CHARS = 1024 * 1024
+
+    progress = pyqtSignal(float)
+    failed = pyqtSignal(str)
+
+    def __init__(self, text, filepath, encoding='utf-8', bom=False, eol='\n', parent=None):
+        super().__init__(parent)
+        self.text = text
+        self.filepath = filepath
+        self.encoding = encoding
+        self.bom = bom
+        self.eol = eol
+
+    def texts(self):
+        text = self.text
+        total = max(1, len(text))
+        for start in range(0, len(text), self.CHUNK_CHARS):
+            yield text[start:start + self.CHUNK_CHARS].replace('\u2029', '\n')
+            self.progress.emit(min(1.0, (start + self.CHUNK_CHARS) / total))
+
+    def chunks(self):
+        return encode_text(self.texts(), self.encoding, self.bom, self.eol)
+
+    def run(self):
+        try:
+            write_atomically(self.filepath, self.chunks())
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+# ---- Crash Recovery Journal ----
+JOURNAL_DIR = (os.environ.get("METAPAD_JOURNAL_DIR")
+               or os.path.join(os.path.expanduser("~"), ".cache", "metapad", "journal"))
+JOURNAL_NAME = re.compile(r'(\d+)-\d+\.journal$')
+
+
+def encode_records(records):
+    """One JSON object per line; ASCII-only so lone surrogates survive."""
+    return b''.join(json.dumps(r, separators=(',', ':')).encode('ascii') + b'\n'
+                    for r in records)
+
+
+def read_journal(path):
+    """
+    Return (header, snapshot, deltas) from a journal file. `snapshot` is None
+    when the deltas apply to the file named in the header. A torn last line
+    (a crash mid-append) is ignored.
+    """
+    header, snapshot, deltas = None, None, []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if header is None:
+                header = record
+            elif 'snapshot' in record:
+                snapshot, deltas = record['snapshot'], []
+            else:
+                deltas.append((record['p'], record['r'], record['t']))
+    if not header or header.get('metapad_journal') != 1:
+        raise ValueError("not a Metapad journal")
+    return header, snapshot, deltas
+
+
+def stale_journals():
+    """Journals left behind by Metapad processes that are no longer running."""
+    try:
+        names = os.listdir(JOURNAL_DIR)
+    except OSError:
+        return []
+    stale = []
+    for name in sorted(names):
+        m = JOURNAL_NAME.match(name)
+        if not m:
+            continue
+        pid = int(m.group(1))
+        if pid == os.getpid():
+            continue
+        if os.name == 'posix':
+            try:
+                os.kill(pid, 0)
+                continue  # still running
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+        stale.append(os.path.join(JOURNAL_DIR, name))
+    return stale
+
+
+class JournalWriter(QThread):
+    """Performs journal file operations, in order, off the GUI thread."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.ops = queue.Queue()
+
+    def append(self, path, records):
+        self.ops.put(('append', path, records))
+
+    def replace(self, path, records):
+        self.ops.put(('replace', path, records))
+
+    def remove(self, path):
+        self.ops.put(('remove', path, None))
+
+    def stop(self):
+        self.ops.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            op = self.ops.get()
+            if op is None:
+                return
+            kind, path, records = op
+            try:
+                if kind != 'remove':
+                    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+                if kind == 'append':
+                    with open(path, 'ab') as f:
+                        f.write(encode_records(records))
+                        f.flush()
+                        os.fsync(f.fileno())
+                elif kind == 'replace':
+                    write_atomically(path, [encode_records(records)])
+                else:
+                    os.remove(path)
+            except OSError:
+                pass  # recovery is best effort; it must never disturb editing
+
+
+class EditJournal(QObject):
+    """
+    Crash-recovery log for one editor. The edits reported by contentsChange
+    are appended as small deltas against a base (the file on disk, or a
+    snapshot at the head of the journal), so the disk cost follows the
+    edits, not the document size. When the deltas outgrow the document the
+    journal is compacted into a fresh snapshot.
+    """
+    FLUSH_MS = 500
+    COMPACT_MIN_BYTES = 1024 * 1024
+    _serial = 0
+
+    def __init__(self, editor, writer, parent=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.writer = writer
+        EditJournal._serial += 1
+        self.path = os.path.join(JOURNAL_DIR, f"{os.getpid()}-{EditJournal._serial}.journal")
+        self.recording = False
+        self.filepath = None
+        self.base = None        # stat of the file the deltas apply to, if any
+        self.exists = False     # journal file written
+        self.pending = []
+        self.written = 0        # approximate bytes of deltas since the last snapshot
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FLUSH_MS)
+        self.flush_timer.timeout.connect(self.flush)
+        editor.document().contentsChange.connect(self._onContentsChange)
+
+    def start(self, filepath=None, clean=True):
+        """Record edits from now on; `clean` means the text matches `filepath` on disk."""
+        self.discard()
+        self.filepath = filepath
+        self.base = None
+        if filepath and clean:
+            try:
+                st = os.stat(filepath)
+                self.base = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+            except OSError:
+                pass
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+        self.discard()
+
+    def discard(self):
+        """Forget everything journaled so far (the document is safe on disk)."""
+        self.pending = []
+        self.flush_timer.stop()
+        self.written = 0
+        if self.exists:
+            self.writer.remove(self.path)
+            self.exists = False
+
+    def header(self, base):
+        editor = self.editor
+        return {'metapad_journal': 1, 'file': self.filepath, 'base': base,
+                'encoding': editor.encoding, 'bom': editor.bom, 'eol': editor.eol}
+
+    def _onContentsChange(self, pos, removed, added):
+        if not self.recording:
+            return
+        text = ''
+        if added:
+            doc = self.editor.document()
+            cursor = QTextCursor(doc)
+            cursor.setPosition(pos)
+            end = min(pos + added, doc.characterCount() - 1)
+            if USING_QT6:
+                cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+            else:
+                cursor.setPosition(end, QTextCursor.KeepAnchor)
+            text = cursor.selectedText().replace('\u2029', '\n')
+        self.pending.append({'p': pos, 'r': removed, 't': text})
+        self.written += len(text) + 24
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush(self):
+        if not self.pending:
+            return
+        limit = max(self.COMPACT_MIN_BYTES, 2 * self.editor.document().characterCount())
+        if (not self.exists and self.base is None) or self.written > limit:
+            self.compact()
+            return
+        records, self.pending = self.pending, []
+        if not self.exists:
+            records.insert(0, self.header(self.base))
+            self.exists = True
+        self.writer.append(self.path, records)
+
+    def compact(self):
+        """Rewrite the journal as a single snapshot of the current text."""
+        self.pending = []
+        self.flush_timer.stop()
+        self.writer.replace(self.path, [self.header(None),
+                                        {'snapshot': self.editor.rawText()}])
+        self.exists = True
+        self.written = 0
+
+
+# ---- Undo History (bounded, spills to disk) ----
+def utf16_len(text):
+    """Length of `text` in QTextDocument positions (UTF-16 code units)."""
+    return len(text) if text.isascii() else len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+
+class UndoHistory(QObject):
+    """
+    Undo/redo for one editor, replacing the document's own stack, which can
+    neither be bounded nor trimmed. A step is the list of [position,
+    removed, inserted] edits made by one action; consecutive keystrokes
+    merge into one edit. contentsChange only reports what was removed after
+    it is gone, so the editing entry points capture() the text around the
+    cursor first. At most UNDO_MAX_STEPS steps or UNDO_MAX_BYTES of text
+    stay in memory; older steps spill to a temporary file.
+    """
+    CAPTURE_CHARS = 4096      # text captured on each side of the selection
+    COALESCE_SECONDS = 1.0    # a pause in typing starts a new step
+
+    def __init__(self, editor, parent=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.undo_stack = UndoStack(UNDO_MAX_STEPS, UNDO_MAX_BYTES, UNDO_SPILL)
+        self.redo_stack = UndoStack(UNDO_MAX_STEPS, UNDO_MAX_BYTES, UNDO_SPILL)
+        self.recording = True
+        self.applying = False
+        self.region = None      # (position, UTF-16 bytes) of the text about to be edited
+        self.step = None        # step still collecting the edits of the current action
+        self.typing = None      # step that further keystrokes may merge into
+        self.last_edit = 0.0
+        self.position = 0       # steps applied since the history started
+        self.clean = 0          # position at which the document was saved, -1 if lost
+
+        self.close_timer = QTimer(self)
+        self.close_timer.setSingleShot(True)
+        self.close_timer.setInterval(0)
+        self.close_timer.timeout.connect(self.closeStep)
+        doc = editor.document()
+        doc.setUndoRedoEnabled(False)
+        doc.contentsChange.connect(self._onContentsChange)
+        doc.modificationChanged.connect(self._onModificationChanged)
+
+    def start(self):
+        """Record edits from now on, starting from an empty history."""
+        self.clear()
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+        self.clear()
+
+    def clear(self):
+        self.close_timer.stop()
+        self.region = self.step = self.typing = None
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.position = 0
+        self.clean = -1 if self.editor.document().isModified() else 0
+
+    def memoryUsage(self):
+        return self.undo_stack.bytes + self.redo_stack.bytes
+
+    def _text(self, start, end):
+        cursor = QTextCursor(self.editor.document())
+        cursor.setPosition(start)
+        if USING_QT6:
+            cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        else:
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+        return cursor.selectedText().replace('\u2029', '\n')
+
+    def capture(self, start=None, end=None, text=None):
+        """
+        Remember the text between `start` and `end` (by default the selection
+        and CAPTURE_CHARS around it) before it is edited; `text` saves
+        reading it back when the caller already has it.
+        """
+        if not self.recording or self.applying:
+            return
+        last = self.editor.document().characterCount() - 1
+        if start is None:
+            cursor = self.editor.textCursor()
+            start = cursor.selectionStart() - self.CAPTURE_CHARS
+            end = cursor.selectionEnd() + self.CAPTURE_CHARS
+        start, end = max(0, start), min(max(start, end), last)
+        if text is None:
+            text = self._text(start, end)
+        self.region = (start, text.encode('utf-16-le', 'surrogatepass'))
+
+    def _onContentsChange(self, pos, removed, added):
+        if not self.recording or self.applying:
+            return
+        # Leave out the paragraph separator that always ends the document.
+        count = self.editor.document().characterCount()
+        removed = max(0, min(removed, count - added + removed - 1 - pos))
+        added = max(0, min(added, count - 1 - pos))
+        if not removed and not added:
+            return
+
+        region = self.region
+        if region is not None:
+            start, old = region
+            end = start + len(old) // 2
+            if removed and pos < start and pos + removed > end and removed - added <= end - start:
+                # Qt may report a change wider than the edit; the text
+                # around the captured region is unchanged.
+                lead, trail = start - pos, pos + removed - end
+                pos, removed, added = start, end - start, added - lead - trail
+        inserted = self._text(pos, pos + added) if added else ''
+        removed_text = ''
+        if region is not None:
+            if start <= pos and pos + removed <= end:
+                offset = 2 * (pos - start)
+                removed_text = old[offset:offset + 2 * removed].decode('utf-16-le', 'surrogatepass')
+                self.region = (start, old[:offset] + inserted.encode('utf-16-le', 'surrogatepass')
+                               + old[offset + 2 * removed:])
+            elif pos + removed <= start:
+                self.region = (start + added - removed, old)
+            elif pos < end:
+                self.region = None
+        if removed and not removed_text:
+            # The removed text was never captured: it cannot be restored, so
+            # no earlier step can be undone correctly either.
+            self.clear()
+            return
+        if removed_text == inserted:
+            return  # only the formatting changed
+        self._record([pos, removed_text, inserted])
+
+    def _record(self, edit):
+        self.redo_stack.clear()
+        if self.clean > self.position:
+            self.clean = -1  # the saved state was undone and is now unreachable
+        if self.step is not None:
+            self.step.append(edit)
+            self.undo_stack.grow(step_size([edit]))
+            self.typing = None
+        elif not self._coalesce(edit):
+            self.step = [edit]
+            self.undo_stack.push(self.step)
+            self.position += 1
+            _pos, removed, inserted = edit
+            small = len(removed) + len(inserted) <= 2 and '\n' not in removed + inserted
+            self.typing = self.step if small else None
+        if not self.close_timer.isActive():
+            self.close_timer.start()
+
+    def _coalesce(self, edit):
+        """Merge a keystroke into the previous one; return True if it was merged."""
+        pos, removed, inserted = edit
+        top = self.undo_stack.top()
+        if (top is None or top is not self.typing or self.clean == self.position
+                or time.monotonic() - self.last_edit > self.COALESCE_SECONDS
+                or len(removed) + len(inserted) > 2 or '\n' in removed + inserted):
+            return False
+        prev = top[0]
+        if not removed and not prev[1] and pos == prev[0] + utf16_len(prev[2]):
+            prev[2] += inserted                     # typing on
+        elif not inserted and not prev[2] and pos + utf16_len(removed) == prev[0]:
+            prev[0], prev[1] = pos, removed + prev[1]  # Backspace
+        elif not inserted and not prev[2] and pos == prev[0]:
+            prev[1] += removed                      # Delete
+        else:
+            return False
+        self.undo_stack.grow(2 * (len(removed) + len(inserted)))
+        self.step = top
+        return True
+
+    def closeStep(self):
+        """End the current step; runs once the event that made the edits is handled."""
+        self.close_timer.stop()
+        if self.step is not None:
+            self.last_edit = time.monotonic()
+        self.step = self.region = None
+        self.undo_stack.trim()
+
+    def _onModificationChanged(self, modified):
+        if not modified:
+            self.clean = self.position
+
+    def undo(self):
+        self._apply(self.undo_stack, self.redo_stack, undo=True)
+
+    def redo(self):
+        self._apply(self.redo_stack, self.undo_stack, undo=False)
+
+    def _apply(self, source, target, undo):
+        if not self.recording or self.editor.isReadOnly():
+            return
+        self.closeStep()
+        self.typing = None
+        step = source.pop()
+        if step is None:
+            return
+        doc = self.editor.document()
+        keep = QTextCursor.MoveMode.KeepAnchor if USING_QT6 else QTextCursor.KeepAnchor
+        cursor = QTextCursor(doc)
+        self.applying = True
+        cursor.beginEditBlock()
+        try:
+            for pos, removed, inserted in (reversed(step) if undo else step):
+                old, new = (inserted, removed) if undo else (removed, inserted)
+                cursor.setPosition(pos)
+                cursor.setPosition(pos + utf16_len(old), keep)
+                cursor.insertText(new)
+        finally:
+            cursor.endEditBlock()
+            self.applying = False
+        target.push(step)
+        target.trim()
+        self.position += -1 if undo else 1
+        doc.setModified(self.position != self.clean)
+        self.editor.setTextCursor(cursor)
+        self.editor.ensureCursorVisible()
+
+
+# ---- Printing (off the GUI thread, paginated on demand) ----
+class Paginator:
+    """
+    Splits a document into pages of whole wrapped lines for a paint device.
+    Blocks are laid out only as far as the requested pages reach and page
+    starts are kept, so printing pages 10-12 never lays out the rest and a
+    preview refresh reuses the work already done.
+    """
+
+    def __init__(self, document, font, device):
+        self.document = document
+        self.font = QFont(font)
+        self.device = device
+        rect = device.pageLayout().paintRectPixels(device.resolution())
+        self.width = rect.width()
+        self.line_height = QFontMetricsF(self.font, device).lineSpacing()
+        self.lines_per_page = max(1, int(rect.height() // self.line_height))
+        self.option = QTextOption()
+        self.option.setWrapMode(QTextOption.WrapMode.WrapAtWordBoundaryOrAnywhere if USING_QT6
+                                else QTextOption.WrapAtWordBoundaryOrAnywhere)
+        self.starts = [(0, 0)]   # (block number, first wrapped line) of each known page
+        self.complete = False
+        # Where pagination stopped
+        self._block = document.firstBlock()
+        self._line = 0           # next wrapped line of _block to place
+        self._count = None       # wrapped lines in _block
+        self._used = 0           # lines used on the last known page
+
+    def layout(self, block):
+        layout = QTextLayout(block.text(), self.font, self.device)
+        layout.setTextOption(self.option)
+        layout.beginLayout()
+        y = 0.0
+        while True:
+            line = layout.createLine()
+            if not line.isValid():
+                break
+            line.setLineWidth(self.width)
+            line.setPosition(QPointF(0, y))
+            y += self.line_height
+        layout.endLayout()
+        return layout
+
+    @traced("print.paginate")
+    def paginate(self, pages=None):
+        """Find the start of page index `pages` (every page when None), if it exists."""
+        while not self.complete and (pages is None or len(self.starts) <= pages):
+            if not self._block.isValid():
+                self.complete = True
+                break
+            if self._count is None:
+                self._count = max(1, self.layout(self._block).lineCount())
+            if self._used == self.lines_per_page:
+                self.starts.append((self._block.blockNumber(), self._line))
+                self._used = 0
+            take = min(self._count - self._line, self.lines_per_page - self._used)
+            self._used += take
+            self._line += take
+            if self._line == self._count:
+                self._block = self._block.next()
+                self._line = 0
+                self._count = None
+
+    def pageCount(self):
+        self.paginate()
+        return len(self.starts)
+
+    def paintPage(self, painter, index):
+        block_number, line = self.starts[index]
+        block = self.document.findBlockByNumber(block_number)
+        y, rows = 0.0, 0
+        while rows < self.lines_per_page and block.isValid():
+            layout = self.layout(block)
+            for i in range(line, layout.lineCount()):
+                if rows == self.lines_per_page:
+                    break
+                text_line = layout.lineAt(i)
+                text_line.draw(painter, QPointF(0, y - text_line.y()))
+                y += self.line_height
+                rows += 1
+            block = block.next()
+            line = 0
+
+
+@traced("print.render")
+def render_pages(paginator, printer, first=1, last=0, progress=None, cancelled=None):
+    """
+    Paint pages `first`..`last` (1-based, inclusive; `last` 0 means to the
+    end) onto `printer`. Returns the number of pages painted.
+    """
+    painter = QPainter()
+    if not painter.begin(printer):
+        raise OSError("Cannot start printing (is the output writable?)")
+    painted = 0
+    try:
+        index = first - 1
+        while last == 0 or index < last:
+            paginator.paginate(index)
+            if index >= len(paginator.starts):
+                break
+            if painted:
+                printer.newPage()
+            painter.setPen(QColor("black"))  # ink, whatever the editor theme
+            paginator.paintPage(painter, index)
+            painted += 1
+            index += 1
+            if progress is not None:
+                progress(painted)
+            if cancelled is not None and cancelled():
+                break
+    finally:
+        painter.end()
+    return painted
+
+
+class PrintJob(QThread):
+    """Paginate and paint a document snapshot onto a printer (or PDF) in a worker thread."""
+    progress = pyqtSignal(int)   # pages painted so far
+    failed = pyqtSignal(str)
+
+    def __init__(self, snapshot, font, printer, parent=None):
+        super().__init__(parent)
+        self.snapshot = snapshot
+        self.font = font
+        self.printer = printer
+        self.pages = 0
+
+    def run(self):
+        try:
+            paginator = Paginator(self.snapshot, self.font, self.printer)
+            self.pages = render_pages(paginator, self.printer, max(1, self.printer.fromPage()),
+                                      self.printer.toPage(), progress=self.progress.emit,
+                                      cancelled=self.isInterruptionRequested)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+# ---- Find & Replace Dialog ----
+class FindReplaceDialog(QDialog):
+    # Replace All scans documents larger than this (characters) in a worker.
+    WORKER_THRESHOLD = 4 * 1024 * 1024
+
+    def __init__(self, parent=None, editor=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.replace_worker = None
+
+        # Incremental search state
+        self.search = None          # compiled query, None when inactive
+        self.match_index = None     # MatchIndex once the scan has finished
+        self.scan_worker = None
+        self.pending_edits = []     # edits made while the scan was running
+        self.dirty_ranges = []      # regions to rescan, in current positions
+
+        self.setWindowTitle("Find & Replace")
+        self.setModal(False)
+        self.setupUI()
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(120)
+        self.search_timer.timeout.connect(self.start_search)
+        self.rescan_timer = QTimer(self)
+        self.rescan_timer.setSingleShot(True)
+        self.rescan_timer.setInterval(50)
+        self.rescan_timer.timeout.connect(self.rescan_dirty)
+
+        self.connect_editor(True)
+
+    def connect_editor(self, connect):
+        doc, scrollbar = self.editor.document(), self.editor.verticalScrollBar()
+        for signal, slot in ((doc.contentsChange, self.on_contents_change),
+                             (scrollbar.valueChanged, self.highlight_visible_matches),
+                             (self.editor.cursorPositionChanged, self.update_counter)):
+            if connect:
+                signal.connect(slot)
+            else:
+                signal.disconnect(slot)
+
+    def set_editor(self, editor):
+        """Follow the editor of the current tab."""
+        if editor is self.editor:
+            return
+        self.connect_editor(False)
+        self.editor.setExtraSelectionGroup("search", [])
+        self.editor.ruler.setMatches(None)
+        self.editor = editor
+        self.connect_editor(True)
+        self.start_search()
+
+    def setupUI(self):
+        layout = QVBoxLayout()
+
+        # Find input
+        find_layout = QHBoxLayout()
+        find_label = QLabel("Find:")
+        self.find_input = QLineEdit()
+        find_layout.addWidget(find_label)
+        find_layout.addWidget(self.find_input)
+        layout.addLayout(find_layout)
+
+        # Replace input
+        replace_layout = QHBoxLayout()
+        replace_label = QLabel("Replace:")
+        self.replace_input = QLineEdit()
+        replace_layout.addWidget(replace_label)
+        replace_layout.addWidget(self.replace_input)
+        layout.addLayout(replace_layout)
+
+        # Match case / regex checkboxes
+        options_layout = QHBoxLayout()
+        self.match_case_checkbox = QCheckBox("Match case")
+        self.regex_checkbox = QCheckBox("Regular expression")
+        options_layout.addWidget(self.match_case_checkbox)
+        options_layout.addWidget(self.regex_checkbox)
+        layout.addLayout(options_layout)
+
+        # Buttons
+        button_layout = QHBoxLayout()
+        self.find_prev_button = QPushButton("Previous")
+        self.find_button = QPushButton("Find Next")
+        self.replace_button = QPushButton("Replace")
+        self.replace_all_button = QPushButton("Replace All")
+        button_layout.addWidget(self.find_prev_button)
+        button_layout.addWidget(self.find_button)
+        button_layout.addWidget(self.replace_button)
+        button_layout.addWidget(self.replace_all_button)
+        layout.addLayout(button_layout)
+
+        # Match counter ("N of M")
+        self.counter_label = QLabel("")
+        layout.addWidget(self.counter_label)
+
+        self.setLayout(layout)
+        self.setFixedSize(460, 200)
+
+        # Signals
+        self.find_input.textChanged.connect(lambda _: self.search_timer.start())
+        self.match_case_checkbox.toggled.connect(lambda _: self.search_timer.start())
+        self.regex_checkbox.toggled.connect(lambda _: self.search_timer.start())
+        self.find_prev_button.clicked.connect(self.find_previous)
+        self.find_button.clicked.connect(self.find_next)
+        self.replace_button.clicked.connect(self.replace_one)
+        self.replace_all_button.clicked.connect(self.replace_all)
+
+    def find_flags(self):
+        """Return flags for QPlainTextEdit.find, cross-version safe."""
+        if USING_QT6:
+            flags = QTextDocument.FindFlag(0)
+            if self.match_case_checkbox.isChecked():
+                flags |= QTextDocument.FindFlag.FindCaseSensitively
+            return flags
+        else:
+            flags = QTextDocument.FindFlags()
+            if self.match_case_checkbox.isChecked():
+                flags |= QTextDocument.FindCaseSensitively
+            return flags
+
+    def find_query(self, text):
+        """Return what QPlainTextEdit.find should look for: text or a regex."""
+        if not self.regex_checkbox.isChecked():
+            return text
+        if USING_QT6:
+            regex = QRegularExpression(text)
+            if not self.match_case_checkbox.isChecked():
+                regex.setPatternOptions(
+                    QRegularExpression.PatternOption.CaseInsensitiveOption)
+        else:
+            regex = QRegExp(text)
+            regex.setCaseSensitivity(Qt.CaseSensitive if self.match_case_checkbox.isChecked()
+                                     else Qt.CaseInsensitive)
+        return regex
+
+    def compiled_search(self):
+        return compile_search(self.find_input.text(),
+                              regex=self.regex_checkbox.isChecked(),
+                              case_sensitive=self.match_case_checkbox.isChecked())
+
+    # ---- Incremental search ----
+    @traced("search.start")
+    def start_search(self):
+        """(Re)start highlighting and counting for the current query."""
+        if self.scan_worker is not None:
+            self.scan_worker.requestInterruption()
+            self.scan_worker = None
+        self.match_index = None
+        self.pending_edits = []
+        self.dirty_ranges = []
+        self.search = None
+        self.editor.ruler.setMatches(None)
+        text = self.find_input.text()
+        error = ""
+        if text and self.isVisible():
+            try:
+                self.search = self.compiled_search()
+            except re.error:
+                error = "Invalid regular expression"
+        self.highlight_visible_matches()
+        if self.search is None:
+            self.counter_label.setText(error)
+            return
+
+        self.counter_label.setText("Counting matches...")
+        self.scan_worker = MatchScanner(self.editor.rawText(), self.search, self)
+        self.scan_worker.finished.connect(self.on_scan_finished)
+        self.scan_worker.start()
+
+    def on_scan_finished(self):
+        worker = self.sender()
+        if worker is not None:
+            worker.deleteLater()
+        if worker is None or worker is not self.scan_worker:
+            return
+        self.scan_worker = None
+        self.match_index = MatchIndex(worker.starts, worker.ends)
+        for pos, removed, added in self.pending_edits:
+            self.match_index.replaceRange(pos, pos + removed, added - removed)
+        self.pending_edits = []
+        self.rescan_dirty()
+
+    def on_contents_change(self, pos, removed, added):
+        if self.search is None:
+            return
+        delta = added - removed
+        if self.match_index is None:
+            self.pending_edits.append((pos, removed, added))
+        else:
+            self.match_index.replaceRange(pos, pos + removed, delta)
+
+        lo, hi = pos, pos + added
+        ranges = []
+        for a, b in self.dirty_ranges:
+            if a > pos + removed:
+                ranges.append((a + delta, b + delta))
+            elif b < pos:
+                ranges.append((a, b))
+            else:
+                lo, hi = min(lo, a), max(hi, b + delta)
+        ranges.append((lo, hi))
+        ranges.sort()
+        self.dirty_ranges = ranges
+        self.rescan_timer.start()
+
+    @traced("search.rescan")
+    def rescan_dirty(self):
+        """Re-find matches in the edited blocks and patch them into the index."""
+        if self.match_index is None or self.search is None:
+            self.highlight_visible_matches()
+            return
+        doc = self.editor.document()
+        last = doc.characterCount() - 1
+        keep = QTextCursor.MoveMode.KeepAnchor if USING_QT6 else QTextCursor.KeepAnchor
+        for lo, hi in self.dirty_ranges:
+            lo = doc.findBlock(max(0, min(lo, last))).position()
+            end_block = doc.findBlock(max(0, min(hi, last)))
+            hi = min(last, end_block.position() + end_block.length() - 1)
+            cursor = QTextCursor(doc)
+            cursor.setPosition(lo)
+            cursor.setPosition(hi, keep)
+            region = cursor.selectedText().replace('\u2029', '\n')
+            starts, ends = scan_matches(region, self.search, lo)
+            self.match_index.replaceRange(lo, hi, 0, starts, ends)
+        self.dirty_ranges = []
+        self.editor.ruler.setMatches(self.match_index)
+        self.update_counter()
+        self.highlight_visible_matches()
+
+    @traced("search.highlight_visible")
+    def highlight_visible_matches(self, *_):
+        """Mark the matches inside the viewport with extra selections."""
+        selections = []
+        if self.search is not None:
+            blocks = list(self.editor.visibleBlocks())
+            if blocks:
+                lo = blocks[0].position()
+                text = '\n'.join(block.text() for block in blocks)
+                starts, ends = scan_matches(text, self.search, lo)
+                for start, end in zip(starts, ends):
+                    sel = QTextEdit.ExtraSelection()
+                    sel.format.setBackground(QColor("#fff3a3"))
+                    sel.cursor = QTextCursor(self.editor.document())
+                    sel.cursor.setPosition(start)
+                    sel.cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor
+                                           if USING_QT6 else QTextCursor.KeepAnchor)
+                    selections.append(sel)
+        self.editor.setExtraSelectionGroup("search", selections)
+
+    def update_counter(self):
+        index = self.match_index
+        if index is None:
+            return
+        cursor = self.editor.textCursor()
+        k = index.countBefore(cursor.selectionStart())
+        if (cursor.hasSelection() and k < len(index)
+                and index.span(k) == (cursor.selectionStart(), cursor.selectionEnd())):
+            self.counter_label.setText(f"{k + 1:,} of {len(index):,}")
+        else:
+            self.counter_label.setText(f"{len(index):,} matches")
+
+    def select_match(self, k):
+        start, end = self.match_index.span(k)
+        cursor = self.editor.textCursor()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor
+                           if USING_QT6 else QTextCursor.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.update_counter()
+
+    def index_ready(self):
+        return (self.match_index is not None and not self.dirty_ranges
+                and self.search is not None and self.find_input.text())
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.start_search()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.start_search()  # not visible: clears highlights and the index
+
+    @traced("search.find_next")
+    def find_next(self):
+        text = self.find_input.text()
+        if text and self.index_ready():
+            if len(self.match_index):
+                k = self.match_index.countBefore(self.editor.textCursor().selectionEnd())
+                self.select_match(k if k < len(self.match_index) else 0)
+        elif text:
+            query = self.find_query(text)
+            if not self.editor.find(query, self.find_flags()):
+                cursor = self.editor.textCursor()
+                if USING_QT6:
+                    cursor.movePosition(QTextCursor.MoveOperation.Start)
+                else:
+                    cursor.movePosition(QTextCursor.Start)
+                self.editor.setTextCursor(cursor)
+                self.editor.find(query, self.find_flags())
+
+    @traced("search.find_previous")
+    def find_previous(self):
+        text = self.find_input.text()
+        if text and self.index_ready():
+            if len(self.match_index):
+                k = self.match_index.countBefore(self.editor.textCursor().selectionStart()) - 1
+                self.select_match(k if k >= 0 else len(self.match_index) - 1)
+        elif text:
+            query = self.find_query(text)
+            if USING_QT6:
+                flags = self.find_flags() | QTextDocument.FindFlag.FindBackward
+            else:
+                flags = self.find_flags() | QTextDocument.FindBackward
+            if not self.editor.find(query, flags):
+                cursor = self.editor.textCursor()
+                if USING_QT6:
+                    cursor.movePosition(QTextCursor.MoveOperation.End)
+                else:
+                    cursor.movePosition(QTextCursor.End)
+                self.editor.setTextCursor(cursor)
+                self.editor.find(query, flags)
+
+    def is_read_only(self, title):
+        """Cursor edits bypass read-only, so the dialog has to check it itself."""
+        if self.editor.isReadOnly():
+            QMessageBox.warning(self, title, "This document is read-only.", MB_OK)
+            return True
+        return False
+
+    def replace_one(self):
+        if self.is_read_only("Replace"):
+            return
+        text_find = self.find_input.text()
+        text_replace = self.replace_input.text()
+        cursor = self.editor.textCursor()
+
+        if not cursor.hasSelection() or not text_find:
+            self.find_next()
+            return
+
+        try:
+            match = self.compiled_search().fullmatch(cursor.selectedText())
+        except re.error as e:
+            QMessageBox.warning(self, "Replace", f"Invalid regular expression:\n{e}", MB_OK)
+            return
+        if match is not None:
+            if self.regex_checkbox.isChecked():
+                text_replace = match.expand(text_replace)
+            self.editor.history.capture()
+            cursor.insertText(text_replace)
+        self.find_next()
+
+    @traced("search.replace_all")
+    def replace_all(self):
+        text_find = self.find_input.text()
+        text_replace = self.replace_input.text()
+        if not text_find or self.replace_worker is not None:
+            return
+        if self.is_read_only("Replace All"):
+            return
+
+        try:
+            search = self.compiled_search()
+        except re.error as e:
+            QMessageBox.warning(self, "Replace All", f"Invalid regular expression:\n{e}", MB_OK)
+            return
+        regex = self.regex_checkbox.isChecked()
+        document = self.editor.document()
+        text = self.editor.rawText()
+
+        if len(text) < self.WORKER_THRESHOLD:
+            try:
+                edits = find_replacements(text, search, text_replace, regex)
+            except (re.error, IndexError) as e:
+                QMessageBox.warning(self, "Replace All", f"Invalid replacement:\n{e}", MB_OK)
+                return
+            self._finishReplaceAll(document, text, edits)
+            return
+
+        # Large document: scan in a worker behind a window-modal progress dialog
+        # so the text cannot change underneath it.
+        progress = QProgressDialog("Finding matches...", "Cancel", 0, 1000, self.parent() or self)
+        progress.setWindowTitle("Replace All")
+        progress.setWindowModality(Qt.WindowModality.WindowModal if USING_QT6 else Qt.WindowModal)
+        progress.setMinimumDuration(0)
+
+        worker = ReplaceAllWorker(text, search, text_replace, regex, self)
+        worker.progress.connect(lambda f: progress.setValue(int(f * 1000)))
+        progress.canceled.connect(worker.requestInterruption)
+
+        def done():
+            self.replace_worker = None
+            progress.reset()
+            progress.deleteLater()
+            worker.deleteLater()
+            if worker.error:
+                QMessageBox.warning(self, "Replace All", f"Invalid replacement:\n{worker.error}",
+                                    MB_OK)
+            elif worker.edits is not None:
+                self._finishReplaceAll(document, text, worker.edits)
+
+        worker.finished.connect(done)
+        self.replace_worker = worker
+        worker.start()
+
+    @traced("search.apply_replacements")
+    def _finishReplaceAll(self, document, text, edits):
+        if self.is_read_only("Replace All"):
+            return
+        apply_replacements(document, text, edits, history=self.editor.history)
+        QMessageBox.information(self, "Replace All",
+                                f"Replaced {len(edits)} occurrence(s).", MB_OK)
+
+
+# ---- Find in Files ----
+class FindInFilesWorker(QThread):
+    """
+    Search a folder tree in a small pool of threads (memory-mapped where the
+    file allows), sending results to the GUI in batches as they are found.
+    With the trigram index only files that can contain the query are read.
+    """
+    THREADS = 4
+    GROUP = 64            # files handed to the pool at a time
+    BATCH_SECONDS = 0.1
+    MAX_RESULTS = 20000
+
+    found = pyqtSignal(object)     # [(path, line, column, text)]
+    progress = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, root, pattern, regex, case_sensitive, use_index, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.pattern = pattern
+        self.regex = regex
+        self.case_sensitive = case_sensitive
+        self.use_index = use_index
+        self.files_searched = 0
+        self.files_matched = 0
+        self.matches = 0
+        self.truncated = False
+        self.error = None
+
+    def scan(self, path):
+        try:
+            return search_file(path, self.search, self.literal)
+        except (OSError, ValueError):
+            return []
+
+    @traced("search.files")
+    def run(self):
+        try:
+            self.search = compile_search(self.pattern, self.regex, self.case_sensitive)
+            self.literal = compile_literal(self.pattern, self.regex, self.case_sensitive)
+            if self.use_index:
+                self.progress.emit("Updating index...")
+                index = TrigramIndex(self.root)
+                index.load()
+                index.refresh(self.isInterruptionRequested)
+                index.save()
+                files = iter(index.candidates(
+                    query_trigrams(self.pattern, self.regex, self.case_sensitive)))
+            else:
+                files = (path for path, _mtime, _size in
+                         walk_files(self.root, self.isInterruptionRequested))
+            batch, sent = [], time.monotonic()
+            with ThreadPoolExecutor(self.THREADS) as pool:
+                while not self.isInterruptionRequested():
+                    group = list(itertools.islice(files, self.GROUP))
+                    if not group:
+                        break
+                    for path, matches in zip(group, pool.map(self.scan, group)):
+                        batch.extend((path, line, column, text) for line, column, text in matches)
+                        self.files_matched += bool(matches)
+                    self.files_searched += len(group)
+                    if len(batch) + self.matches > self.MAX_RESULTS:
+                        batch = batch[:self.MAX_RESULTS - self.matches]
+                        self.truncated = True
+                    if batch and (self.truncated or time.monotonic() - sent >= self.BATCH_SECONDS):
+                        self.matches += len(batch)
+                        self.found.emit(batch)
+                        batch, sent = [], time.monotonic()
+                    else:
+                        self.progress.emit(f"Searching... {self.files_searched:,} file(s)")
+                    if self.truncated:
+                        break
+            if batch:
+                self.matches += len(batch)
+                self.found.emit(batch)
+        except Exception as e:
+            self.error = str(e)
+            self.failed.emit(self.error)
+
+
+class FindInFilesDialog(QDialog):
+    """Search every file under a folder; activating a result opens it at the match."""
+    LOCATION_ROLE = Qt.ItemDataRole.UserRole if USING_QT6 else Qt.UserRole
+
+    def __init__(self, parent=None, folder=None):
+        super().__init__(parent)
+        self.worker = None
+        self.setWindowTitle("Find in Files")
+        self.setModal(False)
+        self.resize(720, 480)
+        self.setupUI()
+        self.folder_input.setText(folder or os.getcwd())
+
+    def setupUI(self):
+        layout = QVBoxLayout()
+
+        find_layout = QHBoxLayout()
+        find_layout.addWidget(QLabel("Find:"))
+        self.find_input = QLineEdit()
+        find_layout.addWidget(self.find_input)
+        layout.addLayout(find_layout)
+
+        folder_layout = QHBoxLayout()
+        folder_layout.addWidget(QLabel("Folder:"))
+        self.folder_input = QLineEdit()
+        self.browse_button = QPushButton("Browse...")
+        folder_layout.addWidget(self.folder_input)
+        folder_layout.addWidget(self.browse_button)
+        layout.addLayout(folder_layout)
+
+        options_layout = QHBoxLayout()
+        self.match_case_checkbox = QCheckBox("Match case")
+        self.regex_checkbox = QCheckBox("Regular expression")
+        self.index_checkbox = QCheckBox("Use index")
+        self.index_checkbox.setToolTip("Keep a trigram index of the folder on disk so repeat "
+                                       "searches only read files that can match")
+        options_layout.addWidget(self.match_case_checkbox)
+        options_layout.addWidget(self.regex_checkbox)
+        options_layout.addWidget(self.index_checkbox)
+        layout.addLayout(options_layout)
+
+        button_layout = QHBoxLayout()
+        self.search_button = QPushButton("Search")
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        button_layout.addWidget(self.search_button)
+        button_layout.addWidget(self.stop_button)
+        layout.addLayout(button_layout)
+
+        self.results_list = QListWidget()
+        layout.addWidget(self.results_list)
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+        self.find_input.returnPressed.connect(self.start_search)
+        self.browse_button.clicked.connect(self.browse)
+        self.search_button.clicked.connect(self.start_search)
+        self.stop_button.clicked.connect(self.stop_search)
+        self.results_list.itemActivated.connect(self.open_result)
+
+    def browse(self):
+        folder = QFileDialog.getExistingDirectory(self, "Find in Folder", self.folder_input.text(),
+                                                  options=file_dialog_options())
+        if folder:
+            self.folder_input.setText(folder)
+
+    def start_search(self):
+        self.stop_search()
+        pattern, root = self.find_input.text(), self.folder_input.text()
+        if not pattern:
+            return
+        if not os.path.isdir(root):
+            self.status_label.setText("Folder not found")
+            return
+        regex = self.regex_checkbox.isChecked()
+        try:
+            compile_search(pattern, regex)
+        except re.error:
+            self.status_label.setText("Invalid regular expression")
+            return
+        self.results_list.clear()
+        self.root = root
+        self.worker = FindInFilesWorker(root, pattern, regex, self.match_case_checkbox.isChecked(),
+                                        self.index_checkbox.isChecked(), self)
+        self.worker.found.connect(self.add_results)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.failed.connect(self.on_failed)
+        self.worker.finished.connect(self.on_finished)
+        self.stop_button.setEnabled(True)
+        self.status_label.setText("Searching...")
+        self.worker.start()
+
+    def stop_search(self, wait=False):
+        if self.worker is not None:
+            self.worker.requestInterruption()
+            if wait:
+                self.worker.wait()
+            self.worker = None
+        self.stop_button.setEnabled(False)
+
+    def add_results(self, batch):
+        if self.sender() is not self.worker:
+            return
+        for path, line, column, text in batch:
+            item = QListWidgetItem(f"{os.path.relpath(path, self.root)}:{line}: {text.strip()}")
+            item.setData(self.LOCATION_ROLE, (path, line, column))
+            self.results_list.addItem(item)
+        self.status_label.setText(f"{self.results_list.count():,} match(es) so far...")
+
+    def on_progress(self, message):
+        if self.sender() is self.worker:
+            self.status_label.setText(message)
+
+    def on_failed(self, message):
+        if self.sender() is self.worker:
+            self.status_label.setText(f"Search failed: {message}")
+
+    def on_finished(self):
+        worker = self.sender()
+        if worker is not None:
+            worker.deleteLater()
+        if worker is None or worker is not self.worker:
+            return
+        self.worker = None
+        self.stop_button.setEnabled(False)
+        if worker.error:
+            return
+        more = f" (stopped at {worker.MAX_RESULTS:,})" if worker.truncated else ""
+        self.status_label.setText(f"{worker.matches:,} match(es){more} in "
+                                  f"{worker.files_matched:,} file(s); "
+                                  f"{worker.files_searched:,} file(s) searched.")
+
+    def open_result(self, item):
+        path, line, column = item.data(self.LOCATION_ROLE)
+        self.parent().openFileFromCommandLine(path, line=line, col=column + 1)
+
+    def done(self, result):
+        self.stop_search()
+        super().done(result)
+
+
+# ---- Quick Open ----
+class FileListWalker(QThread):
+    """Build a FileList of `root` (directory walk and match haystacks) in a worker thread."""
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.file_list = FileList(root)
+
+    @traced("quick_open.walk")
+    def run(self):
+        self.file_list.walk(cancelled=self.isInterruptionRequested)
+        self.file_list.paths()
+
+
+class QuickOpenDialog(QDialog):
+    """
+    Fuzzy file palette over the working directory and recent files. The
+    index is built once in the background and kept current by rescanning
+    only the directories a QFileSystemWatcher reports as changed.
+    """
+    WATCH_LIMIT = 4096      # directories watched (inotify watches are a limited resource)
+    RESCAN_MS = 300
+
+    def __init__(self, parent, root, recent):
+        super().__init__(parent)
+        self.recent = recent
+        self.file_list = FileList(root)   # empty until the walker has finished
+        self.changed_dirs = set()
+        self.setWindowTitle("Quick Open")
+        self.setModal(False)
+        self.resize(640, 420)
+        self.setupUI()
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.rescan_timer = QTimer(self)
+        self.rescan_timer.setSingleShot(True)
+        self.rescan_timer.setInterval(self.RESCAN_MS)
+        self.rescan_timer.timeout.connect(self.rescan)
+
+        self.walker = FileListWalker(root, self)
+        self.walker.finished.connect(self.on_walked)
+        self.walker.start()
+        self.status_label.setText("Indexing files...")
+
+    def setupUI(self):
+        layout = QVBoxLayout()
+        self.query_input = QLineEdit()
+        self.query_input.setPlaceholderText("Type part of a file name")
+        self.query_input.installEventFilter(self)
+        layout.addWidget(self.query_input)
+        self.results_list = QListWidget()
+        layout.addWidget(self.results_list)
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+        self.query_input.textChanged.connect(self.update_results)
+        self.query_input.returnPressed.connect(self.open_current)
+        self.results_list.itemActivated.connect(self.open_item)
+
+    def eventFilter(self, obj, event):
+        """Up/Down in the query box move through the results."""
+        if obj is self.query_input and event.type() == (QEvent.Type.KeyPress if USING_QT6
+                                                         else QEvent.KeyPress):
+            Key = Qt.Key if USING_QT6 else Qt
+            step = {Key.Key_Up: -1, Key.Key_Down: 1}.get(event.key())
+            if step is not None:
+                row = self.results_list.currentRow() + step
+                if 0 <= row < self.results_list.count():
+                    self.results_list.setCurrentRow(row)
+                return True
+        return super().eventFilter(obj, event)
+
+    def prepare(self):
+        """Called each time the palette is shown."""
+        self.query_input.selectAll()
+        self.query_input.setFocus()
+        self.update_results()
+
+    @traced("quick_open.match")
+    def update_results(self):
+        recent = [path for path in self.recent if os.path.isfile(path)][:QUICK_OPEN_LIMIT]
+        results = self.file_list.match(self.query_input.text(), recent)
+        self.results_list.clear()
+        root = self.file_list.root
+        for path in results:
+            shown = os.path.relpath(path, root) if path.startswith(root + os.sep) else path
+            item = QListWidgetItem(shown)
+            item.setToolTip(path)
+            self.results_list.addItem(item)
+        if results:
+            self.results_list.setCurrentRow(0)
+
+    def on_walked(self):
+        walker = self.sender()
+        if walker is not self.walker:
+            return
+        self.walker = None
+        walker.deleteLater()
+        self.file_list = walker.file_list
+        dirs = sorted(self.file_list.dirs, key=lambda d: d.count(os.sep))[:self.WATCH_LIMIT]
+        self.watcher.addPaths([os.path.join(self.file_list.root, d) for d in dirs])
+        self.status_label.setText(f"{len(self.file_list):,} files in {self.file_list.root}")
+        self.update_results()
+
+    def on_directory_changed(self, path):
+        self.changed_dirs.add(os.path.relpath(path, self.file_list.root))
+        self.rescan_timer.start()
+
+    def rescan(self):
+        changed, self.changed_dirs = self.changed_dirs, set()
+        known = set(self.file_list.dirs)
+        for rel in sorted(changed, key=len):
+            self.file_list.rescan('' if rel == os.curdir else rel)
+        added = [os.path.join(self.file_list.root, d) for d in set(self.file_list.dirs) - known]
+        room = self.WATCH_LIMIT - len(self.watcher.directories())
+        if added and room > 0:
+            self.watcher.addPaths(added[:room])
+        self.status_label.setText(f"{len(self.file_list):,} files in {self.file_list.root}")
+        if self.isVisible():
+            self.update_results()
+
+    def open_current(self):
+        item = self.results_list.currentItem()
+        if item is not None:
+            self.open_item(item)
+
+    def open_item(self, item):
+        self.hide()
+        self.parent().openFileFromCommandLine(item.toolTip())
+
+    def stop(self):
+        if self.walker is not None:
+            self.walker.requestInterruption()
+            self.walker.wait()
+
+
+# ---- Compare with Disk ----
+class DiffWorker(QThread):
+    """Read a file and diff it against a snapshot of the editor text."""
+
+    def __init__(self, filepath, text, limit, parent=None):
+        super().__init__(parent)
+        self.filepath = filepath
+        self.text = text
+        self.limit = limit
+        self.error = None
+        self.hunks = None
+        self.lines = []
+        self.groups = []
+
+    @traced("diff.compare")
+    def run(self):
+        try:
+            disk = read_lines(self.filepath)
+        except OSError as e:
+            self.error = str(e)
+            return
+        buffer = self.text.split('\n')
+        self.text = None
+        a, b = intern_lines(disk, buffer)
+        hunks = diff_lines(a, b, cancelled=self.isInterruptionRequested)
+        del a, b
+        if hunks is None:
+            return
+        self.lines, self.groups = format_hunks(disk, buffer, hunks, limit=self.limit)
+        self.hunks = hunks
+
+
+class DiffHighlighter(QSyntaxHighlighter):
+    """Colors the lines of a unified diff."""
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.formats = {}
+        for prefix, background, foreground in (('+', "#e6ffec", None), ('-', "#ffebe9", None),
+                                               ('@', "#f0f4fa", "#4a78c2")):
+            fmt = QTextCharFormat()
+            fmt.setBackground(QColor(background))
+            if foreground:
+                fmt.setForeground(QColor(foreground))
+            self.formats[prefix] = fmt
+
+    def highlightBlock(self, text):
+        fmt = self.formats.get(text[:1])
+        if fmt is not None:
+            self.setFormat(0, len(text), fmt)
+
+
+class DiffDialog(QDialog):
+    """
+    Inline diff between a tab's text and its file on disk ("-" lines are on
+    disk, "+" lines in the editor). The diff runs in a DiffWorker; Previous
+    and Next step through the hunks and Go to Line shows one in the editor.
+    """
+    MAX_LINES = 200000  # diff lines shown
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.page = None
+        self.worker = None
+        self.groups = []
+        self.current = -1
+        self.setModal(False)
+        self.resize(820, 600)
+
+        layout = QVBoxLayout()
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        self.diff_view = QPlainTextEdit()
+        self.diff_view.setReadOnly(True)
+        self.diff_view.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap if USING_QT6
+                                       else QPlainTextEdit.NoWrap)
+        font = QFont("monospace")
+        font.setStyleHint(QFont.StyleHint.Monospace if USING_QT6 else QFont.Monospace)
+        self.diff_view.setFont(font)
+        self.highlighter = DiffHighlighter(self.diff_view.document())
+        layout.addWidget(self.diff_view)
+
+        button_layout = QHBoxLayout()
+        self.previous_button = QPushButton("Previous Hunk")
+        self.next_button = QPushButton("Next Hunk")
+        self.goto_button = QPushButton("Go to Line")
+        self.refresh_button = QPushButton("Refresh")
+        self.hunk_label = QLabel()
+        for button in (self.previous_button, self.next_button, self.goto_button,
+                       self.refresh_button):
+            button_layout.addWidget(button)
+        button_layout.addWidget(self.hunk_label)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.previous_button.clicked.connect(lambda: self.show_hunk(self.current - 1))
+        self.next_button.clicked.connect(lambda: self.show_hunk(self.current + 1))
+        self.goto_button.clicked.connect(self.goto_hunk)
+        self.refresh_button.clicked.connect(lambda: self.compare(self.page))
+
+    def compare(self, page):
+        """Diff `page` against its file, replacing any comparison in progress."""
+        self.stop()
+        self.page = page
+        self.groups = []
+        self.current = -1
+        self.update_buttons()
+        self.setWindowTitle("Compare with Disk - " + os.path.basename(page.filepath))
+        self.diff_view.clear()
+        self.summary_label.setText("Comparing...")
+        self.worker = DiffWorker(page.filepath, page.editor.rawText(), self.MAX_LINES, self)
+        self.worker.finished.connect(self.on_finished)
+        self.worker.start()
+
+    def stop(self, wait=False):
+        if self.worker is not None:
+            self.worker.requestInterruption()
+            if wait:
+                self.worker.wait()
+            self.worker = None
+
+    def on_finished(self):
+        worker = self.sender()
+        if worker is not None:
+            worker.deleteLater()
+        if worker is None or worker is not self.worker:
+            return
+        self.worker = None
+        if worker.error:
+            self.summary_label.setText("Cannot read the file: " + worker.error)
+            return
+        hunks = worker.hunks
+        if not hunks:
+            self.summary_label.setText("No differences: the editor matches the file on disk.")
+            return
+        removed = sum(i2 - i1 for i1, i2, _j1, _j2 in hunks)
+        added = sum(j2 - j1 for _i1, _i2, j1, j2 in hunks)
+        self.summary_label.setText(f"{len(hunks):,} change(s) in {len(worker.groups):,} hunk(s): "
+                                   f"{removed:,} line(s) only on disk, "
+                                   f"{added:,} line(s) only in the editor.")
+        self.diff_view.setPlainText('\n'.join(worker.lines))
+        self.groups = worker.groups
+        self.show_hunk(0)
+
+    def update_buttons(self):
+        self.hunk_label.setText(f"Hunk {self.current + 1:,} of {len(self.groups):,}"
+                                if self.current >= 0 else "")
+        self.previous_button.setEnabled(self.current > 0)
+        self.next_button.setEnabled(self.current + 1 < len(self.groups))
+        self.goto_button.setEnabled(self.current >= 0)
+
+    def show_hunk(self, k):
+        if not 0 <= k < len(self.groups):
+            return
+        self.current = k
+        block = self.diff_view.document().findBlockByNumber(self.groups[k][0])
+        cursor = self.diff_view.textCursor()
+        cursor.setPosition(block.position())
+        self.diff_view.setTextCursor(cursor)
+        # Put the hunk header at the top of the view.
+        scrollbar = self.diff_view.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+        self.diff_view.ensureCursorVisible()
+        self.update_buttons()
+
+    def goto_hunk(self):
+        window, page = self.parent(), self.page
+        if self.current < 0 or window.tabs.indexOf(page) < 0:
+            return
+        window.tabs.setCurrentWidget(page)
+        page.editor.moveToLine(self.groups[self.current][1] + 1)
+        page.editor.setFocus()
+
+    def closeEvent(self, event):
+        self.stop()
+        super().closeEvent(event)
+
+
+# ---- Performance Trace Panel ----
+class TraceDialog(QDialog):
+    """Live per-span summary of TRACER, with Chrome trace export."""
+    REFRESH_MS = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Performance Trace")
+        self.setModal(False)
+        self.resize(620, 420)
+
+        layout = QVBoxLayout()
+        self.summary_view = QPlainTextEdit()
+        self.summary_view.setReadOnly(True)
+        font = QFont("monospace")
+        font.setStyleHint(QFont.StyleHint.Monospace if USING_QT6 else QFont.Monospace)
+        self.summary_view.setFont(font)
+        layout.addWidget(self.summary_view)
+
+        button_layout = QHBoxLayout()
+        self.clear_button = QPushButton("Clear")
+        self.export_button = QPushButton("Export Chrome Trace...")
+        button_layout.addWidget(self.clear_button)
+        button_layout.addWidget(self.export_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.clear_button.clicked.connect(self.clear)
+        self.export_button.clicked.connect(self.export)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        rows = TRACER.summary()
+        lines = [f"{'span':<28}{'calls':>9}{'total ms':>12}{'mean ms':>10}{'max ms':>10}"]
+        for name, calls, total, peak in rows:
+            lines.append(f"{name:<28}{calls:>9}{total / 1e6:>12.1f}"
+                         f"{total / calls / 1e6:>10.3f}{peak / 1e6:>10.1f}")
+        lines.append("")
+        lines.append(f"{len(TRACER.spans):,} of {TRACER.spans.maxlen:,} spans kept")
+        self.summary_view.setPlainText("\n".join(lines))
+
+    def clear(self):
+        TRACER.clear()
+        self.refresh()
+
+    def export(self):
+        fileName, _ = QFileDialog.getSaveFileName(self, "Export Chrome Trace", "metapad-trace.json",
+                                                  "Trace Files (*.json)",
+                                                  options=file_dialog_options())
+        if fileName:
+            try:
+                TRACER.export(fileName)
+            except OSError as e:
+                QMessageBox.warning(self, "Export Error", f"Failed to export trace:\n{e}", MB_OK)
 
-    def replace_one(self):
-        text_find = self.find_input.text()
-        text_replace = self.replace_input.text()
-        cursor = self.editor.textCursor()
 
-        if not cursor.hasSelection():
-            self.find_next()
-            return
+# ---- Document Statistics ----
+EOL_NAMES = {'\n': 'LF', '\r\n': 'CRLF', '\r': 'CR'}
 
-        selected = cursor.selectedText()
-        if (selected == text_find or
-            (not self.match_case_checkbox.isChecked() and selected.lower() == text_find.lower())):
-            cursor.insertText(text_replace)
-        self.find_next()
 
-    def replace_all(self):
-        text_find = self.find_input.text()
-        text_replace = self.replace_input.text()
-        if not text_find:
-            return
+class DocumentStats(QObject):
+    """
+    Word count of a QTextDocument kept up to date from contentsChange deltas:
+    one counter per block, so an edit only recounts the blocks it touched.
+    Characters and lines come straight from the document in O(1).
+    """
+    changed = pyqtSignal()
 
-        cursor = self.editor.textCursor()
-        if USING_QT6:
-            cursor.movePosition(QTextCursor.MoveOperation.Start)
-        else:
-            cursor.movePosition(QTextCursor.Start)
-        self.editor.setTextCursor(cursor)
+    def __init__(self, document, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.block_words = array('l')
+        self.words = 0
+        self._recountAll()
+        document.contentsChange.connect(self._onContentsChange)
 
-        count = 0
-        while self.editor.find(text_find, self.find_flags()):
-            cursor = self.editor.textCursor()
-            cursor.insertText(text_replace)
-            count += 1
+    def characters(self):
+        return self.document.characterCount() - 1
 
-        QMessageBox.information(self, "Replace All",
-                                f"Replaced {count} occurrence(s).", MB_OK)
+    def lines(self):
+        return self.document.blockCount()
+
+    def _countBlocks(self, block, count):
+        counts = array('l')
+        for _ in range(count):
+            counts.append(len(block.text().split()))
+            block = block.next()
+        return counts
+
+    def _recountAll(self):
+        doc = self.document
+        self.block_words = self._countBlocks(doc.firstBlock(), doc.blockCount())
+        self.words = sum(self.block_words)
+
+    def _onContentsChange(self, pos, removed, added):
+        doc = self.document
+        count = doc.blockCount()
+        end = doc.characterCount() - 1
+        first_block = doc.findBlock(min(pos, end))
+        first = first_block.blockNumber()
+        last = doc.findBlock(min(pos + added, end)).blockNumber()
+        # Blocks after the edit are unchanged, only renumbered.
+        old_last = last - (count - len(self.block_words))
+        if old_last < first - 1 or old_last >= len(self.block_words):
+            self._recountAll()
+        else:
+            new = self._countBlocks(first_block, last - first + 1)
+            self.words += sum(new) - sum(self.block_words[first:old_last + 1])
+            self.block_words[first:old_last + 1] = new
+        self.changed.emit()
 
 
 # ---- Main Editor (Metapad) ----
 class Metapad(QPlainTextEdit):
     cursorPositionChangedSignal = pyqtSignal(int, int)  # line, col
+    FRAME_MS = 16  # cursor reports are coalesced to at most one per frame
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        # Per-document file format, detected on load and reused on save
+        self.encoding = 'utf-8'
+        self.bom = False
+        self.eol = '\n'
+        self.stats = DocumentStats(self.document(), self)
+        self.history = UndoHistory(self, self)
+        self._dropping = False
+        self._highlighter = None
+        self._cursor_timer = QTimer(self)
+        self._cursor_timer.setSingleShot(True)
+        self._cursor_timer.setInterval(self.FRAME_MS)
+        self._cursor_timer.timeout.connect(self.emitCursorPosition)
         self.lineNumberArea = QLineNumberArea(self)
+        self.ruler = OverviewRuler(self)
+        self._extra_selection_groups = {}
+        self._glyphs = DigitGlyphCache()
+        self._gutter_width = 0
         self.blockCountChanged.connect(self.updateLineNumberAreaWidth)
         self.updateRequest.connect(self.updateLineNumberArea)
         self.updateLineNumberAreaWidth(0)
         self.cursorPositionChanged.connect(self.onCursorPositionChanged)
 
+    @property
+    def highlighter(self):
+        """Created on first use, so a new window does not pay for it before it is shown."""
+        if self._highlighter is None:
+            self._highlighter = SyntaxHighlighter(self.document())
+            self._highlighter.setEditor(self)
+        return self._highlighter
+
+    def rawText(self):
+        """The text with '\n' line breaks; unlike toPlainText() it keeps non-breaking spaces."""
+        return self.document().toRawText().replace('\u2029', '\n')
+
+    @traced("editor.paint")
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._highlighter is None:
+            QTimer.singleShot(0, lambda: self.highlighter)
+
+    # Edits through these entry points first capture the text they may remove.
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.StandardKey.Undo if USING_QT6 else QKeySequence.Undo):
+            self.history.undo()
+            return
+        if event.matches(QKeySequence.StandardKey.Redo if USING_QT6 else QKeySequence.Redo):
+            self.history.redo()
+            return
+        if not self._captureDeletion(event):
+            self.history.capture()
+        super().keyPressEvent(event)
+
+    def _captureDeletion(self, event):
+        """
+        Capture all that a word or line deleting key removes, which may be far
+        more than the text capture() takes around the cursor; False for other keys.
+        """
+        keys = QKeySequence.StandardKey if USING_QT6 else QKeySequence
+        move = QTextCursor.MoveOperation if USING_QT6 else QTextCursor
+        keep = QTextCursor.MoveMode.KeepAnchor if USING_QT6 else QTextCursor.KeepAnchor
+        cursor = self.textCursor()
+        if event.matches(keys.DeleteEndOfWord) or event.matches(keys.DeleteStartOfWord):
+            if not cursor.hasSelection():
+                cursor.movePosition(move.NextWord if event.matches(keys.DeleteEndOfWord)
+                                    else move.PreviousWord, keep)
+        elif event.matches(keys.DeleteEndOfLine) or event.matches(keys.DeleteCompleteLine):
+            if event.matches(keys.DeleteCompleteLine):
+                cursor.movePosition(move.StartOfBlock)
+            cursor.movePosition(move.EndOfBlock, keep)
+            cursor.movePosition(move.NextCharacter, keep)  # the line break may go too
+        else:
+            return False
+        margin = UndoHistory.CAPTURE_CHARS
+        self.history.capture(cursor.selectionStart() - margin, cursor.selectionEnd() + margin)
+        return True
+
+    def inputMethodEvent(self, event):
+        self.history.capture()
+        super().inputMethodEvent(event)
+
+    def contextMenuEvent(self, event):
+        self.history.capture()
+        super().contextMenuEvent(event)
+
+    def insertFromMimeData(self, source):
+        if not self._dropping:  # a drop has captured already and may be mid-edit
+            self.history.capture()
+        super().insertFromMimeData(source)
+
+    def dropEvent(self, event):
+        # A move removes the selection and inserts at the drop point: capture both.
+        point = event.position().toPoint() if USING_QT6 else event.pos()
+        drop = self.cursorForPosition(point).position()
+        cursor = self.textCursor()
+        margin = UndoHistory.CAPTURE_CHARS
+        self.history.capture(min(drop, cursor.selectionStart()) - margin,
+                             max(drop, cursor.selectionEnd()) + margin)
+        self._dropping = True
+        try:
+            super().dropEvent(event)
+        finally:
+            self._dropping = False
+
+    def moveToLine(self, line, column=1):
+        """Put the cursor on 1-based `line` and `column`, clamped to the document."""
+        doc = self.document()
+        block = doc.findBlockByNumber(min(max(line, 1), doc.blockCount()) - 1)
+        cursor = self.textCursor()
+        cursor.setPosition(block.position() + min(max(column, 1) - 1, block.length() - 1))
+        self.setTextCursor(cursor)
+        self.centerCursor()
+
     def lineNumberAreaWidth(self):
+        if not self._gutter_width:
+            self._refreshGutterWidth()
+        return self._gutter_width
+
+    def _refreshGutterWidth(self):
+        """Recompute the cached gutter width; return True if it changed."""
+        self._glyphs.update(self)
         digits = len(str(max(1, self.blockCount())))
-        if USING_QT6:
-            space = 6 + self.fontMetrics().horizontalAdvance('9') * digits
-        else:
-            space = 6 + self.fontMetrics().width('9') * digits
-        return space
+        width = 6 + self._glyphs.digit_width * digits
+        changed = width != self._gutter_width
+        self._gutter_width = width
+        return changed
 
     def updateLineNumberAreaWidth(self, _):
-        self.setViewportMargins(self.lineNumberAreaWidth(), 0, 0, 0)
+        # Only touch the margins when the digit count or font actually changed.
+        if self._refreshGutterWidth():
+            self._updateViewportMargins()
+
+    def _updateViewportMargins(self):
+        ruler = 0 if self.ruler.isHidden() else OverviewRuler.WIDTH
+        self.setViewportMargins(self._gutter_width, 0, ruler, 0)
+        self._placeLineNumberArea()
+
+    def setRulerVisible(self, visible):
+        self.ruler.setVisible(visible)
+        self._updateViewportMargins()
 
     def updateLineNumberArea(self, rect, dy):
         if dy:
@@ -261,61 +3275,368 @@ class Metapad(QPlainTextEdit):
             self.lineNumberArea.update(0, rect.y(),
                                        self.lineNumberArea.size().width(),
                                        rect.height())
-        if rect.contains(self.viewport().rect()):
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        font_change = QEvent.Type.FontChange if USING_QT6 else QEvent.FontChange
+        if event.type() == font_change:
             self.updateLineNumberAreaWidth(0)
+            self.lineNumberArea.update()
 
-    def resizeEvent(self, event):
-        super().resizeEvent(event)
+    def _placeLineNumberArea(self):
         cr = self.contentsRect()
         self.lineNumberArea.setGeometry(QRect(cr.left(), cr.top(),
                                               self.lineNumberAreaWidth(), cr.height()))
 
+    def _placeOverviewRuler(self):
+        # Between the text and the vertical scroll bar. resizeEvent reports
+        # viewport resizes, so this follows the scroll bar appearing too.
+        vr = self.viewport().geometry()
+        self.ruler.setGeometry(QRect(vr.right() + 1, vr.top(), OverviewRuler.WIDTH, vr.height()))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._placeLineNumberArea()
+        self._placeOverviewRuler()
+
+    @traced("editor.gutter_paint")
     def lineNumberAreaPaintEvent(self, event):
         painter = QPainter(self.lineNumberArea)
-        painter.fillRect(event.rect(), QColor("#f5f5f5"))
+        rect = event.rect()
+        painter.fillRect(rect, QColor("#f5f5f5"))
+        self._glyphs.update(self)
 
         block = self.firstVisibleBlock()
-        blockNumber = block.blockNumber()
-        top = int(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
-        bottom = top + self.blockBoundingRect(block).height()
-        height = self.fontMetrics().height()
+        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
+        # Skip the lines above the exposed strip; scrolling only exposes a few.
+        while block.isValid():
+            bottom = top + self.blockBoundingRect(block).height()
+            if bottom >= rect.top():
+                break
+            block = block.next()
+            top = bottom
 
-        while block.isValid() and (top <= event.rect().bottom()):
-            number = str(blockNumber + 1)
-            painter.setPen(QColor("#888"))
-            align = (Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
-                     if USING_QT6 else Qt.AlignRight | Qt.AlignVCenter)
-            painter.drawText(0, top, self.lineNumberArea.width() - 4, height, align, number)
+        right = self.lineNumberArea.width() - 4
+        number = block.blockNumber() + 1
+        while block.isValid() and top <= rect.bottom():
+            self._glyphs.draw(painter, right, int(top), number)
+            top += self.blockBoundingRect(block).height()
+            block = block.next()
+            number += 1
+
+    def setExtraSelectionGroup(self, name, selections):
+        """Replace one named group of extra selections; all groups are shown together."""
+        self._extra_selection_groups[name] = selections
+        self.setExtraSelections([sel for group in self._extra_selection_groups.values()
+                                 for sel in group])
+
+    def visibleBlocks(self):
+        """Yield the blocks that currently intersect the viewport."""
+        block = self.firstVisibleBlock()
+        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
+        bottom = self.viewport().rect().bottom()
+        while block.isValid() and top <= bottom:
+            yield block
+            top += self.blockBoundingRect(block).height()
             block = block.next()
-            top = int(bottom)
-            bottom = top + self.blockBoundingRect(block).height()
-            blockNumber += 1
 
     def onCursorPositionChanged(self):
+        if not self._cursor_timer.isActive():
+            self._cursor_timer.start()
+
+    def emitCursorPosition(self):
         cursor = self.textCursor()
         line = cursor.blockNumber() + 1
         col = cursor.position() - cursor.block().position() + 1
         self.cursorPositionChangedSignal.emit(line, col)
 
 
+# ---- Document Tabs ----
+class DocumentPage(QStackedWidget):
+    """
+    One tab: a Metapad editor plus, for huge files, a HugeFileView. To stay
+    within the memory budget an inactive page can drop its text: a clean
+    page is reloaded from disk when reactivated, a modified one is kept
+    zlib-compressed in memory.
+    """
+    LOADED, PENDING, UNLOADED, COMPRESSED = 'loaded', 'pending', 'unloaded', 'compressed'
+
+    def __init__(self, editor, parent=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.addWidget(editor)
+        self.huge_view = None
+        self.filepath = None
+        self.state = self.LOADED
+        self.loading = False
+        self.address_text = 'New File'
+        self.last_used = 0
+        self._blob = None
+        self._view = None  # (cursor position, scroll value) while unloaded
+        self.goto = None   # (line, column) to show once loaded
+        self.long_lines = None      # long-line mode: None decides from the file
+        self.file_offset = None     # bytes of the file shown, when fully loaded
+        self.file_identity = None
+        self.disk_stamp = None      # (size, mtime) of the file when last read or saved
+        self.follower = None
+
+    def isHuge(self):
+        return self.huge_view is not None and self.currentWidget() is self.huge_view
+
+    def isModified(self):
+        return self.state == self.COMPRESSED or self.editor.document().isModified()
+
+    def canSave(self):
+        """False while the text is incomplete, so it must never be written over the file."""
+        return (not self.loading and not self.isHuge() and self.follower is None
+                and self.state not in (self.PENDING, self.UNLOADED))
+
+    def isBlank(self):
+        """An untouched, untitled, empty page that an Open can reuse."""
+        return (self.filepath is None and not self.loading and not self.isHuge()
+                and not self.isModified() and self.editor.document().characterCount() <= 1)
+
+    def rememberDiskState(self):
+        try:
+            st = os.stat(self.filepath)
+            self.disk_stamp = (st.st_size, st.st_mtime_ns)
+        except (OSError, TypeError):
+            self.disk_stamp = None
+
+    def changedOnDisk(self):
+        """True if the file was modified by someone else since it was read or saved."""
+        if self.disk_stamp is None or not self.filepath:
+            return False
+        try:
+            st = os.stat(self.filepath)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) != self.disk_stamp
+
+    def memoryEstimate(self):
+        """Rough bytes held by this page (UTF-16 text plus layout overhead)."""
+        if self.state == self.COMPRESSED:
+            return len(self._blob)
+        if self.state != self.LOADED or self.isHuge():
+            return 0
+        return self.editor.document().characterCount() * 3 + self.editor.history.memoryUsage()
+
+    # ---- Huge files ----
+    def showHuge(self, filepath):
+        if self.huge_view is None:
+            self.huge_view = HugeFileView(self)
+            self.addWidget(self.huge_view)
+        self.huge_view.openFile(filepath)
+        self.editor.clear()
+        self.setCurrentWidget(self.huge_view)
+
+    def closeHuge(self):
+        if self.huge_view is not None:
+            self.huge_view.closeFile()
+            self.setCurrentWidget(self.editor)
+
+    # ---- Unloading ----
+    def _clearText(self):
+        history = self.editor.history
+        self._view = (self.editor.textCursor().position(), self.editor.verticalScrollBar().value())
+        recording, self.editor.journal.recording = self.editor.journal.recording, False
+        history_recording, history.recording = history.recording, False
+        self.editor.highlighter.beginLoad(0)
+        self.editor.clear()
+        history.clear()
+        self.editor.highlighter.endLoad()
+        history.recording = history_recording
+        self.editor.journal.recording = recording
+
+    def unload(self):
+        """Drop the text of a clean page; it is read back from disk on activation."""
+        self._clearText()
+        self.editor.document().setModified(False)
+        self.editor.setReadOnly(True)
+        self.state = self.UNLOADED
+
+    def compress(self):
+        """Keep the text of a modified page zlib-compressed instead of in the document."""
+        text = self.editor.rawText()
+        self._blob = zlib.compress(text.encode('utf-8', 'surrogatepass'), 1)
+        del text
+        self._clearText()
+        self.state = self.COMPRESSED
+
+    def decompress(self):
+        text = zlib.decompress(self._blob).decode('utf-8', 'surrogatepass')
+        self._blob = None
+        doc = self.editor.document()
+        history = self.editor.history
+        recording, self.editor.journal.recording = self.editor.journal.recording, False
+        history_recording, history.recording = history.recording, False
+        self.editor.highlighter.beginLoad(len(text))
+        self.editor.setPlainText(text)
+        history.clear()
+        self.editor.highlighter.endLoad()
+        history.recording = history_recording
+        self.editor.journal.recording = recording
+        doc.setModified(True)
+        self.state = self.LOADED
+        self.restoreView()
+
+    def restoreView(self):
+        if self._view is None:
+            return
+        position, scroll = self._view
+        self._view = None
+        cursor = self.editor.textCursor()
+        cursor.setPosition(min(position, self.editor.document().characterCount() - 1))
+        self.editor.setTextCursor(cursor)
+        self.editor.verticalScrollBar().setValue(scroll)
+
+
+# ---- Single Instance (server side) ----
+class InstanceServer(QObject):
+    """Receives the files of later launches (see forward_to_instance)."""
+    filesReceived = pyqtSignal(object)  # list of (path, line, col)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.server = QLocalServer(self)
+        if USING_QT6:
+            self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        else:
+            self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self._onNewConnection)
+        self.buffers = {}
+
+    def listen(self):
+        """Take the instance name unless a live Metapad already serves it."""
+        name = instance_address()
+        if self.server.listen(name):
+            return True
+        try:
+            connect_to_instance().close()
+            return False  # a live instance owns the name
+        except OSError:
+            QLocalServer.removeServer(name)  # socket file left by a crashed instance
+            return self.server.listen(name)
+
+    def _onNewConnection(self):
+        while self.server.hasPendingConnections():
+            conn = self.server.nextPendingConnection()
+            self.buffers[conn] = b''
+            conn.readyRead.connect(lambda c=conn: self._onReadyRead(c))
+            conn.disconnected.connect(lambda c=conn: self._onDisconnected(c))
+
+    def _onDisconnected(self, conn):
+        self.buffers.pop(conn, None)
+        conn.deleteLater()
+
+    def _onReadyRead(self, conn):
+        data = self.buffers.get(conn, b'') + bytes(conn.readAll())
+        self.buffers[conn] = data
+        if not data.endswith(b'\n'):
+            return
+        try:
+            files = [(path, line, col) for path, line, col in json.loads(data)['files']]
+        except (ValueError, KeyError, TypeError):
+            conn.abort()
+            return
+        conn.write(b'ok\n')
+        conn.flush()
+        conn.disconnectFromServer()
+        self.filesReceived.emit(files)
+
+
+# ---- Startup Profiling ----
+class StartupProfile(QObject):
+    """
+    Accumulates wall time per startup phase for --startup-profile. Each
+    mark() charges the time since the previous mark to a phase; the report
+    is printed to stderr once the first frame has been painted.
+    """
+
+    def __init__(self, t0, parent=None):
+        super().__init__(parent)
+        self.phases = {}
+        self.t0 = self.last = t0
+        self.app = None
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def watchFirstPaint(self, app):
+        self.app = app
+        app.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == (QEvent.Type.Paint if USING_QT6 else QEvent.Paint):
+            self.app.removeEventFilter(self)
+            # Let the rest of the first frame paint before stopping the clock.
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self):
+        self.mark('first paint')
+        lines = [f"Startup profile (PyQt{6 if USING_QT6 else 5}):"]
+        for phase, seconds in self.phases.items():
+            lines.append(f"  {phase:<14}{seconds * 1000:8.1f} ms")
+        lines.append(f"  {'total':<14}{(self.last - self.t0) * 1000:8.1f} ms")
+        print("\n".join(lines), file=sys.stderr)
+
+
 # ---- Main Window ----
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, profile=None):
         super().__init__()
+        self.profile = profile
         self.setWindowTitle("Metapad")
         self.resize(900, 640)
 
-        # Editor
-        self.metapad = Metapad(self)
-        self.setCentralWidget(self.metapad)
-
-        # Syntax highlighting (no keywords)
-        self.highlighter = PythonHighlighter(self.metapad.document())
+        # Documents (one tab per file)
+        self.tabs = QTabWidget(self)
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.setDocumentMode(True)
+        self.tabs.tabCloseRequested.connect(self.closeTab)
+        self.setCentralWidget(self.tabs)
+        self._use_tick = 0
 
         # Status bar
         self.status = self.statusBar()
         self.status.showMessage("Ready")
-        self.metapad.cursorPositionChangedSignal.connect(self.updateStatusBar)
+
+        # Document statistics (refreshed at most once per frame)
+        self.stats_label = QLabel("")
+        self.status.addPermanentWidget(self.stats_label)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setSingleShot(True)
+        self.stats_timer.setInterval(Metapad.FRAME_MS)
+        self.stats_timer.timeout.connect(self.refreshStats)
+
+        # Background loading (progress + cancel live in the status bar)
+        self.loader = None
+        self.load_queue = []
+        self.load_error = None
+        self.load_progress = QProgressBar()
+        self.load_progress.setRange(0, 1000)
+        self.load_progress.setMaximumWidth(160)
+        self.load_progress.setTextVisible(False)
+        self.load_cancel_button = QPushButton("Cancel")
+        self.load_cancel_button.clicked.connect(self.cancelLoad)
+        self.status.addPermanentWidget(self.load_progress)
+        self.status.addPermanentWidget(self.load_cancel_button)
+        self.load_progress.hide()
+        self.load_cancel_button.hide()
+
+        # Background saving and printing
+        self.saver = None
+        self.print_job = None
+        self.save_progress = QProgressBar()
+        self.save_progress.setRange(0, 1000)
+        self.save_progress.setMaximumWidth(160)
+        self.save_progress.setTextVisible(False)
+        self.status.addPermanentWidget(self.save_progress)
+        self.save_progress.hide()
 
         # Address toolbar (file info)
         self.address_toolbar = QToolBar("File")
@@ -327,22 +3648,184 @@ class MainWindow(QMainWindow):
         self.createToolbarsAndMenus()
 
         # Styling (white-paper)
+        self.markStartup('window')
         self.applyStyles()
 
         # Default font
         font = QFont()
         font.setPointSize(13)
         self.setFont(font)
+        self.markStartup('styling')
 
         # Keep reference to modeless Find/Replace dialog
         self.find_replace_dialog = None
+        self.find_in_files_dialog = None
+        self.quick_open_dialog = None
+        self.diff_dialog = None
+        self.viewer_query = ''
+        self.recent_files = None    # read on first use
+        self.trace_dialog = None
+
+        # Crash-recovery journals are written by one background thread
+        self.journal_writer = JournalWriter(self)
+        self.journal_writer.start()
+
+        # First (empty) document
+        self.tabs.currentChanged.connect(self.onTabChanged)
+        self.newPage()
 
         # Center on screen after sizing
         self.centerOnScreen()
 
-        # Open file from CLI
-        if len(sys.argv) > 1:
-            self.openFileFromCommandLine(sys.argv[1])
+        # Open files from CLI: the first one now, the rest when their tab is first shown
+        for i, arg in enumerate(sys.argv[1:]):
+            path, line, col = parse_location(arg)
+            self.openFileFromCommandLine(path, activate=(i == 0), line=line, col=col)
+
+        QTimer.singleShot(0, self.offerRecovery)
+        self.markStartup('window')
+
+    def markStartup(self, phase):
+        if self.profile is not None:
+            self.profile.mark(phase)
+
+    # ---- Current document ----
+    @property
+    def page(self):
+        return self.tabs.currentWidget()
+
+    @property
+    def metapad(self):
+        return self.page.editor
+
+    @property
+    def highlighter(self):
+        return self.page.editor.highlighter
+
+    @property
+    def current_file(self):
+        return self.page.filepath
+
+    def pages(self):
+        return [self.tabs.widget(i) for i in range(self.tabs.count())]
+
+    def createEditor(self):
+        editor = Metapad()
+        editor.journal = EditJournal(editor, self.journal_writer, editor)
+        editor.cursorPositionChangedSignal.connect(self.updateStatusBar)
+        editor.stats.changed.connect(self.scheduleStatsUpdate)
+        editor.selectionChanged.connect(self.scheduleStatsUpdate)
+        self.applyEditorStyle(editor)
+        self.applyWordWrap(editor)
+        editor.setRulerVisible(self.ruler_action.isChecked())
+        return editor
+
+    def newPage(self, filepath=None, activate=True):
+        page = DocumentPage(self.createEditor())
+        page.filepath = filepath
+        page.editor.modificationChanged.connect(lambda _: self.updateTabTitle(page))
+        page.editor.modificationChanged.connect(
+            lambda modified: modified or page.editor.journal.discard())
+        if filepath is None:
+            page.editor.journal.start()
+        self.tabs.addTab(page, "")
+        self.updateTabTitle(page)
+        if activate:
+            self.tabs.setCurrentWidget(page)
+        return page
+
+    def findPage(self, filepath):
+        path = os.path.abspath(filepath)
+        for page in self.pages():
+            if page.filepath and os.path.abspath(page.filepath) == path:
+                return page
+        return None
+
+    def pageForOpen(self, filepath):
+        """The tab to load `filepath` into: its existing tab, a blank one or a new one."""
+        page = self.findPage(filepath)
+        if page is not None:
+            return page
+        if self.page is not None and self.page.isBlank():
+            return self.page
+        return self.newPage(activate=False)
+
+    def setAddress(self, page, text):
+        page.address_text = text
+        if page is self.page:
+            self.address.setText(text)
+
+    def updateTabTitle(self, page):
+        index = self.tabs.indexOf(page)
+        if index < 0:
+            return
+        name = os.path.basename(page.filepath) if page.filepath else "Untitled"
+        self.tabs.setTabText(index, name + (" *" if page.isModified() else ""))
+        self.tabs.setTabToolTip(index, page.filepath or "")
+
+    def onTabChanged(self, index):
+        page = self.tabs.widget(index)
+        if page is None:
+            return
+        self._use_tick += 1
+        page.last_used = self._use_tick
+        if page.state in (DocumentPage.PENDING, DocumentPage.UNLOADED) and not page.loading:
+            if os.path.exists(page.filepath):
+                self.loadFile(page.filepath, page)
+            else:
+                page.state = DocumentPage.LOADED
+                page.editor.setReadOnly(False)
+                self.status.showMessage(f"Cannot find file: {page.filepath}")
+        elif page.state == DocumentPage.COMPRESSED:
+            page.decompress()
+        self.address.setText(page.address_text)
+        self.setEditingEnabled(not page.isHuge())
+        self.follow_action.setChecked(page.follower is not None)
+        self.long_line_action.setChecked(page.isHuge())
+        if self.find_replace_dialog is not None:
+            self.find_replace_dialog.set_editor(page.editor)
+        page.editor.emitCursorPosition()
+        self.scheduleStatsUpdate()
+        QTimer.singleShot(0, self.enforceMemoryBudget)
+
+    def closeTab(self, index):
+        page = self.tabs.widget(index)
+        if page.isModified():
+            name = os.path.basename(page.filepath) if page.filepath else "Untitled"
+            resp = QMessageBox.question(self, 'Close tab?',
+                                        f"{name} has unsaved changes that will be lost. "
+                                        "If unsure press Cancel now.",
+                                        MB_CANCEL | MB_OK)
+            if resp != MB_OK:
+                return
+        self.load_queue = [(p, path) for p, path in self.load_queue if p is not page]
+        if self.loader is not None and self.loader.page is page:
+            self.stopLoader()
+            self._startQueuedLoad()
+        page.closeHuge()
+        self.stopFollowing(page)
+        page.editor.journal.stop()
+        self.tabs.removeTab(index)
+        page.deleteLater()
+        if self.tabs.count() == 0:
+            self.newPage()
+
+    def enforceMemoryBudget(self):
+        """Unload or compress the least recently used inactive tabs until under budget."""
+        pages = self.pages()
+        total = sum(page.memoryEstimate() for page in pages)
+        for page in sorted(pages, key=lambda p: p.last_used):
+            if total <= MEMORY_BUDGET_BYTES:
+                break
+            if (page is self.page or page.loading or page.isHuge() or page.follower is not None
+                    or page.state != DocumentPage.LOADED):
+                continue
+            before = page.memoryEstimate()
+            if page.isModified():
+                page.compress()
+            elif page.filepath:
+                page.unload()
+            total -= before - page.memoryEstimate()
 
     # ---- UI builders ----
     def createToolbarsAndMenus(self):
@@ -353,24 +3836,36 @@ class MainWindow(QMainWindow):
         self.open_action = QAction('Open', self)
         self.open_action.triggered.connect(self.openFile)
 
+        self.quick_open_action = QAction('Quick Open', self)
+        self.quick_open_action.triggered.connect(self.quickOpen)
+
+        self.compare_action = QAction('Compare with Disk', self)
+        self.compare_action.triggered.connect(self.compareWithDisk)
+
         self.new_action = QAction('New', self)
         self.new_action.triggered.connect(self.newFile)
 
         self.undo_action = QAction('Undo', self)
-        self.undo_action.triggered.connect(self.metapad.undo)
+        self.undo_action.triggered.connect(lambda: self.metapad.history.undo())
 
         self.redo_action = QAction('Redo', self)
-        self.redo_action.triggered.connect(self.metapad.redo)
+        self.redo_action.triggered.connect(lambda: self.metapad.history.redo())
 
         self.save_action = QAction('Save', self)
         self.save_action.triggered.connect(self.saveFile)
 
+        self.save_as_action = QAction('Save As', self)
+        self.save_as_action.triggered.connect(self.saveFileAs)
+
         self.print_action = QAction('Print (Preview)', self)
         self.print_action.triggered.connect(self.printPreview)
 
         self.print_direct_action = QAction('Print (Direct)', self)
         self.print_direct_action.triggered.connect(self.printDirect)
 
+        self.export_pdf_action = QAction('Export to PDF', self)
+        self.export_pdf_action.triggered.connect(self.exportPdf)
+
         self.font_action = QAction('Font', self)
         self.font_action.triggered.connect(self.changeFont)
 
@@ -387,17 +3882,25 @@ class MainWindow(QMainWindow):
         file_menu = menubar.addMenu("File")
         file_menu.addAction(self.new_action)
         file_menu.addAction(self.open_action)
+        file_menu.addAction(self.quick_open_action)
         file_menu.addAction(self.save_action)
+        file_menu.addAction(self.save_as_action)
+        file_menu.addAction(self.compare_action)
         file_menu.addAction(self.print_action)
         file_menu.addAction(self.print_direct_action)
+        file_menu.addAction(self.export_pdf_action)
         file_menu.addSeparator()
         file_menu.addAction(self.exit_action)
 
         edit_menu = menubar.addMenu("Edit")
 
-        find_replace_action = QAction("Find & Replace", self)
-        find_replace_action.triggered.connect(self.openFindReplaceDialog)
-        edit_menu.addAction(find_replace_action)
+        self.find_replace_action = QAction("Find & Replace", self)
+        self.find_replace_action.triggered.connect(self.openFindReplaceDialog)
+        edit_menu.addAction(self.find_replace_action)
+
+        find_in_files_action = QAction("Find in Files", self)
+        find_in_files_action.triggered.connect(self.openFindInFilesDialog)
+        edit_menu.addAction(find_in_files_action)
 
         goto_line_action = QAction("Go to Line", self)
         goto_line_action.triggered.connect(self.gotoLine)
@@ -408,6 +3911,24 @@ class MainWindow(QMainWindow):
         self.word_wrap_action.triggered.connect(self.toggleWordWrap)
         edit_menu.addAction(self.word_wrap_action)
 
+        self.ruler_action = QAction("Overview Ruler", self, checkable=True)
+        self.ruler_action.setChecked(True)
+        self.ruler_action.triggered.connect(self.toggleOverviewRuler)
+        edit_menu.addAction(self.ruler_action)
+
+        self.follow_action = QAction("Follow File", self, checkable=True)
+        self.follow_action.triggered.connect(self.toggleFollow)
+        edit_menu.addAction(self.follow_action)
+
+        self.long_line_action = QAction("Long-Line Mode", self, checkable=True)
+        self.long_line_action.triggered.connect(self.toggleLongLineMode)
+        edit_menu.addAction(self.long_line_action)
+
+        self.autoscroll_action = QAction("Auto-scroll While Following", self, checkable=True)
+        self.autoscroll_action.setChecked(True)
+        self.autoscroll_action.triggered.connect(self.toggleAutoscroll)
+        edit_menu.addAction(self.autoscroll_action)
+
         edit_menu.addSeparator()
         edit_menu.addAction(self.undo_action)
         edit_menu.addAction(self.redo_action)
@@ -417,6 +3938,11 @@ class MainWindow(QMainWindow):
         about_action.triggered.connect(self.showAbout)
         help_menu.addAction(about_action)
 
+        if TRACER is not None:
+            trace_action = QAction("Performance Trace", self)
+            trace_action.triggered.connect(self.openTraceDialog)
+            help_menu.addAction(trace_action)
+
         self.toggleWordWrap()
 
     def applyStyles(self):
@@ -465,7 +3991,9 @@ class MainWindow(QMainWindow):
                 border-top: 1px solid #e6e6e6;
             }
         """)
-        self.metapad.setStyleSheet("""
+
+    def applyEditorStyle(self, editor):
+        editor.setStyleSheet("""
             QPlainTextEdit {
                 background-color: #ffffff;
                 color: #111111;
@@ -487,23 +4015,51 @@ class MainWindow(QMainWindow):
 
     # ---- Feature methods ----
     def updateStatusBar(self, line, col):
-        self.status.showMessage(f"Line: {line}, Col: {col}")
+        page = self.page
+        if page is not None and self.sender() in (page.editor, page.huge_view):
+            self.status.showMessage(f"Line: {line}, Col: {col}")
+
+    def scheduleStatsUpdate(self):
+        if not self.stats_timer.isActive():
+            self.stats_timer.start()
+
+    def refreshStats(self):
+        editor = self.metapad
+        stats = editor.stats
+        cursor = editor.textCursor()
+        parts = [f"Chars: {stats.characters():,}", f"Words: {stats.words:,}",
+                 f"Lines: {stats.lines():,}"]
+        if cursor.hasSelection():
+            parts.append(f"Sel: {cursor.selectionEnd() - cursor.selectionStart():,}")
+        parts.append(editor.encoding.upper() + (" BOM" if editor.bom else ""))
+        parts.append(EOL_NAMES.get(editor.eol, 'LF'))
+        self.stats_label.setText("   ".join(parts))
+
+    def toggleOverviewRuler(self, visible):
+        for page in self.pages():
+            page.editor.setRulerVisible(visible)
 
     def toggleWordWrap(self):
+        for page in self.pages():
+            self.applyWordWrap(page.editor)
+
+    def applyWordWrap(self, editor):
         if self.word_wrap_action.isChecked():
             if USING_QT6:
-                self.metapad.setLineWrapMode(QPlainTextEdit.LineWrapMode.WidgetWidth)
+                editor.setLineWrapMode(QPlainTextEdit.LineWrapMode.WidgetWidth)
             else:
-                self.metapad.setLineWrapMode(QPlainTextEdit.WidgetWidth)
+                editor.setLineWrapMode(QPlainTextEdit.WidgetWidth)
         else:
             if USING_QT6:
-                self.metapad.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+                editor.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
             else:
-                self.metapad.setLineWrapMode(QPlainTextEdit.NoWrap)
+                editor.setLineWrapMode(QPlainTextEdit.NoWrap)
 
     def gotoLine(self):
         line, ok = QInputDialog.getInt(self, "Go to Line", "Line number:", 1, 1)
-        if ok and line > 0:
+        if ok and line > 0 and self.isHugeMode():
+            self.page.huge_view.gotoLine(line)
+        elif ok and line > 0:
             block_count = self.metapad.blockCount()
             if line <= block_count:
                 cursor = self.metapad.textCursor()
@@ -517,24 +4073,409 @@ class MainWindow(QMainWindow):
                                         QTextCursor.MoveAnchor, line - 1)
                 self.metapad.setTextCursor(cursor)
 
+    def openTraceDialog(self):
+        if self.trace_dialog is None:
+            self.trace_dialog = TraceDialog(self)
+        self.trace_dialog.show()
+        self.trace_dialog.raise_()
+        self.trace_dialog.activateWindow()
+
+    def quickOpen(self):
+        if self.quick_open_dialog is None:
+            self.quick_open_dialog = QuickOpenDialog(self, os.getcwd(), self.recentFiles())
+        self.quick_open_dialog.show()
+        self.quick_open_dialog.raise_()
+        self.quick_open_dialog.activateWindow()
+        self.quick_open_dialog.prepare()
+
+    def compareWithDisk(self, page=None):
+        page = page or self.page
+        if not page.filepath or page.loading or page.isHuge():
+            QMessageBox.warning(self, "Compare with Disk",
+                                "Only a file that has been fully opened from disk can be compared.",
+                                MB_OK)
+            return
+        if self.diff_dialog is None:
+            self.diff_dialog = DiffDialog(self)
+        self.diff_dialog.compare(page)
+        self.diff_dialog.show()
+        self.diff_dialog.raise_()
+        self.diff_dialog.activateWindow()
+
+    def recentFiles(self):
+        if self.recent_files is None:
+            self.recent_files = load_recent()
+        return self.recent_files
+
+    def openFindInFilesDialog(self):
+        if self.find_in_files_dialog is None:
+            folder = os.path.dirname(self.current_file) if self.current_file else None
+            self.find_in_files_dialog = FindInFilesDialog(self, folder)
+        self.find_in_files_dialog.show()
+        self.find_in_files_dialog.raise_()
+        self.find_in_files_dialog.activateWindow()
+        self.find_in_files_dialog.find_input.setFocus()
+
     def openFindReplaceDialog(self):
+        if self.isHugeMode():
+            self.findInViewer()
+            return
         if not self.find_replace_dialog:
             self.find_replace_dialog = FindReplaceDialog(self, self.metapad)
+        self.find_replace_dialog.set_editor(self.metapad)
         self.find_replace_dialog.show()
         self.find_replace_dialog.raise_()
         self.find_replace_dialog.activateWindow()
 
-    def openFileFromCommandLine(self, filepath):
+    def openFileFromCommandLine(self, filepath, activate=True, line=None, col=None):
         if os.path.exists(filepath):
             try:
-                with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-                    self.metapad.setPlainText(file.read())
-                self.address.setText(f'Now viewing: {os.path.basename(filepath)}')
+                if activate:
+                    page = self.openPath(filepath)
+                else:
+                    page = self.findPage(filepath)
+                    if page is None:
+                        # Bulk opens load lazily, on first activation of the tab.
+                        page = self.newPage(filepath, activate=False)
+                        page.state = DocumentPage.PENDING
+                        page.editor.setReadOnly(True)
+                        self.setAddress(page, 'Now viewing: ' + os.path.basename(filepath))
+                if line:
+                    page.goto = (line, col or 1)
+                    self.applyGoto(page)
             except Exception as e:
                 QMessageBox.warning(self, "File Open Error", f"Failed to open file:\n{e}", MB_OK)
         else:
             QMessageBox.warning(self, "File Not Found", f"Cannot find file: {filepath}", MB_OK)
 
+    def openPath(self, filepath):
+        """Show `filepath` in a tab, loading it unless it is already open."""
+        page = self.pageForOpen(filepath)
+        fresh = page.filepath is None
+        page.filepath = filepath
+        self.tabs.setCurrentWidget(page)
+        if fresh:
+            self.loadFile(filepath, page)
+        return page
+
+    def applyGoto(self, page):
+        """Move to the position requested with `file:line[:col]` once the page is loaded."""
+        if page.goto is None or page.loading or page.state != DocumentPage.LOADED:
+            return
+        line, col = page.goto
+        page.goto = None
+        if page.isHuge():
+            page.huge_view.gotoLine(line)
+        else:
+            page.editor.moveToLine(line, col)
+
+    def openLocations(self, locations):
+        """Open files handed over by a later launch and bring the window to the front."""
+        if not locations:
+            self.newPage()
+        for i, (path, line, col) in enumerate(locations):
+            self.openFileFromCommandLine(path, activate=(i == 0), line=line, col=col)
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+    # ---- Huge file viewer ----
+    def isHugeMode(self):
+        return self.page.isHuge()
+
+    @traced("open.huge")
+    def openHugeFile(self, filepath, page):
+        """Show `filepath` read-only through the memory-mapped viewer."""
+        new_view = page.huge_view is None
+        page.editor.journal.stop()
+        page.showHuge(filepath)
+        if new_view:
+            page.huge_view.cursorPositionChangedSignal.connect(self.updateStatusBar)
+            page.huge_view.indexProgress.connect(self._onHugeIndexProgress)
+            page.huge_view.searchFinished.connect(self._onViewerSearchFinished)
+        page.state = DocumentPage.LOADED
+        self.updateTabTitle(page)
+        mode = 'read-only' if os.path.getsize(filepath) >= HUGE_FILE_BYTES else 'long-line mode'
+        self.setAddress(page, f'Now viewing: {os.path.basename(filepath)} ({mode})')
+        if page is self.page:
+            self.setEditingEnabled(False)
+            self.long_line_action.setChecked(True)
+            page.huge_view.setFocus()
+        self.applyGoto(page)
+
+    def toggleLongLineMode(self, enabled):
+        """Reopen the current file in (or out of) the long-line viewer."""
+        page = self.page
+        if (not page.filepath or page.loading
+                or not enabled and os.path.getsize(page.filepath) >= HUGE_FILE_BYTES):
+            self.long_line_action.setChecked(page.isHuge())
+            return
+        if page.isModified():
+            QMessageBox.warning(self, "Long-Line Mode",
+                                "Save or undo your changes before switching modes.", MB_OK)
+            self.long_line_action.setChecked(page.isHuge())
+            return
+        page.long_lines = enabled
+        self.loadFile(page.filepath, page)
+
+    def findInViewer(self):
+        """Search the read-only viewer (it has no Replace)."""
+        text, ok = QInputDialog.getText(self, "Find", "Find (ignoring case):",
+                                        text=self.viewer_query)
+        if ok and text:
+            self.viewer_query = text
+            self.status.showMessage(f"Searching for {text}...")
+            self.page.huge_view.find(text)
+
+    def _onViewerSearchFinished(self, text, found):
+        if self.sender() is self.page.huge_view:
+            self.status.showMessage("Ready" if found else f"Not found: {text}")
+
+    # ---- Follow mode ----
+    def toggleFollow(self, enabled):
+        page = self.page
+        if not enabled:
+            self.stopFollowing(page)
+            return
+        if page.file_offset is None or page.loading or not page.filepath:
+            QMessageBox.warning(self, "Follow File",
+                                "Only a file that has been fully opened from disk can be followed.",
+                                MB_OK)
+        elif page.isModified():
+            QMessageBox.warning(self, "Follow File",
+                                "Save or undo your changes before following the file.", MB_OK)
+        else:
+            self.startFollowing(page)
+            return
+        self.follow_action.setChecked(False)
+
+    def startFollowing(self, page):
+        """Turn `page` into a read-only tail of its file."""
+        editor = page.editor
+        doc = editor.document()
+        editor.journal.stop()  # the file on disk is the copy of record
+        editor.history.stop()
+        doc.setMaximumBlockCount(FOLLOW_MAX_LINES)
+        editor.setReadOnly(True)
+        page.follower = FileFollower(editor, page.filepath, page.file_offset,
+                                     page.file_identity, page)
+        page.follower.autoscroll = self.autoscroll_action.isChecked()
+        page.follower.reopened.connect(
+            lambda: self.status.showMessage("File was truncated or replaced; reading it again."))
+        page.follower.start()
+        self.setAddress(page, 'Following: ' + os.path.basename(page.filepath))
+        self.updateSaveActions()
+
+    def stopFollowing(self, page):
+        follower, page.follower = page.follower, None
+        if follower is None:
+            return
+        follower.stop()
+        follower.deleteLater()
+        editor = page.editor
+        doc = editor.document()
+        trimmed = follower.trimmed()
+        doc.setMaximumBlockCount(0)
+        editor.history.start()
+        editor.setReadOnly(False)
+        page.file_offset, page.file_identity = follower.offset, follower.identity
+        page.rememberDiskState()
+        name = os.path.basename(page.filepath)
+        if trimmed:
+            # Early lines are gone: never save this over the log.
+            page.filepath = None
+            page.file_offset = None
+            self.updateTabTitle(page)
+            self.setAddress(page, 'Now viewing: ' + name + ' (partial)')
+        else:
+            self.setAddress(page, 'Now viewing: ' + name)
+        # The file may have grown past the text shown, so journal from a snapshot.
+        editor.journal.start(page.filepath, clean=False)
+        self.updateSaveActions()
+
+    def toggleAutoscroll(self, enabled):
+        for page in self.pages():
+            if page.follower is not None:
+                page.follower.autoscroll = enabled
+
+    def setEditingEnabled(self, enabled):
+        for act in (self.undo_action, self.redo_action,
+                    self.print_action, self.print_direct_action, self.export_pdf_action,
+                    self.font_action, self.word_wrap_action, self.follow_action,
+                    self.compare_action):
+            act.setEnabled(enabled)
+        self.updateSaveActions()
+
+    def updateSaveActions(self):
+        savable = self.page is not None and self.page.canSave()
+        self.save_action.setEnabled(savable)
+        self.save_as_action.setEnabled(savable)
+
+    def _onHugeIndexProgress(self, lines, fraction):
+        if self.sender() is not self.page.huge_view:
+            return
+        if fraction < 1:
+            self.status.showMessage(f"Indexing lines: {lines:,} ({fraction:.0%})")
+        else:
+            self.status.showMessage(f"{lines:,} lines")
+
+    # ---- Background loading ----
+    @traced("open.start")
+    def loadFile(self, filepath, page=None):
+        """Stream `filepath` into `page` (default: current tab) from a worker thread."""
+        page = page or self.page
+        if self.loader is not None:
+            if self.loader.page is not page:
+                # One load at a time; the others wait their turn.
+                self.load_queue.append((page, filepath))
+                page.loading = True
+                # Nothing typed into the page may survive its load.
+                page.editor.setReadOnly(True)
+                if page is self.page:
+                    self.updateSaveActions()
+                return
+            self.stopLoader()
+        self.stopFollowing(page)
+        remember_recent(filepath, self.recentFiles())
+        page.file_offset = None
+        if os.path.getsize(filepath) >= HUGE_FILE_BYTES or (
+                has_long_lines(filepath) if page.long_lines is None else page.long_lines):
+            self.openHugeFile(filepath, page)
+            return
+        page.closeHuge()
+        if page is self.page:
+            self.setEditingEnabled(True)
+            self.long_line_action.setChecked(False)
+
+        size = os.path.getsize(filepath)
+        editor = page.editor
+        editor.journal.stop()
+        editor.highlighter.lexer = get_lexer(detect_language(filepath))
+        editor.highlighter.beginLoad(size)
+        editor.history.stop()
+        editor.setReadOnly(True)
+        editor.clear()
+
+        self.load_error = None
+        page.loading = True
+        self.loader = FileLoader(filepath, self)
+        self.loader.page = page
+        self.loader.detected.connect(self._onLoadDetected)
+        self.loader.restarted.connect(self._onLoadRestarted)
+        self.loader.chunkReady.connect(self._onLoadChunk)
+        self.loader.progress.connect(self._onLoadProgress)
+        self.loader.failed.connect(self._onLoadFailed)
+        self.loader.finished.connect(self._onLoadFinished)
+
+        name = os.path.basename(filepath)
+        page.filepath = filepath
+        self.updateTabTitle(page)
+        self.setAddress(page, 'Now viewing: ' + name)
+        self.status.showMessage(f"Loading {name}...")
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self.load_cancel_button.show()
+        self.updateSaveActions()
+        self.loader.start()
+
+    def cancelLoad(self):
+        if self.loader is not None:
+            self.loader.requestInterruption()
+
+    def stopLoader(self):
+        """Cancel a running load and wait for its thread to exit."""
+        if self.loader is not None:
+            old = self.loader
+            old.requestInterruption()
+            old.chunkConsumed()  # unblock a reader waiting for a free slot
+            old.wait()
+            self._finishLoad(old)
+
+    def _onLoadDetected(self, encoding, bom, eol):
+        if self.loader is not None and self.sender() is self.loader:
+            editor = self.loader.page.editor
+            editor.encoding = encoding
+            editor.bom = bom
+            editor.eol = eol
+            self.scheduleStatsUpdate()
+
+    def _onLoadRestarted(self):
+        if self.loader is not None and self.sender() is self.loader:
+            self.loader.page.editor.clear()
+
+    @traced("open.insert_chunk")
+    def _onLoadChunk(self, chunk):
+        loader = self.sender()
+        if loader is None or loader is not self.loader:
+            return
+        cursor = QTextCursor(loader.page.editor.document())
+        if USING_QT6:
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+        else:
+            cursor.movePosition(QTextCursor.End)
+        cursor.insertText(chunk)
+        loader.chunkConsumed()
+
+    def _onLoadProgress(self, done, total):
+        if self.loader is not None and self.sender() is self.loader and total:
+            self.load_progress.setValue(int(1000 * done / total))
+
+    def _onLoadFailed(self, message):
+        if self.loader is not None and self.sender() is self.loader:
+            self.load_error = message
+
+    def _onLoadFinished(self):
+        loader = self.sender()
+        if loader is None or loader is not self.loader:
+            return
+        page = loader.page
+        self._finishLoad(loader)
+        if self.load_error:
+            page.filepath = None
+            page.editor.journal.start(None, clean=False)
+            self.updateTabTitle(page)
+            QMessageBox.warning(self, "File Open Error",
+                                f"Failed to open file:\n{self.load_error}", MB_OK)
+        elif loader.isInterruptionRequested():
+            page.filepath = None  # never save a partial file over the original
+            page.editor.journal.start(None, clean=False)
+            self.updateTabTitle(page)
+            self.setAddress(page, page.address_text + ' (partial)')
+            self.status.showMessage("Loading cancelled; showing the part read so far.")
+        else:
+            self.status.showMessage("Ready")
+        self._startQueuedLoad()
+
+    @traced("open.finish")
+    def _finishLoad(self, loader):
+        self.loader = None
+        loader.deleteLater()
+        page = loader.page
+        page.loading = False
+        page.state = DocumentPage.LOADED
+        editor = page.editor
+        doc = editor.document()
+        editor.history.start()
+        doc.setModified(False)
+        editor.setReadOnly(False)
+        editor.highlighter.endLoad()
+        editor.journal.start(page.filepath)
+        page.file_offset, page.file_identity = loader.offset, loader.identity
+        page.rememberDiskState()
+        page.restoreView()
+        self.applyGoto(page)
+        self.updateSaveActions()
+        self.load_progress.hide()
+        self.load_cancel_button.hide()
+        QTimer.singleShot(0, self.enforceMemoryBudget)
+
+    def _startQueuedLoad(self):
+        while self.load_queue and self.loader is None:
+            page, filepath = self.load_queue.pop(0)
+            if self.tabs.indexOf(page) >= 0:
+                self.loadFile(filepath, page)
+
     def changeFont(self):
         font, ok = QFontDialog.getFont(self.metapad.font(), self,
                                        'Select a font (applies to selected text if present).')
@@ -542,16 +4483,15 @@ class MainWindow(QMainWindow):
             cursor = self.metapad.textCursor()
             fmt = QTextCharFormat()
             fmt.setFont(font)
+            # Formatting is not part of the undo history; the text is unchanged.
+            history = self.metapad.history
+            recording, history.recording = history.recording, False
             cursor.mergeCharFormat(fmt)
+            history.recording = recording
             self.metapad.setTextCursor(cursor)
 
     def newFile(self):
-        reply = QMessageBox.question(self, 'New File',
-                                     'Do you want to discard changes and start a new file?',
-                                     MB_YES | MB_NO)
-        if reply == MB_YES:
-            self.metapad.clear()
-            self.address.setText('New File')
+        self.newPage()
 
     def openFile(self):
         try:
@@ -565,21 +4505,49 @@ class MainWindow(QMainWindow):
                 options=options
             )
             if fileName:
-                buttonReply = QMessageBox.question(
-                    self.metapad, 'Open new file?',
-                    "All unsaved documents will be lost. If unsure press Cancel now.",
-                    MB_CANCEL | MB_OK
-                )
-                if buttonReply == MB_OK:
-                    with open(fileName, 'r', encoding='utf-8', errors='ignore') as f:
-                        alltxt = f.read()
-                        self.metapad.setPlainText(alltxt)
-                    filename = os.path.basename(fileName)
-                    self.address.setText('Now viewing: ' + filename)
+                self.openPath(fileName)
         except Exception as e:
             print("Cannot handle, Will not continue. Error:", e)
 
     def saveFile(self):
+        """Save to the current file, asking for a name only for new documents."""
+        if not self.checkCanSave():
+            return
+        if self.current_file:
+            if self.page.changedOnDisk() and not self.confirmOverwrite(self.page):
+                return
+            self.startSave(self.current_file)
+        else:
+            self.saveFileAs()
+
+    def checkCanSave(self):
+        """Refuse to save a tab whose text does not (yet) hold the whole file."""
+        if self.page.canSave():
+            return True
+        self.status.showMessage("This tab cannot be saved while its file is loading or followed.")
+        return False
+
+    def confirmOverwrite(self, page):
+        """Ask before saving over changes made to the file outside Metapad."""
+        box = QMessageBox(self)
+        box.setWindowTitle("File changed on disk")
+        box.setText(f"{os.path.basename(page.filepath)} has changed on disk since it was "
+                    "opened or saved. Save over it anyway?")
+        box.setStandardButtons(MB_YES | MB_CANCEL)
+        compare = box.addButton("Compare...", QMessageBox.ButtonRole.ActionRole if USING_QT6
+                                else QMessageBox.ActionRole)
+        if USING_QT6:
+            box.exec()
+        else:
+            box.exec_()
+        if box.clickedButton() is compare:
+            self.compareWithDisk(page)
+            return False
+        return box.standardButton(box.clickedButton()) == MB_YES
+
+    def saveFileAs(self):
+        if not self.checkCanSave():
+            return
         try:
             options = file_dialog_options()
             fileName, _ = QFileDialog.getSaveFileName(
@@ -591,76 +4559,272 @@ class MainWindow(QMainWindow):
                 options=options
             )
             if fileName:
-                with open(fileName, 'w', encoding='utf-8') as f:
-                    f.write(self.metapad.toPlainText())
-                filename = os.path.basename(fileName)
-                self.address.setText('Now viewing: ' + filename)
+                self.startSave(fileName)
         except Exception as e:
             print("Cannot handle, Will not continue. Error:", e)
 
-    # --- Printing helpers (CSS/palette safety — on white theme this is mostly a no-op) ---
-    def _print_to_printer(self, printer):
-        """
-        Ensure black text on white during print/preview.
-        """
-        old_style = self.metapad.styleSheet()
-        old_pal = self.metapad.palette()
+    @traced("save.start")
+    def startSave(self, filepath):
+        """Write a snapshot of the document to `filepath` in the background."""
+        if self.saver is not None:
+            self.status.showMessage("A save is already in progress.")
+            return
+        if not self.checkCanSave():
+            return
+        doc = self.metapad.document()
+        # One flat copy of the text; unlike toPlainText() it keeps non-breaking spaces.
+        self.saver = FileSaver(doc.toRawText(), filepath, self.metapad.encoding,
+                               self.metapad.bom, self.metapad.eol, parent=self)
+        self.saver.page = self.page
+        self.saver.revision = doc.revision()
+        self.saver.error = None
+        self.saver.progress.connect(lambda f: self.save_progress.setValue(int(f * 1000)))
+        self.saver.failed.connect(self._onSaveFailed)
+        self.saver.finished.connect(self._onSaveFinished)
+        self.status.showMessage(f"Saving {os.path.basename(filepath)}...")
+        self.save_progress.setValue(0)
+        self.save_progress.show()
+        self.saver.start()
 
+    def _onSaveFailed(self, message):
+        if self.saver is not None:
+            self.saver.error = message
+
+    def _onSaveFinished(self):
+        saver, self.saver = self.saver, None
+        self.save_progress.hide()
+        saver.deleteLater()
+        if saver.error:
+            self.status.showMessage("Save failed.")
+            QMessageBox.warning(self, "Save Error", f"Failed to save file:\n{saver.error}", MB_OK)
+            return
+        page = saver.page
+        if self.tabs.indexOf(page) < 0:
+            return
+        page.filepath = saver.filepath
+        page.editor.highlighter.setLexer(get_lexer(detect_language(saver.filepath)))
+        doc = page.editor.document()
         try:
-            pal = QPalette(old_pal)
+            st = os.stat(saver.filepath)
+            page.file_offset, page.file_identity = st.st_size, (st.st_dev, st.st_ino)
+        except OSError:
+            page.file_offset = None
+        page.rememberDiskState()
+        if doc.revision() == saver.revision:
+            doc.setModified(False)
+            page.editor.journal.start(saver.filepath)
+        else:
+            # Edited while saving: the old base is gone, so start from a snapshot.
+            page.editor.journal.start(saver.filepath, clean=False)
+            page.editor.journal.compact()
+        self.updateTabTitle(page)
+        self.setAddress(page, 'Now viewing: ' + os.path.basename(saver.filepath))
+        self.status.showMessage(f"Saved {os.path.basename(saver.filepath)}")
+
+    # ---- Crash recovery ----
+    def offerRecovery(self):
+        journals = stale_journals()
+        if not journals:
+            return
+        resp = QMessageBox.question(self, 'Recover documents?',
+                                    f"{len(journals)} document(s) with unsaved changes were left "
+                                    "by a Metapad session that did not exit cleanly. "
+                                    "Recover them? (No discards them.)",
+                                    MB_YES | MB_NO)
+        for path in journals:
+            if resp == MB_YES:
+                try:
+                    self.recoverJournal(path)
+                except (OSError, ValueError, KeyError, UnicodeDecodeError) as e:
+                    QMessageBox.warning(self, "Recovery Error",
+                                        f"Could not recover a document:\n{e}\n\n"
+                                        f"The journal is kept at {path}", MB_OK)
+                    continue
+            self.journal_writer.remove(path)
+
+    @traced("recovery.replay")
+    def recoverJournal(self, path):
+        """Rebuild a document from its base (file or snapshot) plus the journaled edits."""
+        header, text, deltas = read_journal(path)
+        filepath = header['file']
+        if text is None:
+            base = header['base']
+            st = os.stat(filepath)
+            if (st.st_size, st.st_mtime_ns) != (base['size'], base['mtime']):
+                raise ValueError(f"{filepath} has changed since the edits were journaled.")
+            with open(filepath, 'rb') as f:
+                if header['bom']:
+                    f.seek(len(BOM_BYTES[header['encoding']]))
+                text = ''.join(iter_decoded(f, header['encoding']))
+
+        page = self.page if self.page.isBlank() else self.newPage(activate=False)
+        editor = page.editor
+        doc = editor.document()
+        editor.journal.stop()
+        editor.encoding, editor.bom, editor.eol = header['encoding'], header['bom'], header['eol']
+        editor.highlighter.lexer = get_lexer(detect_language(filepath)) if filepath else None
+        editor.highlighter.beginLoad(len(text))
+        editor.history.stop()
+        editor.setPlainText(text)
+        del text
+        cursor = QTextCursor(doc)
+        cursor.beginEditBlock()
+        for pos, removed, inserted in deltas:
+            last = doc.characterCount() - 1
+            cursor.setPosition(min(pos, last))
             if USING_QT6:
-                pal.setColor(QPalette.ColorRole.Text, QColor("black"))
-                pal.setColor(QPalette.ColorRole.Base, QColor("white"))
-                pal.setColor(QPalette.ColorRole.Window, QColor("white"))
+                cursor.setPosition(min(pos + removed, last), QTextCursor.MoveMode.KeepAnchor)
             else:
-                pal.setColor(QPalette.Text, QColor("black"))
-                pal.setColor(QPalette.Base, QColor("white"))
-                pal.setColor(QPalette.Window, QColor("white"))
-            self.metapad.setPalette(pal)
-            self.metapad.setStyleSheet("QPlainTextEdit { color:#000; background:#fff; }")
-            self.metapad.document().print(printer)
-        finally:
-            self.metapad.setStyleSheet(old_style)
-            self.metapad.setPalette(old_pal)
+                cursor.setPosition(min(pos + removed, last), QTextCursor.KeepAnchor)
+            cursor.insertText(inserted)
+        cursor.endEditBlock()
+        editor.history.start()
+        editor.highlighter.endLoad()
+        doc.setModified(True)
+
+        page.filepath = filepath
+        self.updateTabTitle(page)
+        self.setAddress(page, 'Recovered: ' + (os.path.basename(filepath) if filepath
+                                              else 'Untitled'))
+        editor.journal.start(filepath, clean=False)
+        editor.journal.compact()
+        self.tabs.setCurrentWidget(page)
+
+    # --- Printing helpers (a clone is printed, so the editor's styling is never touched) ---
+    def newPrinter(self):
+        QPrinter = print_support().QPrinter
+        mode = getattr(QPrinter, "PrinterMode", None)
+        if mode is not None:  # Qt6
+            return QPrinter(QPrinter.PrinterMode.HighResolution)
+        else:  # Qt5
+            return QPrinter(QPrinter.HighResolution)
+
+    def printSnapshot(self):
+        """A copy of the current document to print, plus the font to print it in."""
+        editor = self.metapad
+        font = QFont(editor.font())
+        if font.pointSizeF() <= 0:
+            # A pixel size (from the stylesheet) would shrink on a high-resolution printer.
+            font.setPointSizeF(font.pixelSize() * 72.0 / editor.logicalDpiY())
+        return editor.document().clone(), font
 
     def printPreview(self):
         try:
-            mode = getattr(QPrinter, "PrinterMode", None)
-            if mode is not None:  # Qt6
-                printer = QPrinter(QPrinter.PrinterMode.HighResolution)
-            else:  # Qt5
-                printer = QPrinter(QPrinter.HighResolution)
-
-            preview = QPrintPreviewDialog(printer, self)
-            preview.paintRequested.connect(self._print_to_printer)
+            printer = self.newPrinter()
+            snapshot, font = self.printSnapshot()
+            paginators = {}  # per page geometry, reused across preview refreshes
+
+            def paint(printer):
+                rect = printer.pageLayout().paintRectPixels(printer.resolution())
+                key = (rect.width(), rect.height(), printer.resolution())
+                if key not in paginators:
+                    paginators[key] = Paginator(snapshot, font, printer)
+                render_pages(paginators[key], printer, max(1, printer.fromPage()),
+                             printer.toPage())
+
+            preview = print_support().QPrintPreviewDialog(printer, self)
+            preview.paintRequested.connect(paint)
             if hasattr(preview, "exec"):
                 preview.exec()
             else:
                 preview.exec_()
+            snapshot.deleteLater()
         except Exception as e:
             QMessageBox.critical(self, "Print Error", str(e), MB_OK)
 
     def printDirect(self):
         try:
-            mode = getattr(QPrinter, "PrinterMode", None)
-            if mode is not None:  # Qt6
-                printer = QPrinter(QPrinter.PrinterMode.HighResolution)
-            else:  # Qt5
-                printer = QPrinter(QPrinter.HighResolution)
-
-            dlg = QPrintDialog(printer, self)
+            QtPrintSupport = print_support()
+            printer = self.newPrinter()
+            dlg = QtPrintSupport.QPrintDialog(printer, self)
+            if USING_QT6:
+                dlg.setOption(QtPrintSupport.QAbstractPrintDialog.PrintDialogOption.PrintPageRange)
+            else:
+                dlg.setOption(QtPrintSupport.QAbstractPrintDialog.PrintPageRange)
             accepted = dlg.exec() if hasattr(dlg, "exec") else dlg.exec_()
             if accepted:
-                self._print_to_printer(printer)
+                self.startPrintJob(printer, "Printing")
         except Exception as e:
             QMessageBox.critical(self, "Print Error", str(e), MB_OK)
 
+    def exportPdf(self):
+        try:
+            QPrinter = print_support().QPrinter
+            base = os.path.splitext(self.current_file)[0] if self.current_file else "Untitled"
+            fileName, _ = QFileDialog.getSaveFileName(self.metapad, "Export to PDF", base + ".pdf",
+                                                      "PDF Files (*.pdf)",
+                                                      options=file_dialog_options())
+            if fileName:
+                printer = self.newPrinter()
+                printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat if USING_QT6
+                                        else QPrinter.PdfFormat)
+                printer.setOutputFileName(fileName)
+                self.startPrintJob(printer, "Exporting PDF")
+        except Exception as e:
+            QMessageBox.critical(self, "Export Error", str(e), MB_OK)
+
+    def startPrintJob(self, printer, description):
+        """Paginate and print a snapshot of the document in the background."""
+        if self.print_job is not None:
+            self.status.showMessage("A print job is already running.")
+            return
+        snapshot, font = self.printSnapshot()
+        self.print_job = PrintJob(snapshot, font, printer, self)
+        self.print_job.description = description
+        self.print_job.error = None
+        self.print_job.progress.connect(
+            lambda pages: self.status.showMessage(f"{description}: {pages:,} page(s)..."))
+        self.print_job.failed.connect(self._onPrintFailed)
+        self.print_job.finished.connect(self._onPrintFinished)
+        self.status.showMessage(f"{description}...")
+        self.print_job.start()
+
+    def _onPrintFailed(self, message):
+        if self.print_job is not None:
+            self.print_job.error = message
+
+    def _onPrintFinished(self):
+        job, self.print_job = self.print_job, None
+        job.snapshot.deleteLater()
+        job.deleteLater()
+        if job.error:
+            self.status.showMessage(f"{job.description} failed.")
+            QMessageBox.critical(self, "Print Error", job.error, MB_OK)
+        else:
+            self.status.showMessage(f"{job.description}: done, {job.pages:,} page(s).")
+
     # --- Single confirmation on close (fixes "must press Exit twice") ---
     def closeEvent(self, event):
         resp = QMessageBox.question(self, 'Quit now?',
                                     "All unsaved documents will be lost. If unsure press Cancel now.",
                                     MB_CANCEL | MB_OK)
         if resp == MB_OK:
+            for page in self.pages():
+                page.closeHuge()
+                if page.follower is not None:
+                    page.follower.stop()
+            self.load_queue = []
+            self.stopLoader()
+            if self.saver is not None:
+                self.saver.wait()  # never abandon a save half-way
+            if self.print_job is not None:
+                self.print_job.requestInterruption()
+                self.print_job.wait()
+            if self.find_in_files_dialog is not None:
+                self.find_in_files_dialog.stop_search(wait=True)
+            if self.quick_open_dialog is not None:
+                self.quick_open_dialog.stop()
+            if self.diff_dialog is not None:
+                self.diff_dialog.stop(wait=True)
+            for page in self.pages():
+                page.editor.journal.stop()  # the user chose to drop unsaved changes
+            self.journal_writer.stop()
+            trace_file = os.environ.get("METAPAD_TRACE_FILE")
+            if TRACER is not None and trace_file:
+                try:
+                    TRACER.export(trace_file)
+                except OSError as e:
+                    print("Cannot write trace file:", e)
             event.accept()
         else:
             event.ignore()
@@ -676,11 +4840,28 @@ class MainWindow(QMainWindow):
 
 # ---- Main Entry Point ----
 if __name__ == '__main__':
+    profile = None
+    new_instance = '--new-instance' in sys.argv
+    if new_instance:
+        sys.argv.remove('--new-instance')
+    if '--trace' in sys.argv:
+        sys.argv.remove('--trace')  # TRACER was already set up at import
+    if '--startup-profile' in sys.argv:
+        sys.argv.remove('--startup-profile')
+        profile = StartupProfile(STARTUP_T0)
+        profile.mark('imports')
     app = QApplication(sys.argv)
-    window = MainWindow()
+    if profile is not None:
+        profile.mark('application')
+        profile.watchFirstPaint(app)
+    window = MainWindow(profile)
     window.show()
     try:
         window.metapad.zoomIn(1)
     except Exception:
         pass
+    if not new_instance:
+        instance_server = InstanceServer(window)
+        instance_server.filesReceived.connect(window.openLocations)
+        instance_server.listen()
     sys.exit(app.exec() if USING_QT6 else app.exec_())
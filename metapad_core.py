@@ -0,0 +1,1285 @@
+#!/usr/bin/env python3
+# Metapad core: text encoding, search/replace and saving without Qt.
+# Shared by the editor and by headless batch mode (metapad.py --batch).
+# GPL v2
+
+import sys, os, re, stat, codecs, tempfile, threading, time, json, argparse, mmap, zlib, bisect
+import functools, itertools
+from array import array
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+
+# ---- Settings ----
+def env_int(name, default):
+    """Read an integer setting from the environment, falling back to `default`."""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# ---- Instrumentation (opt-in: METAPAD_TRACE=1 or --trace) ----
+class Tracer:
+    """
+    Keeps the most recent timing spans in a ring buffer and exports them as
+    Chrome trace-event JSON (chrome://tracing, Perfetto). Appending to a
+    deque is atomic, so worker threads record without locking.
+    """
+
+    def __init__(self, capacity):
+        self.spans = deque(maxlen=capacity)  # (name, thread id, start ns, duration ns)
+        self.t0 = time.perf_counter_ns()
+        self.gui_thread = threading.get_ident()
+
+    def record(self, name, start, end):
+        self.spans.append((name, threading.get_ident(), start, end - start))
+
+    def clear(self):
+        self.spans.clear()
+
+    def summary(self):
+        """[(name, calls, total ns, max ns)], most expensive first."""
+        stats = {}
+        for name, _tid, _start, duration in list(self.spans):
+            entry = stats.get(name)
+            if entry is None:
+                stats[name] = [1, duration, duration]
+            else:
+                entry[0] += 1
+                entry[1] += duration
+                if duration > entry[2]:
+                    entry[2] = duration
+        return sorted(((name, c, total, peak) for name, (c, total, peak) in stats.items()),
+                      key=lambda row: -row[2])
+
+    def chromeTrace(self):
+        pid = os.getpid()
+        events, threads = [], set()
+        for name, tid, start, duration in list(self.spans):
+            threads.add(tid)
+            events.append({'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': pid,
+                           'tid': tid, 'ts': (start - self.t0) / 1000, 'dur': duration / 1000})
+        for tid in threads:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': 'GUI' if tid == self.gui_thread else f'worker {tid}'}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chromeTrace(), f)
+
+
+TRACER = (Tracer(env_int("METAPAD_TRACE_SPANS", 200000))
+          if os.environ.get("METAPAD_TRACE", "0") != "0" or '--trace' in sys.argv else None)
+
+
+def traced(name):
+    """Time every call into TRACER. With tracing off the function is returned untouched."""
+    def decorate(func):
+        if TRACER is None:
+            return func
+        clock, record = time.perf_counter_ns, TRACER.record
+        # Like a Qt slot, drop surplus signal arguments (e.g. clicked's `checked`).
+        nargs = None if func.__code__.co_flags & 0x04 else func.__code__.co_argcount  # CO_VARARGS
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args[:nargs], **kwargs)
+            finally:
+                record(name, start, clock())
+        return timed
+    return decorate
+
+
+# ---- Encoding & Line-Ending Detection ----
+SNIFF_BYTES = 64 * 1024      # only this much is examined to pick encoding and EOL
+FALLBACK_ENCODING = 'latin-1'  # decodes any byte sequence and round-trips exactly
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),   # before UTF-16 LE, which shares a prefix
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+BOM_BYTES = {name: bom for bom, name in BOMS}
+
+
+def detect_encoding(sample):
+    """Return (encoding, has_bom) for the first bytes of a file."""
+    for bom, name in BOMS:
+        if sample.startswith(bom):
+            return name, True
+    half = len(sample) // 2
+    if half:
+        # BOM-less UTF-16: NUL bytes in every other position.
+        even_nuls = sample[0::2].count(0)
+        odd_nuls = sample[1::2].count(0)
+        if odd_nuls > half * 0.3 and even_nuls < half * 0.05:
+            return 'utf-16-le', False
+        if even_nuls > half * 0.3 and odd_nuls < half * 0.05:
+            return 'utf-16-be', False
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8', False
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING, False
+
+
+def detect_eol(text):
+    """Return the most common line ending in `text` ('\\n' if there are none)."""
+    crlf = text.count('\r\n')
+    counts = [(text.count('\n') - crlf, '\n'), (crlf, '\r\n'), (text.count('\r') - crlf, '\r')]
+    count, eol = max(counts, key=lambda c: c[0])
+    return eol if count else '\n'
+
+
+def sniff_file(f):
+    """
+    Detect (encoding, has_bom, eol) from the head of binary file `f` and
+    leave it positioned just after the BOM, ready for iter_decoded.
+    """
+    sample = f.read(SNIFF_BYTES)
+    encoding, bom = detect_encoding(sample)
+    start = len(BOM_BYTES[encoding]) if bom else 0
+    eol = detect_eol(sample[start:].decode(encoding, errors='ignore'))
+    f.seek(start)
+    return encoding, bom, eol
+
+
+def iter_decoded(f, encoding, chunk_bytes=1024 * 1024):
+    """
+    Yield text decoded incrementally from binary file `f`, with all line
+    endings normalized to '\\n'. Raises UnicodeDecodeError on invalid input.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='strict')
+    carry = ''
+    while True:
+        raw = f.read(chunk_bytes)
+        text = carry + decoder.decode(raw, final=not raw)
+        carry = ''
+        if raw and text.endswith('\r'):
+            # The matching '\n' may start the next chunk.
+            text, carry = text[:-1], '\r'
+        if text:
+            yield text.replace('\r\n', '\n').replace('\r', '\n')
+        if not raw:
+            return
+
+def encode_text(chunks, encoding='utf-8', bom=False, eol='\n'):
+    """
+    Encode '\\n'-separated text `chunks` for writing, converting line
+    endings to `eol` and starting with the BOM if `bom` is set.
+    """
+    encoder = codecs.getincrementalencoder(encoding)()
+    if bom:
+        yield BOM_BYTES[encoding]
+    for chunk in chunks:
+        if eol != '\n':
+            chunk = chunk.replace('\n', eol)
+        yield encoder.encode(chunk)
+    tail = encoder.encode('', final=True)
+    if tail:
+        yield tail
+
+
+# ---- Search ----
+def compile_search(pattern, regex=False, case_sensitive=True):
+    """Compile a Find pattern (literal or regex) into a Python regex."""
+    flags = re.MULTILINE
+    if not case_sensitive:
+        flags |= re.IGNORECASE
+    return re.compile(pattern if regex else re.escape(pattern), flags)
+
+
+def find_replacements(text, search, replacement, regex=False, progress=None, cancelled=None):
+    """
+    Scan `text` once and return a list of (start, end, new_text) edits.
+    In regex mode the replacement may use \\1 / \\g<name> group references.
+    `progress(fraction)` is called now and then; if `cancelled()` turns true
+    the scan stops and None is returned.
+    """
+    edits = []
+    size = max(1, len(text))
+    for n, m in enumerate(search.finditer(text)):
+        edits.append((m.start(), m.end(), m.expand(replacement) if regex else replacement))
+        if n % 4096 == 4095:
+            if cancelled is not None and cancelled():
+                return None
+            if progress is not None:
+                progress(m.end() / size)
+    return edits
+
+
+# ---- Atomic Save ----
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@traced("io.write_atomically")
+def write_atomically(filepath, chunks):
+    """
+    Write the byte `chunks` to a temp file next to `filepath`, fsync it and
+    rename it over the target, so a crash never leaves a half-written file.
+    A symlink is followed and the file it points to replaced. The new file
+    is a new inode: other hard links keep the old text, and the owner is
+    kept only where we may chown (otherwise it becomes ours).
+    """
+    filepath = os.path.realpath(filepath)
+    directory = os.path.dirname(filepath)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp',
+                               prefix='.' + os.path.basename(filepath) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            st = os.stat(filepath)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o666 & ~_UMASK)
+        else:
+            if hasattr(os, 'chown') and (st.st_uid, st.st_gid) != (os.getuid(), os.getgid()):
+                try:
+                    os.chown(tmp, st.st_uid, st.st_gid)
+                except OSError:
+                    pass
+            os.chmod(tmp, stat.S_IMODE(st.st_mode))
+        os.replace(tmp, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    # Make the rename itself durable.
+    if hasattr(os, 'O_DIRECTORY'):
+        try:
+            dfd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dfd)
+            finally:
+                os.close(dfd)
+        except OSError:
+            pass
+
+
+# ---- Find in Files (tree walk, memory-mapped scan, trigram index) ----
+SKIP_DIRS = {'.git', '.hg', '.svn', '__pycache__', 'node_modules', '.tox', '.venv', '.mypy_cache'}
+BINARY_SNIFF_BYTES = 8 * 1024
+MAX_FILE_MATCHES = 1000      # per file; the rest of a file's matches are not listed
+MAX_LINE_CHARS = 300         # result lines are cut to this length
+
+INDEX_DIR = (os.environ.get("METAPAD_INDEX_DIR")
+             or os.path.join(os.path.expanduser("~"), ".cache", "metapad", "index"))
+INDEX_MAX_FILE_BYTES = env_int("METAPAD_INDEX_MAX_FILE_MB", 8) * 1024 * 1024
+
+
+def walk_files(root, cancelled=None):
+    """Yield (path, mtime_ns, size) for every regular file under `root`."""
+    stack = [root]
+    while stack:
+        if cancelled is not None and cancelled():
+            return
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in SKIP_DIRS:
+                                stack.append(entry.path)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            yield entry.path, st.st_mtime_ns, st.st_size
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+
+def is_binary(sample):
+    """Guess from the first bytes whether a file is binary (UTF-16/32 text is not)."""
+    return b'\0' in sample and not detect_encoding(sample)[0].startswith(('utf-16', 'utf-32'))
+
+
+def _match_line(text, start, lineno):
+    line_start = text.rfind('\n', 0, start) + 1
+    line_end = text.find('\n', start)
+    line = text[line_start:line_end if line_end >= 0 else len(text)]
+    return (lineno, start - line_start, line[:MAX_LINE_CHARS])
+
+
+def search_file(path, search, literal=None, limit=MAX_FILE_MATCHES):
+    """
+    Return [(line, column, line text)] for the matches of `search` (a
+    compile_search regex) in the file at `path`; binary files give [].
+    `literal`, the search compiled for bytes, scans a memory map of UTF-8
+    files directly instead of decoding them.
+    """
+    results = []
+    with open(path, 'rb') as f:
+        sample = f.read(BINARY_SNIFF_BYTES)
+        if not sample or is_binary(sample):
+            return results
+        f.seek(0)
+        encoding, _bom, eol = sniff_file(f)
+        if literal is not None and encoding == 'utf-8' and eol != '\r':
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lineno, pos = 1, 0
+                for m in literal.finditer(mm):
+                    lineno += mm[pos:m.start()].count(b'\n')
+                    pos = m.start()
+                    line_start = mm.rfind(b'\n', 0, pos) + 1
+                    line_end = mm.find(b'\n', pos)
+                    line = mm[line_start:line_end if line_end >= 0 else len(mm)]
+                    column = len(line[:pos - line_start].decode('utf-8', errors='replace'))
+                    results.append((lineno, column, line[:MAX_LINE_CHARS * 4].decode(
+                        'utf-8', errors='replace')[:MAX_LINE_CHARS]))
+                    if len(results) >= limit:
+                        break
+            return results
+        try:
+            text = ''.join(iter_decoded(f, encoding))
+        except UnicodeDecodeError:
+            f.seek(0)
+            sniff_file(f)
+            text = ''.join(iter_decoded(f, FALLBACK_ENCODING))
+    lineno, pos = 1, 0
+    for m in search.finditer(text):
+        lineno += text.count('\n', pos, m.start())
+        pos = m.start()
+        results.append(_match_line(text, pos, lineno))
+        if len(results) >= limit:
+            break
+    return results
+
+
+def compile_literal(pattern, regex=False, case_sensitive=True):
+    """The bytes twin of compile_search for memory-mapped scans, or None if there is none."""
+    if regex or not pattern.isascii():
+        return None
+    return re.compile(re.escape(pattern.encode('ascii')), 0 if case_sensitive else re.IGNORECASE)
+
+
+def required_literals(pattern, regex=False):
+    """
+    Substrings every match of `pattern` must contain. Regexes are read
+    conservatively: only plain characters outside groups, classes and
+    alternations count, and a character made optional by a quantifier
+    ends the run. Anything this reading cannot follow (inline flags such
+    as (?x), escapes other than a backslash before punctuation or one of
+    the fixed classes and anchors) gives no literals at all.
+    """
+    if not regex:
+        return [pattern]
+    if '|' in pattern or re.search(r'\(\?[-aiLmsux]', pattern):
+        return []
+    runs, run, depth, i = [], '', 0, 0
+    while i < len(pattern):
+        c = pattern[i]
+        literal = None
+        if c == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if escaped.isalnum():
+                if escaped not in 'dDsSwWbBAZ':
+                    return []  # hex, octal, \N{...}, backreferences...: not one character
+            elif escaped:
+                literal = escaped
+            i += 2
+        elif c == '[':
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif c == '{':
+            close = pattern.find('}', i)
+            i = len(pattern) if close < 0 else close + 1
+        else:
+            if c in '()':
+                depth += 1 if c == '(' else -1
+            elif c not in '.^$*?+':
+                literal = c
+            i += 1
+        if literal is not None and depth == 0:
+            run += literal
+            continue
+        if c == '+':
+            continue  # 'a+' still needs one 'a'
+        if c in '*?{':
+            run = run[:-1]  # the quantified character may be absent
+        if len(run) >= 3:
+            runs.append(run)
+        run = ''
+    if len(run) >= 3:
+        runs.append(run)
+    return runs
+
+
+def trigrams(data):
+    """The set of (lower-cased) byte trigrams of `data`, as 24-bit integers."""
+    data = data.lower()
+    return {a << 16 | b << 8 | c for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+
+def query_trigrams(pattern, regex=False, case_sensitive=True):
+    """Trigrams a file must contain to match; an empty set rules nothing out."""
+    result = set()
+    for literal in required_literals(pattern, regex):
+        data = literal.encode('utf-8')
+        if not case_sensitive and not data.isascii():
+            # Case folding beyond ASCII changes the bytes; keep only the ASCII runs.
+            result.update(*(trigrams(part) for part in re.split(rb'[\x80-\xff]+', data)))
+        else:
+            result.update(trigrams(data))
+    return result
+
+
+class TrigramIndex:
+    """
+    On-disk trigram index of a folder: which files contain which byte
+    trigrams. Files are re-read only when their mtime or size changed, so
+    refreshing a large tree costs one directory walk. Files that are not
+    UTF-8 (or too big to index) are always searched.
+    """
+    VERSION = 1
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        name = zlib.crc32(self.root.encode('utf-8', 'surrogateescape'))
+        self.path = os.path.join(INDEX_DIR, f"{name:08x}.trigrams")
+        self.paths = []       # file id -> relative path (None once dead)
+        self.stamps = {}      # relative path -> [file id, mtime_ns, size, indexed]
+        self.postings = {}    # trigram -> array of file ids
+        self.dead = 0
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                raw = zlib.decompress(f.read())
+            header, _, blob = raw.partition(b'\n')
+            header = json.loads(header)
+            if header.get('version') != self.VERSION or header.get('root') != self.root:
+                return
+            ids = array('I')
+            ids.frombytes(blob)
+            self.paths = [rel for rel, _mtime, _size, _indexed in header['files']]
+            self.stamps = {rel: [n, mtime, size, indexed]
+                           for n, (rel, mtime, size, indexed) in enumerate(header['files'])}
+            offset = 0
+            for trigram, count in header['trigrams']:
+                self.postings[trigram] = ids[offset:offset + count]
+                offset += count
+        except (OSError, ValueError, KeyError, TypeError, zlib.error):
+            self.paths, self.stamps, self.postings = [], {}, {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.compact()
+        trigram_counts, blob = [], array('I')
+        for trigram, ids in self.postings.items():
+            trigram_counts.append([trigram, len(ids)])
+            blob.extend(ids)
+        files = [None] * len(self.paths)
+        for rel, (n, mtime, size, indexed) in self.stamps.items():
+            files[n] = [rel, mtime, size, indexed]
+        header = json.dumps({'version': self.VERSION, 'root': self.root, 'files': files,
+                             'trigrams': trigram_counts})
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        write_atomically(self.path, [zlib.compress(header.encode('utf-8') + b'\n'
+                                                   + blob.tobytes(), 1)])
+        self.dirty = False
+
+    def compact(self):
+        """Renumber the live files, dropping ids left behind by changed or deleted files."""
+        if not self.dead:
+            return
+        renumber, paths = {}, []
+        for n, rel in enumerate(self.paths):
+            if rel is not None:
+                renumber[n] = len(paths)
+                self.stamps[rel][0] = len(paths)
+                paths.append(rel)
+        postings = {}
+        for trigram, ids in self.postings.items():
+            live = array('I', (renumber[n] for n in ids if n in renumber))
+            if live:
+                postings[trigram] = live
+        self.paths, self.postings, self.dead = paths, postings, 0
+
+    def forget(self, rel):
+        n = self.stamps.pop(rel)[0]
+        self.paths[n] = None
+        self.dead += 1
+        self.dirty = True
+
+    def add(self, rel, path, mtime, size):
+        n = len(self.paths)
+        self.paths.append(rel)
+        found = None
+        if size <= INDEX_MAX_FILE_BYTES:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                sample = data[:SNIFF_BYTES]
+                if is_binary(sample[:BINARY_SNIFF_BYTES]):
+                    found = set()  # never searched, so it can never match
+                elif detect_encoding(sample)[0] == 'utf-8':
+                    found = trigrams(data)
+            except OSError:
+                pass
+        self.stamps[rel] = [n, mtime, size, found is not None]
+        for trigram in found or ():
+            ids = self.postings.get(trigram)
+            if ids is None:
+                self.postings[trigram] = array('I', [n])
+            else:
+                ids.append(n)
+        self.dirty = True
+
+    def refresh(self, cancelled=None):
+        """Bring the index up to date with the folder; returns the number of files re-read."""
+        seen, updated = set(), 0
+        for path, mtime, size in walk_files(self.root, cancelled):
+            rel = os.path.relpath(path, self.root)
+            seen.add(rel)
+            stamp = self.stamps.get(rel)
+            if stamp is not None and stamp[1] == mtime and stamp[2] == size:
+                continue
+            if stamp is not None:
+                self.forget(rel)
+            self.add(rel, path, mtime, size)
+            updated += 1
+        if cancelled is not None and cancelled():
+            return updated
+        for rel in [rel for rel in self.stamps if rel not in seen]:
+            self.forget(rel)
+        return updated
+
+    def candidates(self, wanted):
+        """Absolute paths of the files that may contain all trigrams in `wanted`."""
+        if wanted:
+            lists = sorted((self.postings.get(t, ()) for t in wanted), key=len)
+            ids = set(lists[0])
+            for more in lists[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(more)
+            rels = {self.paths[n] for n in ids if self.paths[n] is not None}
+        else:
+            rels = set(self.stamps)
+        rels.update(rel for rel, stamp in self.stamps.items() if not stamp[3])
+        return [os.path.join(self.root, rel) for rel in sorted(rels)]
+
+
+# ---- Quick Open (fuzzy file matching) ----
+QUICK_OPEN_LIMIT = 50
+RECENT_PATH = (os.environ.get("METAPAD_RECENT_FILE")
+               or os.path.join(os.path.expanduser("~"), ".cache", "metapad", "recent.json"))
+RECENT_LIMIT = 100
+
+
+def load_recent():
+    """Recently opened files, most recent first."""
+    try:
+        with open(RECENT_PATH, encoding='utf-8') as f:
+            return [path for path in json.load(f) if isinstance(path, str)]
+    except (OSError, ValueError):
+        return []
+
+
+def remember_recent(path, recent):
+    """Move `path` to the front of `recent` and store the list."""
+    path = os.path.abspath(path)
+    recent[:] = [path] + [p for p in recent if p != path][:RECENT_LIMIT - 1]
+    try:
+        os.makedirs(os.path.dirname(RECENT_PATH), exist_ok=True)
+        write_atomically(RECENT_PATH, [json.dumps(recent).encode('utf-8')])
+    except OSError:
+        pass
+
+
+def fuzzy_regex(query):
+    """
+    Regex finding the characters of `query` in order within one line. Each
+    character is taken at its first occurrence after the previous one, so
+    a failing line is given up without backtracking.
+    """
+    rest = ''.join(f'[^{re.escape(c)}\n]*{re.escape(c)}' for c in query[1:])
+    return re.compile(re.escape(query[:1]) + rest)
+
+
+def fuzzy_query(text):
+    return ''.join(text.lower().split())
+
+
+class FileList:
+    """
+    The files under a folder, grouped by directory so that one directory can
+    be rescanned when it changes. Matching runs over newline-joined,
+    lower-cased haystacks of paths and base names, so the scanning happens
+    inside str.find and the regex engine rather than in a Python loop.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.dirs = {}            # relative directory ('' for the root) -> [file names]
+        self._paths = None        # cached: relative paths, haystacks and line starts
+        self._last = None         # (query, recent, results) of a query with few matches
+
+    def scan_dir(self, rel):
+        """List one directory; returns its subdirectories (relative)."""
+        names, subdirs = [], []
+        try:
+            with os.scandir(os.path.join(self.root, rel)) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in SKIP_DIRS:
+                                subdirs.append(os.path.join(rel, entry.name))
+                        elif entry.is_file():
+                            names.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            self.dirs.pop(rel, None)
+            self._paths = self._last = None
+            return []
+        self.dirs[rel] = names
+        self._paths = self._last = None
+        return subdirs
+
+    def walk(self, rel='', cancelled=None):
+        """Scan `rel` and everything below it, breadth first."""
+        pending = deque([rel])
+        while pending:
+            if cancelled is not None and cancelled():
+                return
+            pending.extend(self.scan_dir(pending.popleft()))
+
+    def rescan(self, rel):
+        """Refresh one directory after a change: new subdirectories are walked, gone ones dropped."""
+        known = {d for d in self.dirs if os.path.dirname(d) == rel and d != rel}
+        subdirs = set(self.scan_dir(rel))
+        prefixes = tuple(d + os.sep for d in known - subdirs)
+        for d in [d for d in self.dirs if d in known - subdirs or d.startswith(prefixes)]:
+            del self.dirs[d]
+        for d in subdirs - known:
+            self.walk(d)
+        self._paths = self._last = None
+
+    def paths(self):
+        if self._paths is None:
+            paths = [rel + os.sep + name if rel else name
+                     for rel, names in self.dirs.items() for name in names]
+            paths.sort(key=len)
+            names = [p[p.rfind(os.sep) + 1:] for p in paths]
+            full, base = '\n'.join(paths).lower(), '\n'.join(names).lower()
+            starts_full = array('l', itertools.accumulate((len(p) + 1 for p in paths), initial=0))
+            starts_base = array('l', itertools.accumulate((len(n) + 1 for n in names), initial=0))
+            self._paths = (paths, full, starts_full, base, starts_base)
+        return self._paths[0]
+
+    def __len__(self):
+        return len(self.paths())
+
+    def match(self, text, recent=(), limit=QUICK_OPEN_LIMIT):
+        """
+        Absolute paths matching the fuzzy query `text`, best first: recent
+        files, then hits in the base name (as a substring, then in order),
+        then anywhere in the path. Shorter paths win within a tier.
+        """
+        query = fuzzy_query(text)
+        paths = self.paths()
+        if not query:
+            results = list(recent[:limit])
+            results += [os.path.join(self.root, rel) for rel in paths[:limit - len(results)]]
+            return results
+        rx = fuzzy_regex(query)
+        last = self._last
+        if last is not None and last[1] == recent and fuzzy_regex(last[0]).search(query):
+            # Typing on from a query whose matches were all listed: its hits
+            # are the only candidates left.
+            results = self.rank(query, [p for p in last[2] if rx.search(p.lower())], recent)
+        else:
+            results = self.scan(query, rx, recent, limit)
+        self._last = (query, recent, results) if len(results) < limit else None
+        return results
+
+    def scan(self, query, rx, recent, limit):
+        paths, full, starts_full, base, starts_base = self._paths
+        results = [path for path in recent if rx.search(path.lower())]
+        seen = set(results)
+
+        def find_substring(pos):
+            return base.find(query, pos)
+
+        def find_fuzzy(haystack):
+            def find(pos):
+                m = rx.search(haystack, pos)
+                return m.start() if m else -1
+            return find
+
+        # Paths are sorted by length and hits come in haystack order, so the
+        # first hits of a tier are also its best.
+        tiers = ((find_substring, starts_base), (find_fuzzy(base), starts_base),
+                 (find_fuzzy(full), starts_full))
+        for find, starts in tiers:
+            pos = 0
+            while len(results) < limit:
+                hit = find(pos)
+                if hit < 0:
+                    break
+                line = bisect.bisect_right(starts, hit) - 1
+                path = os.path.join(self.root, paths[line])
+                if path not in seen:
+                    seen.add(path)
+                    results.append(path)
+                pos = starts[line + 1]
+        return results
+
+    def rank(self, query, candidates, recent):
+        """Order a few matching paths the way scan() would have found them."""
+        rx = fuzzy_regex(query)
+
+        def key(path):
+            name = os.path.basename(path).lower()
+            tier = (0 if path in recent else 1 if query in name else 2 if rx.search(name) else 3)
+            return tier, (recent.index(path) if tier == 0 else len(os.path.relpath(path, self.root)))
+        return sorted(candidates, key=key)
+
+
+# ---- Diff (interned lines, patience/histogram diff) ----
+DIFF_MAX_CHAIN = 64     # lines repeated more often than this are never used as anchors
+DIFF_CONTEXT = 3
+
+
+def read_lines(path):
+    """The lines of a text file, decoded and split as the editor would open it."""
+    with open(path, 'rb') as f:
+        encoding, _bom, _eol = sniff_file(f)
+        start = f.tell()
+        try:
+            text = ''.join(iter_decoded(f, encoding))
+        except UnicodeDecodeError:
+            f.seek(start)
+            text = ''.join(iter_decoded(f, FALLBACK_ENCODING))
+    return text.split('\n')
+
+
+def intern_lines(*sequences):
+    """Replace equal lines by equal small integers, so comparing lines is cheap."""
+    ids = {}
+    return [[ids.setdefault(line, len(ids)) for line in lines] for lines in sequences]
+
+
+def _increasing_run(seq):
+    """Indices of a longest strictly increasing subsequence of `seq` (patience sorting)."""
+    tails, tail_index = [], []
+    prev = [-1] * len(seq)
+    for k, x in enumerate(seq):
+        p = bisect.bisect_left(tails, x)
+        if p == len(tails):
+            tails.append(x)
+            tail_index.append(k)
+        else:
+            tails[p] = x
+            tail_index[p] = k
+        if p:
+            prev[k] = tail_index[p - 1]
+    run = []
+    k = tail_index[-1] if tail_index else -1
+    while k >= 0:
+        run.append(k)
+        k = prev[k]
+    run.reverse()
+    return run
+
+
+def _anchors(a, alo, ahi, b, blo, bhi):
+    """
+    Matching line positions (increasing on both sides) to split a region
+    at: the lines unique to each side in longest increasing order, or else
+    the occurrences of the least repeated common line.
+    """
+    count_a = Counter(a[alo:ahi])
+    count_b = Counter(b[blo:bhi])
+    where = {x: i for i, x in enumerate(a[alo:ahi], alo) if count_a[x] == 1}
+    js = [j for j, x in enumerate(b[blo:bhi], blo) if count_b[x] == 1 and x in where]
+    if js:
+        seq = [where[b[j]] for j in js]
+        run = _increasing_run(seq)
+        return [seq[k] for k in run], [js[k] for k in run]
+    common = [x for x in count_a if x in count_b]
+    if not common:
+        return [], []
+    x = min(common, key=lambda x: count_a[x] + count_b[x])
+    if count_a[x] > DIFF_MAX_CHAIN or count_b[x] > DIFF_MAX_CHAIN:
+        return [], []
+    ai = [i for i, y in enumerate(a[alo:ahi], alo) if y == x]
+    bj = [j for j, y in enumerate(b[blo:bhi], blo) if y == x]
+    n = min(len(ai), len(bj))
+    return ai[:n], bj[:n]
+
+
+def diff_lines(a, b, cancelled=None):
+    """
+    Hunks (i1, i2, j1, j2), each meaning a[i1:i2] became b[j1:j2], for two
+    lists of interned lines. Common prefixes and suffixes are matched
+    directly; the rest of a region is split at anchors (see _anchors) and
+    the gaps between them are diffed in turn. An explicit stack keeps the
+    matches in order and the space linear. Returns None if cancelled.
+    """
+    hunks = []
+    done_a = done_b = 0     # end of the last match
+    stack = [('region', 0, len(a), 0, len(b))]
+    steps = 0
+    while stack:
+        steps += 1
+        if cancelled is not None and not steps % 4096 and cancelled():
+            return None
+        item = stack.pop()
+        kind = item[0]
+        if kind == 'match':
+            _, i, j, n = item
+            if i > done_a or j > done_b:
+                hunks.append((done_a, i, done_b, j))
+            done_a, done_b = i + n, j + n
+            continue
+        if kind == 'anchors':
+            _, ai, bj, k, ahi, bhi = item
+            start = k
+            while k + 1 < len(ai) and ai[k + 1] == ai[k] + 1 and bj[k + 1] == bj[k] + 1:
+                k += 1
+            if k + 1 < len(ai):
+                stack.append(('anchors', ai, bj, k + 1, ahi, bhi))
+                end_a, end_b = ai[k + 1], bj[k + 1]
+            else:
+                end_a, end_b = ahi, bhi
+            if ai[k] + 1 < end_a or bj[k] + 1 < end_b:
+                stack.append(('region', ai[k] + 1, end_a, bj[k] + 1, end_b))
+            stack.append(('match', ai[start], bj[start], k - start + 1))
+            continue
+
+        _, alo, ahi, blo, bhi = item
+        i, j = alo, blo
+        while i < ahi and j < bhi and a[i] == b[j]:
+            i += 1
+            j += 1
+        prefix = i - alo
+        alo, blo = i, j
+        i, j = ahi, bhi
+        while i > alo and j > blo and a[i - 1] == b[j - 1]:
+            i -= 1
+            j -= 1
+        if i < ahi:
+            stack.append(('match', i, j, ahi - i))
+        ahi, bhi = i, j
+        if alo < ahi and blo < bhi:
+            ai, bj = _anchors(a, alo, ahi, b, blo, bhi)
+            if ai:
+                stack.append(('anchors', ai, bj, 0, ahi, bhi))
+                if alo < ai[0] or blo < bj[0]:
+                    stack.append(('region', alo, ai[0], blo, bj[0]))
+        if prefix:
+            stack.append(('match', alo - prefix, blo - prefix, prefix))
+    if done_a < len(a) or done_b < len(b):
+        hunks.append((done_a, len(a), done_b, len(b)))
+    return hunks
+
+
+def format_hunks(a_lines, b_lines, hunks, context=DIFF_CONTEXT, limit=None):
+    """
+    Unified diff lines for `hunks`, merging hunks whose context touches.
+    Returns (lines, groups): groups are (index of the @@ line, first
+    changed line of `b_lines`, 0-based). Stops after about `limit` lines.
+    """
+    lines, groups = [], []
+    k = 0
+    while k < len(hunks):
+        end = k
+        while end + 1 < len(hunks) and hunks[end + 1][0] - hunks[end][1] <= 2 * context:
+            end += 1
+        a_start = max(0, hunks[k][0] - context)
+        b_start = max(0, hunks[k][2] - context)
+        a_end = min(len(a_lines), hunks[end][1] + context)
+        b_end = min(len(b_lines), hunks[end][3] + context)
+        groups.append((len(lines), hunks[k][2]))
+        lines.append(f"@@ -{a_start + 1},{a_end - a_start} +{b_start + 1},{b_end - b_start} @@")
+        i = a_start
+        for i1, i2, j1, j2 in hunks[k:end + 1]:
+            lines.extend(' ' + line for line in a_lines[i:i1])
+            lines.extend('-' + line for line in a_lines[i1:i2])
+            lines.extend('+' + line for line in b_lines[j1:j2])
+            i = i2
+        lines.extend(' ' + line for line in a_lines[i:a_end])
+        k = end + 1
+        if limit is not None and len(lines) >= limit:
+            lines.append(f"... {len(hunks) - k} more change(s) not shown")
+            break
+    return lines, groups
+
+
+# ---- Undo Stack (bounded in memory, spilled to a temporary file) ----
+def step_size(step):
+    """Approximate bytes held by an undo step of [position, removed, inserted] edits."""
+    return sum(2 * (len(removed) + len(inserted)) + 64 for _pos, removed, inserted in step)
+
+
+class UndoStack:
+    """
+    A stack of undo steps, newest last. Past `max_steps` steps or
+    `max_bytes` of text the oldest steps leave memory: with `spill` they
+    are appended (compressed) to a temporary file and read back when the
+    stack is popped down to them, otherwise they are dropped.
+    """
+
+    def __init__(self, max_steps, max_bytes, spill=True):
+        self.max_steps = max(1, max_steps)
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self.steps = deque()
+        self.sizes = deque()
+        self.bytes = 0
+        self.spilled = []   # file offsets of spilled steps, oldest first
+        self.file = None
+
+    def __len__(self):
+        return len(self.steps) + len(self.spilled)
+
+    def top(self):
+        return self.steps[-1] if self.steps else None
+
+    def push(self, step):
+        size = step_size(step)
+        self.steps.append(step)
+        self.sizes.append(size)
+        self.bytes += size
+
+    def grow(self, size):
+        """Account for `size` more bytes added to the top step."""
+        self.sizes[-1] += size
+        self.bytes += size
+
+    def pop(self):
+        if self.steps:
+            self.bytes -= self.sizes.pop()
+            return self.steps.pop()
+        if not self.spilled:
+            return None
+        offset = self.spilled.pop()
+        try:
+            self.file.seek(offset)
+            step = json.loads(zlib.decompress(self.file.read()))
+            self.file.truncate(offset)
+        except (OSError, ValueError, zlib.error):
+            self.clear()
+            return None
+        return step
+
+    def trim(self):
+        """Move the oldest steps out of memory until the limits are met."""
+        keep = 0 if self.spill else 1
+        while len(self.steps) > keep and (len(self.steps) > self.max_steps
+                                          or self.bytes > self.max_bytes):
+            step = self.steps.popleft()
+            self.bytes -= self.sizes.popleft()
+            if self.spill:
+                self._write(step)
+
+    def _write(self, step):
+        data = zlib.compress(json.dumps(step, separators=(',', ':')).encode('ascii'), 1)
+        offset = None
+        try:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile(prefix='metapad-undo-')
+            offset = self.file.seek(0, os.SEEK_END)
+            self.file.write(data)
+            self.file.flush()
+        except OSError:
+            # No room on disk: drop old steps from now on.
+            self.spill = False
+            if offset is not None:
+                try:
+                    self.file.truncate(offset)
+                except OSError:
+                    pass
+            return
+        self.spilled.append(offset)
+
+    def clear(self):
+        self.steps.clear()
+        self.sizes.clear()
+        self.bytes = 0
+        self.spilled = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# ---- Batch Mode (headless: metapad.py --batch) ----
+# Files up to this size are replaced as a whole, exactly like Replace All in
+# the editor; larger ones are streamed a few MB of whole lines at a time.
+BATCH_STREAM_BYTES = env_int("METAPAD_BATCH_STREAM_MB", 64) * 1024 * 1024
+BATCH_CHUNK_CHARS = 4 * 1024 * 1024
+BATCH_CONTEXT_CHARS = 64 * 1024   # text around a chunk that its matches may look at
+
+EOL_CHOICES = {'lf': '\n', 'crlf': '\r\n', 'cr': '\r'}
+EOL_LABELS = {'\n': 'LF', '\r\n': 'CRLF', '\r': 'CR'}
+
+
+def splice(text, edits):
+    """Return `text` with the (start, end, new_text) `edits` applied."""
+    pieces, prev = [], 0
+    for start, end, new in edits:
+        pieces.append(text[prev:start])
+        pieces.append(new)
+        prev = end
+    pieces.append(text[prev:])
+    return ''.join(pieces)
+
+
+def line_chunks(chunks, chunk_chars=BATCH_CHUNK_CHARS):
+    """
+    Regroup decoded text into pieces of about `chunk_chars` that end on a
+    line break, so few matches run from one piece into the next.
+    """
+    pending, size = [], 0
+    for text in chunks:
+        pending.append(text)
+        size += len(text)
+        if size >= chunk_chars:
+            text = ''.join(pending)
+            cut = text.rfind('\n') + 1
+            if cut:
+                yield text[:cut]
+                text = text[cut:]
+            pending, size = [text], len(text)
+    tail = ''.join(pending)
+    if tail:
+        yield tail
+
+
+def stream_edits(pieces, search, replacement, regex=False, context=BATCH_CONTEXT_CHARS):
+    """
+    find_replacements over text that arrives in `pieces`, yielding
+    (text, edits) with the edits relative to each yielded text; joined,
+    the texts give back the input. Every piece is matched inside a window
+    with `context` characters of the text on either side, so anchors,
+    lookarounds and matches running into the next piece come out as on the
+    whole text, as long as matching never looks further than that. A match
+    that reaches the end of the window may be cut short, so it raises
+    ValueError instead.
+    """
+    pieces = iter(pieces)
+    text = next(pieces, None)
+    ahead, queued = deque(), 0    # pieces read past `text`, and their length
+    before, skip = '', 0
+    while text is not None:
+        # One character more than the window needs tells whether the window ends the text.
+        while queued <= context:
+            more = next(pieces, None)
+            if more is None:
+                break
+            ahead.append(more)
+            queued += len(more)
+        after, need = [], context
+        for piece in ahead:
+            if need <= 0:
+                break
+            after.append(piece[:need])
+            need -= len(piece)
+        window = before + text + ''.join(after)
+        start, limit = len(before) + skip, len(before) + len(text)
+        edits, end = [], limit
+        for m in search.finditer(window, start):
+            if m.start() >= limit and ahead:
+                break  # the next window finds it, with the text after it in view
+            if m.end() == len(window) and queued > context:
+                raise ValueError(f"a match runs more than {context:,} characters past a chunk "
+                                 "of the stream; raise METAPAD_BATCH_STREAM_MB")
+            edits.append((m.start() - start, m.end() - start,
+                          m.expand(replacement) if regex else replacement))
+            end = max(end, m.end())
+        yield window[start:end], edits
+        before = window[max(0, end - context):end]
+        skip = end - limit
+        text = None
+        while ahead and (text is None or skip > len(text)):
+            piece = ahead.popleft()
+            queued -= len(piece)
+            text = piece if text is None else text + piece
+
+
+def codec_name(encoding):
+    return codecs.lookup(encoding).name
+
+
+def batch_file(path, options):
+    """
+    Apply the batch `options` to one file and return its statistics. Runs in
+    a pool worker process, so nothing here may need Qt.
+    """
+    started = time.perf_counter()
+    stats = {'path': path, 'bytes': 0, 'written': 0, 'matches': 0, 'changed': False,
+             'encoding': None, 'eol': None, 'error': None}
+    try:
+        stats['bytes'] = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            encoding, bom, eol = sniff_file(f)
+        search = None
+        if options.find is not None:
+            search = compile_search(options.find, options.regex, not options.ignore_case)
+        stream = stats['bytes'] > BATCH_STREAM_BYTES
+
+        def decoded(encoding):
+            with open(path, 'rb') as f:
+                sniff_file(f)
+                chunks = iter_decoded(f, encoding)
+                if stream:
+                    yield from line_chunks(chunks)
+                else:
+                    yield ''.join(chunks)
+
+        def edited(encoding):
+            if search is None:
+                yield from ((text, []) for text in decoded(encoding))
+            elif stream:
+                yield from stream_edits(decoded(encoding), search, options.replace, options.regex)
+            else:
+                for text in decoded(encoding):
+                    yield text, find_replacements(text, search, options.replace, options.regex)
+
+        def replaced(encoding):
+            for text, edits in edited(encoding):
+                stats['matches'] += len(edits)
+                yield splice(text, edits)
+
+        for source in (encoding, FALLBACK_ENCODING):
+            target = codec_name(options.encoding or source)
+            target_bom = bom and source == encoding and target in BOM_BYTES
+            target_eol = EOL_CHOICES[options.eol] if options.eol else eol
+            stats['encoding'] = (source, target)
+            stats['eol'] = (EOL_LABELS[eol], EOL_LABELS[target_eol])
+            convert = (target != codec_name(source) or target_bom != bom or target_eol != eol)
+            try:
+                if not convert and not any(edits for _, edits in edited(source)):
+                    break  # nothing would change; leave the file alone
+                stats['matches'] = 0
+                data = encode_text(replaced(source), target, target_bom, target_eol)
+                if options.dry_run:
+                    stats['written'] = sum(len(chunk) for chunk in data)
+                else:
+                    def counted(data):
+                        for chunk in data:
+                            stats['written'] += len(chunk)
+                            yield chunk
+                    write_atomically(path, counted(data))
+                stats['changed'] = True
+                break
+            except UnicodeDecodeError:
+                if source == FALLBACK_ENCODING:
+                    raise
+                # The sample looked like UTF-8 but later bytes are not.
+                stats['matches'] = stats['written'] = 0
+    except Exception as e:
+        stats['error'] = f"{type(e).__name__}: {e}"
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def format_stats(stats, dry_run=False):
+    """One line of per-file statistics for the batch report."""
+    if stats['error']:
+        return f"{stats['path']}: error: {stats['error']}"
+    (source, target), (eol, target_eol) = stats['encoding'], stats['eol']
+    encoding = source if codec_name(source) == target else f"{source} -> {target}"
+    eol = eol if eol == target_eol else f"{eol} -> {target_eol}"
+    if stats['changed']:
+        size = f"{stats['bytes']:,} -> {stats['written']:,} bytes"
+        action = "would be written" if dry_run else "written"
+    else:
+        size, action = f"{stats['bytes']:,} bytes", "unchanged"
+    return (f"{stats['path']}: {stats['matches']:,} replacement(s), {encoding}, {eol}, "
+            f"{size}, {action} in {stats['seconds']:.3f} s")
+
+
+def batch_parser():
+    parser = argparse.ArgumentParser(
+        prog="metapad.py --batch",
+        description="Apply Metapad's find/replace and encoding conversions to files "
+                    "without opening a window.")
+    parser.add_argument('files', nargs='+', help="files to process")
+    parser.add_argument('--replace', nargs=2, metavar=('PATTERN', 'REPL'),
+                        help="replace every match of PATTERN with REPL")
+    parser.add_argument('--regex', action='store_true',
+                        help="PATTERN is a regular expression; REPL may use \\1 / \\g<name>")
+    parser.add_argument('--ignore-case', action='store_true', help="match case-insensitively")
+    parser.add_argument('--encoding', help="save in this encoding (default: keep the detected one)")
+    parser.add_argument('--normalize-eol', dest='eol', action='store_const', const='lf',
+                        help="convert line endings to LF")
+    parser.add_argument('--eol', choices=sorted(EOL_CHOICES),
+                        help="convert line endings to this style")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="report what would change without writing")
+    return parser
+
+
+def batch_main(argv=None):
+    """Entry point of `metapad.py --batch`; returns the process exit code."""
+    parser = batch_parser()
+    options = parser.parse_args(argv)
+    options.find, options.replace = options.replace or (None, None)
+    if options.encoding:
+        try:
+            options.encoding = codec_name(options.encoding)
+        except LookupError:
+            parser.error(f"unknown encoding: {options.encoding}")
+    if options.regex and options.find is not None:
+        try:
+            re.compile(options.find)
+        except re.error as e:
+            parser.error(f"bad pattern: {e}")
+
+    files = options.files
+    jobs = max(1, min(options.jobs, len(files)))
+    if jobs == 1:
+        results = (batch_file(path, options) for path in files)
+        pool = None
+    else:
+        # Forked workers start without re-importing metapad.py (and with it Qt).
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        pool = ProcessPoolExecutor(max_workers=jobs, mp_context=context)
+        results = pool.map(batch_file, files, [options] * len(files))
+
+    failed = matches = changed = 0
+    try:
+        for stats in results:
+            print(format_stats(stats, options.dry_run), file=sys.stderr if stats['error'] else sys.stdout,
+                  flush=True)
+            failed += stats['error'] is not None
+            matches += stats['matches']
+            changed += stats['changed']
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(f"{len(files):,} file(s), {changed:,} {'to change' if options.dry_run else 'changed'}, "
+          f"{matches:,} replacement(s), {failed:,} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(batch_main())
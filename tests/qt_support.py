@@ -0,0 +1,40 @@
+"""Shared setup for the tests that need a Qt binding; they are skipped without one."""
+import os
+import sys
+import tempfile
+import unittest
+from importlib import import_module
+from unittest import mock
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+SCRATCH = tempfile.mkdtemp(prefix='metapad-tests-')
+# Never touch the user's journal or recent files.
+os.environ['METAPAD_JOURNAL_DIR'] = os.path.join(SCRATCH, 'journal')
+os.environ['METAPAD_RECENT_FILE'] = os.path.join(SCRATCH, 'recent.json')
+
+try:
+    import metapad
+except ImportError:
+    raise unittest.SkipTest("needs PyQt6 or PyQt5")
+QTest = import_module(('PyQt6' if metapad.USING_QT6 else 'PyQt5') + '.QtTest').QTest
+
+app = metapad.QApplication.instance() or metapad.QApplication([])
+
+
+class WindowTestCase(unittest.TestCase):
+    """A MainWindow per test, with its background threads stopped afterwards."""
+
+    def setUp(self):
+        with mock.patch.object(sys, 'argv', sys.argv[:1]):  # MainWindow opens sys.argv[1:]
+            self.window = metapad.MainWindow()
+
+    def tearDown(self):
+        window = self.window
+        window.stopLoader()
+        for page in window.pages():
+            page.closeHuge()
+            window.stopFollowing(page)
+            page.editor.journal.stop()
+        window.journal_writer.stop()
+        window.deleteLater()
+        app.processEvents()
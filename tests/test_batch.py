@@ -0,0 +1,70 @@
+"""Streamed batch replacement must give the same result as replacing the whole file."""
+import os
+import random
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import metapad_core
+from metapad_core import (batch_file, batch_parser, compile_search, find_replacements, splice,
+                          stream_edits)
+
+TOKENS = ['a', 'b', 'ab', '\\n', '$', '^', '\\Z', '\\A', '\\b', '\\B', '(?=a)', '(?!b)',
+          '(?<=b)', '(?<!\\n)', '(?<=a\\n)', '.', '.*', 'a*', 'b+', '\\s', '[^a]', '(a|\\n)',
+          '()', '?', '']
+
+
+def split(text, rng):
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 6)))
+    return [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+
+
+def batch(path, *args):
+    options = batch_parser().parse_args([path, '--dry-run', *args])
+    options.find, options.replace = options.replace or (None, None)
+    return batch_file(path, options)
+
+
+class StreamEditsTest(unittest.TestCase):
+    def test_random_patterns_match_whole_text(self):
+        rng = random.Random(19)
+        compared = 0
+        for _ in range(3000):
+            pattern = ''.join(rng.choice(TOKENS) for _ in range(rng.randint(1, 4)))
+            try:
+                search = compile_search(pattern, regex=True)
+            except re.error:
+                continue
+            # Lines stay short, so no match attempt looks past the window.
+            text = ''.join(''.join(rng.choice('ab') for _ in range(rng.randint(0, 5)))
+                           + rng.choice(['\n', '\n', '']) for _ in range(rng.randint(0, 15)))
+            whole = splice(text, find_replacements(text, search, '<\\g<0>>', True))
+            streamed = ''.join(splice(piece, edits) for piece, edits in
+                               stream_edits(split(text, rng), search, '<\\g<0>>', True, 32))
+            self.assertEqual(streamed, whole, (pattern, text))
+            compared += 1
+        self.assertGreater(compared, 1000)
+
+    def test_long_match_is_refused(self):
+        with self.assertRaises(ValueError):
+            list(stream_edits(['aaaa', 'aaaa', 'aaaa'], re.compile('a+'), '', False, 2))
+
+
+class BatchFileTest(unittest.TestCase):
+    def test_streamed_anchor_count(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'big.txt')
+            with open(path, 'w') as f:
+                f.write(('abcdefghijklmn' * 10 + '\n') * 30000)  # 4.2 MB, more than a chunk
+            expected = batch(path, '--regex', '--replace', '$', 'x')
+            with mock.patch.object(metapad_core, 'BATCH_STREAM_BYTES', 0):
+                streamed = batch(path, '--regex', '--replace', '$', 'x')
+            self.assertIsNone(streamed['error'])
+            self.assertEqual(expected['matches'], 30001)
+            self.assertEqual(streamed['matches'], expected['matches'])
+            self.assertEqual(streamed['written'], expected['written'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+"""Tabs that leave memory come back with exactly the same text."""
+import unittest
+
+from qt_support import WindowTestCase
+
+TEXT = 'café\xa0ok\n\ttabbed line\n\nlast'
+
+
+class CompressTest(WindowTestCase):
+    def test_round_trip_keeps_every_character(self):
+        page = self.window.page
+        page.editor.setPlainText(TEXT)
+        page.editor.document().setModified(True)
+        page.compress()
+        self.assertEqual(page.editor.rawText(), '')
+        page.decompress()
+        self.assertEqual(page.editor.rawText(), TEXT)
+        self.assertTrue(page.isModified())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Find & Replace only ever touches the characters that match."""
+import unittest
+from unittest import mock
+
+from qt_support import WindowTestCase, app, metapad
+
+
+class FindReplaceTestCase(WindowTestCase):
+    def setUp(self):
+        super().setUp()
+        self.editor = self.window.page.editor
+        self.dialog = metapad.FindReplaceDialog(self.window, self.editor)
+        self.reports = mock.patch.object(metapad.QMessageBox, 'information')
+        self.reports.start()
+
+    def tearDown(self):
+        self.reports.stop()
+        super().tearDown()
+
+    def load(self, text):
+        self.editor.history.stop()
+        self.editor.setPlainText(text)
+        self.editor.history.start()
+        self.editor.document().setModified(False)
+
+
+class ReplaceAllTest(FindReplaceTestCase):
+    def replace_all(self, find, replace):
+        self.dialog.find_input.setText(find)
+        self.dialog.replace_input.setText(replace)
+        self.dialog.replace_all()
+        while self.dialog.replace_worker is not None:
+            app.processEvents()
+
+    def test_non_breaking_space_is_not_a_space(self):
+        self.load('a\xa0b c')
+        self.replace_all(' ', '_')
+        self.assertEqual(self.editor.rawText(), 'a\xa0b_c')
+        self.editor.history.undo()
+        self.assertEqual(self.editor.rawText(), 'a\xa0b c')
+
+
+class MatchCountTest(FindReplaceTestCase):
+    def count(self, find):
+        self.dialog.show()
+        self.dialog.find_input.setText(find)
+        self.dialog.start_search()
+        while self.dialog.scan_worker is not None:
+            app.processEvents()
+        return len(self.dialog.match_index)
+
+    def test_non_breaking_space_is_not_counted_as_a_space(self):
+        self.load('a\xa0b c d')
+        self.assertEqual(self.count(' '), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
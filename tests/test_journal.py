@@ -0,0 +1,36 @@
+"""Crash-recovery journals give back exactly the text that was being edited."""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from qt_support import app, metapad
+
+TEXT = 'café\xa0ok\n\ttabbed line\n\nlast'
+
+
+class CompactTest(unittest.TestCase):
+    def setUp(self):
+        self.editor = metapad.Metapad()
+        self.writer = mock.Mock(spec=metapad.JournalWriter)
+        self.journal = metapad.EditJournal(self.editor, self.writer)
+
+    def tearDown(self):
+        self.editor.deleteLater()
+        app.processEvents()
+
+    def test_snapshot_keeps_every_character(self):
+        self.editor.setPlainText(TEXT)
+        self.journal.compact()
+        path, records = self.writer.replace.call_args.args
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, os.path.basename(path))
+            with open(path, 'wb') as f:
+                f.write(metapad.encode_records(records))
+            header, snapshot, deltas = metapad.read_journal(path)
+        self.assertEqual(snapshot, TEXT)
+        self.assertEqual(deltas, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""The trigram index must never rule out a file that a brute-force search would find."""
+import os
+import random
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import metapad_core
+from metapad_core import (compile_search, query_trigrams, required_literals, trigrams,
+                          TrigramIndex)
+
+ALPHABET = 'abcAB _.\n'
+TOKENS = (list('abcab') + ['A', 'é', ' ', '.', '^', '$', '*', '+', '?', '{2}', '{0,1}',
+          '(', ')', '(?:', '(?=', '(?i)', '(?x)', '(?s:', '[ab]', '[^a]', '|', '\\.', '\\ ',
+          '\\d', '\\w', '\\b', '\\x41', '\\x61bc', '\\0141', '\\1', '\\u0061', '\\N{LATIN SMALL LETTER A}',
+          '\\n', '\\Z', '\\A', '+?', '*?'])
+
+
+def random_pattern(rng):
+    return ''.join(rng.choice(TOKENS) for _ in range(rng.randint(1, 8)))
+
+
+def random_text(rng):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+
+
+class RequiredLiteralsTest(unittest.TestCase):
+    def test_escapes_and_flags_give_no_literals(self):
+        for pattern in (r'\x41bcd', r'x\0123yz', r'\N{DIGIT ONE}23abc', r'\u0061bcd',
+                        r'(?x)a b c d', r'(?i)abcd', r'(a)\1bcd'):
+            self.assertEqual(required_literals(pattern, regex=True), [], pattern)
+
+    def test_plain_runs(self):
+        self.assertEqual(required_literals(r'foo\.bar\d+baz', regex=True), ['foo.bar', 'baz'])
+        self.assertEqual(required_literals('abcd*', regex=True), ['abc'])
+        self.assertEqual(required_literals('a|b', regex=True), [])
+
+    def test_random_patterns_match_brute_force(self):
+        rng = random.Random(20)
+        texts = [random_text(rng) for _ in range(200)]
+        grams = [trigrams(text.encode('utf-8')) for text in texts]
+        checked = 0
+        for _ in range(3000):
+            pattern = random_pattern(rng)
+            for case_sensitive in (True, False):
+                try:
+                    search = compile_search(pattern, True, case_sensitive)
+                except (re.error, OverflowError):
+                    continue
+                wanted = query_trigrams(pattern, True, case_sensitive)
+                for text, found in zip(texts, grams):
+                    if search.search(text):
+                        checked += 1
+                        self.assertLessEqual(wanted, found, (pattern, case_sensitive, text))
+        self.assertGreater(checked, 1000)
+
+
+class TrigramIndexTest(unittest.TestCase):
+    def test_candidates_cover_brute_force(self):
+        rng = random.Random(3)
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as index_dir:
+            texts = {}
+            for n in range(60):
+                path = os.path.join(root, f"f{n}.txt")
+                texts[path] = random_text(rng) + 'x'
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(texts[path])
+            with mock.patch.object(metapad_core, 'INDEX_DIR', index_dir):
+                index = TrigramIndex(root)
+                index.refresh()
+                for _ in range(1000):
+                    pattern = random_pattern(rng)
+                    try:
+                        search = compile_search(pattern, True)
+                    except (re.error, OverflowError):
+                        continue
+                    brute = {path for path, text in texts.items() if search.search(text)}
+                    indexed = set(index.candidates(query_trigrams(pattern, True)))
+                    self.assertLessEqual(brute, indexed, pattern)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""The bounded undo history: UndoStack spilling, and UndoHistory on a live editor."""
+import unittest
+
+from metapad_core import UndoStack, step_size
+
+
+def steps(n, width=10):
+    return [[[i, '', chr(ord('a') + i % 26) * width]] for i in range(n)]
+
+
+class UndoStackTest(unittest.TestCase):
+    def test_old_steps_spill_and_come_back_in_order(self):
+        stack = UndoStack(max_steps=2, max_bytes=1 << 20)
+        made = steps(6)
+        for step in made:
+            stack.push(step)
+            stack.trim()
+        self.assertEqual(len(stack), 6)
+        self.assertEqual(len(stack.steps), 2)
+        self.assertEqual([stack.pop() for _ in range(6)], made[::-1])
+        self.assertIsNone(stack.pop())
+        stack.clear()
+        self.assertIsNone(stack.file)
+
+    def test_byte_limit(self):
+        made = steps(5, width=100)
+        stack = UndoStack(max_steps=100, max_bytes=2 * step_size(made[0]))
+        for step in made:
+            stack.push(step)
+            stack.trim()
+        self.assertEqual(len(stack.steps), 2)
+        self.assertEqual(stack.bytes, 2 * step_size(made[0]))
+        self.assertEqual(len(stack), 5)
+
+    def test_without_spill_old_steps_are_dropped_but_one_stays(self):
+        made = steps(4, width=100)
+        stack = UndoStack(max_steps=2, max_bytes=1, spill=False)
+        for step in made:
+            stack.push(step)
+            stack.trim()
+        self.assertEqual(len(stack), 1)
+        self.assertEqual(stack.pop(), made[-1])
+        self.assertIsNone(stack.pop())
+        self.assertIsNone(stack.file)
+
+
+try:
+    from qt_support import QTest, app, metapad
+except unittest.SkipTest:
+    metapad = None
+
+
+@unittest.skipIf(metapad is None, "needs PyQt6 or PyQt5")
+class UndoHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.editor = metapad.Metapad()
+        self.history = self.editor.history
+
+    def tearDown(self):
+        self.history.clear()
+        self.editor.deleteLater()
+        app.processEvents()
+
+    def load(self, text):
+        self.history.stop()
+        self.editor.setPlainText(text)
+        self.history.start()
+        self.editor.document().setModified(False)
+
+    def move_to(self, position):
+        cursor = self.editor.textCursor()
+        cursor.setPosition(position)
+        self.editor.setTextCursor(cursor)
+
+    def type(self, text):
+        QTest.keyClicks(self.editor, text)
+        app.processEvents()  # ends the step, as the event loop would
+
+    def press(self, name):
+        """Press the first binding of the standard key `name` (e.g. 'Undo')."""
+        keys = metapad.QKeySequence.StandardKey if metapad.USING_QT6 else metapad.QKeySequence
+        bindings = metapad.QKeySequence.keyBindings(getattr(keys, name))
+        if not bindings:
+            self.skipTest(f"no key binding for {name} on this platform")
+        combo = bindings[0][0]
+        if metapad.USING_QT6:
+            key, modifiers = combo.key(), combo.keyboardModifiers()
+        else:
+            mask = int(metapad.Qt.KeyboardModifierMask)
+            key, modifiers = combo & ~mask, metapad.Qt.KeyboardModifiers(combo & mask)
+        QTest.keyClick(self.editor, key, modifiers)
+        app.processEvents()
+
+    def text(self):
+        return self.editor.rawText()
+
+    def test_typing_coalesces_into_one_step(self):
+        self.load('')
+        self.type('hello')
+        self.assertEqual(len(self.history.undo_stack), 1)
+        self.history.undo()
+        self.assertEqual(self.text(), '')
+        self.assertFalse(self.editor.document().isModified())
+        self.history.redo()
+        self.assertEqual(self.text(), 'hello')
+        self.assertTrue(self.editor.document().isModified())
+
+    def test_undo_redo_through_the_keyboard(self):
+        self.load('one\ntwo')
+        self.move_to(3)
+        self.type(' more')
+        self.press('Undo')
+        self.assertEqual(self.text(), 'one\ntwo')
+        self.press('Redo')
+        self.assertEqual(self.text(), 'one more\ntwo')
+
+    def test_new_edit_clears_redo(self):
+        self.load('abc')
+        self.move_to(3)
+        self.type('d')
+        self.history.undo()
+        self.assertEqual(len(self.history.redo_stack), 1)
+        self.type('e')
+        self.assertEqual(len(self.history.redo_stack), 0)
+        self.assertEqual(self.text(), 'abce')
+
+    def test_deleting_a_long_word_can_be_undone(self):
+        word = 'w' * 10000
+        self.load(word)
+        self.move_to(0)
+        self.type('hello ')
+        self.press('DeleteEndOfWord')
+        self.assertEqual(self.text(), 'hello ')
+        self.history.undo()
+        self.assertEqual(self.text(), 'hello ' + word)
+        self.history.undo()
+        self.assertEqual(self.text(), word)
+        self.history.redo()
+        self.history.redo()
+        self.assertEqual(self.text(), 'hello ')
+
+    def test_deleting_back_over_a_long_word_can_be_undone(self):
+        word = '\xa0' + 'w' * 10000
+        self.load('x ' + word)
+        self.move_to(2 + len(word))
+        self.press('DeleteStartOfWord')
+        self.history.undo()
+        self.assertEqual(self.text(), 'x ' + word)
+
+    def test_deleting_a_long_line_can_be_undone(self):
+        text = 'a ' * 8000 + '\nnext'
+        for name in ('DeleteEndOfLine', 'DeleteCompleteLine'):
+            with self.subTest(name):
+                self.load(text)
+                self.move_to(2)
+                self.press(name)
+                self.assertNotEqual(self.text(), text)
+                self.history.undo()
+                self.assertEqual(self.text(), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+"""Atomic saves replace the file a path names, keeping its mode."""
+import os
+import tempfile
+import unittest
+
+from metapad_core import write_atomically
+
+
+class WriteAtomicallyTest(unittest.TestCase):
+    def test_symlink_is_written_through(self):
+        with tempfile.TemporaryDirectory() as folder:
+            real = os.path.join(folder, 'real.txt')
+            link = os.path.join(folder, 'link.txt')
+            with open(real, 'w') as f:
+                f.write('old')
+            os.chmod(real, 0o640)
+            os.symlink('real.txt', link)
+            write_atomically(link, [b'new'])
+            self.assertTrue(os.path.islink(link))
+            with open(real) as f:
+                self.assertEqual(f.read(), 'new')
+            self.assertEqual(os.stat(real).st_mode & 0o777, 0o640)
+            self.assertEqual(sorted(os.listdir(folder)), ['link.txt', 'real.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()